@@ -0,0 +1,90 @@
+# DM送信のベンチマーク
+
+# ゲーム開始時のDM送信について
+# 逐次送信と並列送信 (fanout.fan_out) の所要時間を比較する
+# Member.sendはasyncio.sleepで遅延を再現したスタブに置き換える
+
+# 実行方法
+# python benchmarks/bench_dm_fanout.py [--latency 0.08] [--concurrency 8]
+
+import argparse
+import asyncio
+import sys
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fanout import fan_out, DEFAULT_CONCURRENCY
+
+
+class StubMember:
+    """
+    Member.sendだけを持つスタブ
+
+    Attributes
+    ----------
+    id : int
+    latency : float
+        送信にかかる秒数
+    forbidden : bool
+        True: DMを拒否している
+    """
+
+    def __init__(self, id: int, latency: float, forbidden: bool = False):
+        self.id = id
+        self.latency = latency
+        self.forbidden = forbidden
+
+    async def send(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        if self.forbidden:
+            raise PermissionError("Cannot send messages to this user")
+
+
+def make_members(number_of_players: int, latency: float) -> list[StubMember]:
+    # 最後のプレイヤーだけDMを拒否している
+    return [
+        StubMember(i, latency, forbidden=(i == number_of_players - 1))
+        for i in range(number_of_players)
+    ]
+
+
+async def send_sequential(members: list[StubMember]) -> float:
+    start = perf_counter()
+    for member in members:
+        try:
+            await member.send(embed=None)
+        except PermissionError:
+            pass
+    return perf_counter() - start
+
+
+async def send_fan_out(members: list[StubMember], concurrency: int) -> float:
+    start = perf_counter()
+    jobs = {member.id: partial(member.send, embed=None) for member in members}
+    result = await fan_out(jobs, concurrency)
+    assert len(result.get_failed()) == 1
+    return perf_counter() - start
+
+
+async def main(latency: float, concurrency: int):
+    print(f"latency={latency * 1000:.0f}ms concurrency={concurrency}")
+    print(f"{'players':>7} {'sequential':>12} {'fan_out':>12} {'speedup':>8}")
+    for number_of_players in (2, 10, 50):
+        members = make_members(number_of_players, latency)
+        sequential = await send_sequential(members)
+        parallel = await send_fan_out(members, concurrency)
+        print(
+            f"{number_of_players:>7} {sequential * 1000:>10.1f}ms"
+            f" {parallel * 1000:>10.1f}ms {sequential / parallel:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DM fan-out benchmark")
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.concurrency))
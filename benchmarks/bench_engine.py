@@ -0,0 +1,130 @@
+# ゲーム状態のベンチマーク
+
+# 手札と場札をdictで持っていた旧実装と、
+# bitsetで持つ現在の実装 (engine.Player / engine.Game) の所要時間を比較する
+# 全員が正しい順番でカードを出し切るまでの1ゲームを計測する
+
+# 実行方法
+# python benchmarks/bench_engine.py [--level 3] [--repeat 20]
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from engine import Game, Player
+
+
+# ----------
+# 旧実装 (dict)
+# ----------
+
+
+class LegacyPlayer:
+    def __init__(self):
+        self.hand: dict[int, bool] = dict()
+
+    def get_cards_in_hand(self) -> list[int]:
+        return [card for card in self.hand if self.hand[card] == True]
+
+    def put_card(self) -> int | None:
+        try:
+            hand_min = min(self.get_cards_in_hand())
+            self.hand[hand_min] = False
+            return hand_min
+        except ValueError:
+            return None
+
+    def has_smaller_card(self, card_put: int) -> bool:
+        try:
+            return not card_put < min(self.get_cards_in_hand())
+        except ValueError:
+            return False
+
+
+class LegacyDeck:
+    def __init__(self):
+        self.deck: dict[int, bool] = dict()
+
+    def is_minimun(self, card_put: int) -> bool:
+        return card_put == min(c for c in self.deck if self.deck[c] == False)
+
+    def is_cleared(self) -> bool:
+        return list(self.deck.values()).count(False) == 0
+
+
+# ----------
+# 計測
+# ----------
+
+
+def deal(number_of_players: int, level: int) -> Game:
+    game = Game()
+    game.set_level(level)
+    game.set_card_range(1, number_of_players * level * 10)
+    for i in range(number_of_players):
+        game.add_player(i, f"player{i}")
+    game.deal_cards()
+    return game
+
+
+def play_legacy(game: Game) -> float:
+    hands = [player.get_cards_in_hand() for player in game.get_players().values()]
+    players = [LegacyPlayer() for _ in hands]
+    deck = LegacyDeck()
+    for player, hand in zip(players, hands):
+        for card in hand:
+            player.hand[card] = True
+            deck.deck[card] = False
+
+    order = sorted((card, i) for i, hand in enumerate(hands) for card in hand)
+    start = perf_counter()
+    for _, i in order:
+        card_put = players[i].put_card()
+        deck.is_minimun(card_put)
+        deck.deck[card_put] = True
+        for player in players:
+            player.has_smaller_card(card_put)
+        deck.is_cleared()
+    return perf_counter() - start
+
+
+def play_current(game: Game) -> float:
+    players: list[Player] = list(game.get_players().values())
+    hands = [player.get_cards_in_hand() for player in players]
+
+    order = sorted((card, i) for i, hand in enumerate(hands) for card in hand)
+    start = perf_counter()
+    for _, i in order:
+        card_put = players[i].put_card()
+        game.is_minimun(card_put)
+        game.receive_card(card_put)
+        for player in players:
+            player.has_smaller_card(card_put)
+        game.is_cleared()
+    return perf_counter() - start
+
+
+def main(level: int, repeat: int):
+    print(f"level={level} repeat={repeat}")
+    print(f"{'players':>7} {'dict':>10} {'bitset':>10} {'speedup':>8}")
+    for number_of_players in (2, 10, 50, 100):
+        legacy = current = 0.0
+        for _ in range(repeat):
+            game = deal(number_of_players, level)
+            legacy += play_legacy(game)
+            current += play_current(game)
+        print(
+            f"{number_of_players:>7} {legacy / repeat * 1000:>8.2f}ms"
+            f" {current / repeat * 1000:>8.2f}ms {legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Game state benchmark")
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.level, args.repeat)
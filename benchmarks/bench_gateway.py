@@ -0,0 +1,285 @@
+# ゲートウェイのベンチマーク
+
+# 通常モードとスラッシュ専用モード (gateway_config) で、
+# 大きなサーバーのゲートウェイのイベントを受信したときの処理量とメモリを比較する
+# Discordに接続せず、作成したイベントをdiscord.pyの解析処理に直接渡す
+# Discordは選択したIntentsに含まれないイベントを送らないため、
+# 各モードのIntentsで受信するイベントだけを渡す
+
+# 計測する値
+#   delivered  : 受信したイベントの数 / 送られたイベントの数
+#   events/s   : --rateのイベントが発生しているときに受信するイベントの数 (1秒あたり)
+#   us/event   : 1イベントあたりの処理時間 (解析・キャッシュ・on_messageのコマンドの解析)
+#   cpu        : --rateのときにイベントの処理に使うCPUの割合
+#   rss        : イベントを処理した後の常駐メモリ (MB)
+#   growth     : イベントの処理で増えた常駐メモリ (キャッシュなど、MB)
+# モードごとに別のプロセスで計測する
+
+# 実行方法
+# python benchmarks/bench_gateway.py [--events 50000] [--guilds 20] [--rate 200]
+
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from discord.ext import commands
+import gateway_config
+import metrics
+
+
+# 送られるイベントの割合
+EVENT_MIX = {
+    "MESSAGE_CREATE": 60,
+    "TYPING_START": 25,
+    "MESSAGE_REACTION_ADD": 10,
+    "MESSAGE_UPDATE": 5,
+}
+
+# イベントを受信するために必要なIntents
+REQUIRED_INTENTS = {
+    "MESSAGE_CREATE": "guild_messages",
+    "TYPING_START": "guild_typing",
+    "MESSAGE_REACTION_ADD": "guild_reactions",
+    "MESSAGE_UPDATE": "guild_messages",
+}
+
+# イベントを渡した後に、溜まったイベントのタスクを実行する間隔
+DRAIN_EVERY = 100
+
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+# ----------
+# イベントの作成
+# ----------
+
+
+def guild_payload(guild_id: int) -> dict:
+    return {
+        "id": str(guild_id),
+        "name": f"guild{guild_id}",
+        "unavailable": False,
+        "member_count": 10000,
+        "owner_id": "1",
+        "roles": [
+            {
+                "id": str(guild_id),
+                "name": "@everyone",
+                "permissions": "0",
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [
+            {
+                "id": str(guild_id * 100 + i),
+                "type": 0,
+                "name": f"channel{i}",
+                "position": i,
+                "permission_overwrites": [],
+            }
+            for i in range(10)
+        ],
+        "members": [],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "voice_states": [],
+        "presences": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+    }
+
+
+def user_payload(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "global_name": f"User {user_id}",
+        "avatar": None,
+    }
+
+
+def member_payload(user_id: int) -> dict:
+    return {
+        "user": user_payload(user_id),
+        "roles": [],
+        "joined_at": TIMESTAMP,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def message_payload(message_id: int, guild_id: int, channel_id: int, user_id: int):
+    member = member_payload(user_id)
+    del member["user"]
+    return {
+        "id": str(message_id),
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "author": user_payload(user_id),
+        "member": member,
+        "content": "ふつうの会話のメッセージです " * 4,
+        "timestamp": TIMESTAMP,
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def make_events(count: int, guilds: int, seed: int) -> list[tuple[str, dict]]:
+    """
+    送られるイベントを作成する
+    """
+    rng = random.Random(seed)
+    names = list(EVENT_MIX)
+    weights = list(EVENT_MIX.values())
+    events: list[tuple[str, dict]] = list()
+    message_id = 1 << 40
+    for name in rng.choices(names, weights, k=count):
+        guild_id = rng.randrange(guilds) + 1
+        channel_id = guild_id * 100 + rng.randrange(10)
+        user_id = (1 << 32) + rng.randrange(10000)
+        if name == "MESSAGE_CREATE":
+            message_id += 1
+            data = message_payload(message_id, guild_id, channel_id, user_id)
+        elif name == "MESSAGE_UPDATE":
+            data = message_payload(message_id, guild_id, channel_id, user_id)
+            data["content"] = "編集しました"
+            data["edited_timestamp"] = TIMESTAMP
+        elif name == "TYPING_START":
+            data = {
+                "channel_id": str(channel_id),
+                "guild_id": str(guild_id),
+                "user_id": str(user_id),
+                "timestamp": 1704067200,
+                "member": member_payload(user_id),
+            }
+        else:
+            data = {
+                "user_id": str(user_id),
+                "channel_id": str(channel_id),
+                "message_id": str(message_id),
+                "guild_id": str(guild_id),
+                "emoji": {"id": None, "name": "👍"},
+                "type": 0,
+                "burst": False,
+                "member": member_payload(user_id),
+            }
+        events.append((name, data))
+    return events
+
+
+# ----------
+# 計測
+# ----------
+
+
+async def replay(slash_only: bool, args: argparse.Namespace) -> dict:
+    """
+    1つのモードでイベントを処理する
+    """
+    bot = commands.Bot(**gateway_config.bot_options(slash_only))
+    # ログインせずにイベントを処理できるようにする
+    await bot._async_setup_hook()
+    state = bot._connection
+    for guild_id in range(1, args.guilds + 1):
+        state.parsers["GUILD_CREATE"](guild_payload(guild_id))
+
+    intents = bot.intents
+    events = make_events(args.events, args.guilds, args.seed)
+    delivered = [
+        (state.parsers[name], data)
+        for name, data in events
+        if getattr(intents, REQUIRED_INTENTS[name])
+    ]
+
+    rss = metrics.rss_bytes()
+    start = perf_counter()
+    for index, (parse, data) in enumerate(delivered, 1):
+        parse(data)
+        if index % DRAIN_EVERY == 0:
+            # on_messageなどのイベントのタスクを実行する
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    elapsed = perf_counter() - start
+    growth = metrics.rss_bytes() - rss
+
+    ratio = len(delivered) / len(events)
+    per_event = elapsed / len(delivered) if delivered else 0.0
+    await bot.close()
+    return {
+        "intents": intents.value,
+        "delivered": ratio,
+        "events_per_second": args.rate * ratio,
+        "us_per_event": per_event * 1e6,
+        "cpu": args.rate * ratio * per_event,
+        "rss_mb": metrics.rss_bytes() / 2**20,
+        "growth_mb": growth / 2**20,
+    }
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    """
+    別のプロセスで1つのモードを計測する
+    """
+    command = [sys.executable, __file__, "--mode", mode]
+    command += ["--events", str(args.events), "--guilds", str(args.guilds)]
+    command += ["--rate", str(args.rate), "--seed", str(args.seed)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout)
+
+
+def main(args: argparse.Namespace):
+    if args.mode is not None:
+        result = asyncio.run(replay(args.mode == "slash", args))
+        print(json.dumps(result))
+        return
+
+    results = {mode: run_mode(mode, args) for mode in ("default", "slash")}
+    print(f"events={args.events} guilds={args.guilds} rate={args.rate}/s")
+    print(
+        f"{'mode':<8} {'delivered':>9} {'events/s':>9} {'us/event':>9}"
+        f" {'cpu':>7} {'rss':>8} {'growth':>8}"
+    )
+    for mode, result in results.items():
+        print(
+            f"{mode:<8} {result['delivered'] * 100:>8.1f}%"
+            f" {result['events_per_second']:>9.1f}"
+            f" {result['us_per_event']:>9.1f}"
+            f" {result['cpu'] * 100:>6.2f}%"
+            f" {result['rss_mb']:>6.1f}MB"
+            f" {result['growth_mb']:>6.1f}MB"
+        )
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gateway load per intents mode")
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=200, help="イベント/秒")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("default", "slash"), help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true")
+    main(parser.parse_args())
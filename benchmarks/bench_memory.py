@@ -0,0 +1,122 @@
+# メモリのベンチマーク
+
+# ゲーム中のセッションを指定した数だけ作成し、1セッションあたりのメモリ使用量を計測する
+# セッションは/entry・/startの後と同じ状態 (プレイヤー登録・カード配布・盤面の表示) にする
+# discord.Member / TextChannelは必要な属性だけを持つスタブを使い、
+# セッションを作成した後は参照を残さない (ゲームがIDと名前だけを持つことを確認する)
+
+# 計測する値
+#   bytes/session   : tracemalloc で計測した確保済みメモリ / セッション数
+#   bytes/player    : bytes/session / 1セッションの人数
+#   objects/session : GCが追跡しているオブジェクトの増加数 / セッション数
+
+# 実行方法
+# python benchmarks/bench_memory.py [--sessions 10 100 10000] [--players 4] [--level 3]
+
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from discord import Colour
+from session import SessionManager
+
+
+class StubGuild:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class StubChannel:
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"channel{id}"
+
+
+class StubMember:
+    """
+    discord.Memberのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"player{id}"
+
+
+def populate(manager: SessionManager, sessions: int, players: int, level: int):
+    """
+    ゲーム中のセッションを作成する
+    """
+    for index in range(sessions):
+        guild, channel = StubGuild(index + 1), StubChannel(index + 1)
+        session = manager.get_or_create(guild.id, channel.id)
+        ito = session.get_ito()
+        ito.set_guild(guild)
+        ito.set_channel(channel)
+        ito.set_level(level)
+        for i in range(players):
+            member = StubMember(index * players + i)
+            ito.regist_player(member)
+            manager.bind_member(member.id, session.get_key())
+        ito.deal_cards()
+        ito.start_game()
+        session.get_renderer().board("Game start!!!", "ゲーム情報", Colour.dark_blue())
+
+
+def measure(sessions: int, players: int, level: int) -> dict[str, float]:
+    """
+    セッションを作成する前後のメモリ使用量の差を計測する
+
+    Returns
+    -------
+    result: dict
+        bytes_per_session, bytes_per_player, objects_per_session
+    """
+    manager = SessionManager(max_sessions=sessions)
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        populate(manager, sessions, players, level)
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects
+
+    assert len(manager) == sessions
+    return {
+        "bytes_per_session": round(allocated / sessions, 1),
+        "bytes_per_player": round(allocated / sessions / players, 1),
+        "objects_per_session": round(objects / sessions, 1),
+    }
+
+
+def main(args: argparse.Namespace):
+    print(f"players={args.players} level={args.level}")
+    print(f"{'sessions':>9} {'bytes/session':>14} {'bytes/player':>13} {'objects':>8}")
+    results = dict()
+    for sessions in args.sessions:
+        result = measure(sessions, args.players, args.level)
+        results[sessions] = result
+        print(
+            f"{sessions:>9} {result['bytes_per_session']:>14.0f}"
+            f" {result['bytes_per_player']:>13.0f}"
+            f" {result['objects_per_session']:>8.1f}"
+        )
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per session")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 100, 10000])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--level", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+# 保存のベンチマーク
+
+# 複数のチャンネルでゲームを進めたときの1コマンドあたりの所要時間を
+# 保存なし (NullStore) / write-behind (SqliteStore) / コマンドごとに書き込む場合で比較する
+# コマンドの処理はカードを1枚出してmark_dirty()を呼ぶところまで
+# write-behindでは書き込みタスクが裏で動いている状態で計測する
+
+# 実行方法
+# python benchmarks/bench_persistence.py [--sessions 100] [--interval 0.05]
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loguru import logger
+
+from ito import Ito
+from session import Session
+from store import NullStore, SqliteStore
+
+
+class FakeMember:
+    """
+    discord.Memberの代わり
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"player{id}"
+
+
+def deal(key: tuple[int, int], number_of_players: int, level: int) -> Session:
+    ito = Ito()
+    ito.set_level(level)
+    for i in range(number_of_players):
+        ito.regist_player(FakeMember(key[1] * 1000 + i))
+    ito.deal_cards()
+    ito.start_game()
+    return Session(key, ito)
+
+
+async def play(store, sessions: list[Session], write_through: bool) -> list[float]:
+    """
+    各セッションで順番にカードを出し、1コマンドごとの所要時間を返す
+    """
+    orders = [
+        sorted(
+            (card, player)
+            for player in session.get_ito().get_players().values()
+            for card in player.get_cards_in_hand()
+        )
+        for session in sessions
+    ]
+
+    latencies: list[float] = list()
+    for turn in range(max(len(order) for order in orders)):
+        for session, order in zip(sessions, orders):
+            if turn >= len(order):
+                continue
+            _, player = order[turn]
+            start = perf_counter()
+            ito = session.get_ito()
+            ito.resolve_put(player.put_card())
+            store.mark_dirty(session)
+            if write_through:
+                await store.flush()
+            latencies.append(perf_counter() - start)
+            # 他のコマンドや書き込みタスクに処理を譲る
+            await asyncio.sleep(0)
+    return latencies
+
+
+async def run(mode: str, args) -> list[float]:
+    sessions = [
+        deal((1, channel_id), args.players, args.level)
+        for channel_id in range(args.sessions)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        if mode == "none":
+            store = NullStore()
+        else:
+            store = SqliteStore(str(Path(directory) / "bench.sqlite3"), args.interval)
+        store.open()
+        if mode == "write-behind":
+            store.start()
+        latencies = await play(store, sessions, mode == "write-through")
+        await store.close()
+    return latencies
+
+
+def main(args):
+    logger.remove()
+    print(
+        f"sessions={args.sessions} players={args.players} level={args.level}"
+        f" interval={args.interval}s"
+    )
+    print(f"{'store':>13} {'mean':>10} {'p99':>10} {'total':>10}")
+    for mode in ("none", "write-behind", "write-through"):
+        latencies = asyncio.run(run(mode, args))
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(
+            f"{mode:>13} {statistics.mean(latencies) * 1e6:>8.1f}us"
+            f" {p99 * 1e6:>8.1f}us {sum(latencies) * 1000:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistence benchmark")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=0.05)
+    main(parser.parse_args())
@@ -0,0 +1,538 @@
+# マイクロベンチマーク
+
+# ゲームの処理と表示の処理 (/putのEmbedの作成) の所要時間を
+# 人数・レベルごとに計測し、保存したベースラインと比較する
+# discord.Member / commands.Contextは必要な属性だけを持つスタブに置き換える
+
+# 計測する処理
+#   put_card         : Player.put_card
+#   has_smaller_card : Player.has_smaller_card
+#   deal_cards       : Ito.deal_cards
+#   is_minimun       : Ito.is_minimun
+#   is_cleared       : Ito.is_cleared
+#   board            : Renderer.board (Itoの状態が変わった直後のEmbedの作成)
+#   put_command      : MyCog.put (実行条件の判定からEmbedの作成・送信まで)
+# 結果は1回あたりの所要時間 (ns) で、繰り返した中の最小値を使う
+# 手札は固定したシードで配り、計測ごとに同じ手札で計測する
+
+# ノイズへの対策
+#   マシンの速さの変化 : 各項目の計測の合間に基準の処理 (reference) も計測し、
+#                        基準の処理との比でベースラインと比較する
+#                        (同じマシンでもプロセス・時間帯によって2倍近く変わるため)
+#   計測ごとのばらつき : 繰り返した結果のばらつき (下位25%の値と最小値の差の割合、
+#                        上限MAX_NOISE) を劣化とみなす割合に足す
+#   小さい処理の誤差   : 差がMIN_DELTA_NS未満の場合は劣化とみなさない
+#   一時的な遅れ       : 劣化した項目だけ計測し直し、速い方の結果を使う
+
+# 実行方法
+# python benchmarks/bench_suite.py                   計測してベースラインと比較する
+# python benchmarks/bench_suite.py --save-baseline   計測結果をベースラインとして保存する
+# python benchmarks/bench_suite.py --only put_card --threshold 0.2
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from discord import Colour
+from loguru import logger
+from ito import Ito
+from render import Renderer
+import cog
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# ベースラインのパス
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+
+# 計測結果のパス
+DEFAULT_OUTPUT = BENCH_DIR / "results.json"
+
+# 計測する人数とレベル (カードの範囲 (1～100) に収まる組み合わせ)
+PLAYERS = (2, 10, 30)
+LEVELS = (1, 3)
+
+# この割合より遅くなった場合は劣化とみなす
+DEFAULT_THRESHOLD = 0.25
+
+# 劣化とみなす割合に足すばらつきの上限
+MAX_NOISE = 0.25
+
+# この差 (ns) より小さい場合は劣化とみなさない
+MIN_DELTA_NS = 25.0
+
+# 劣化した項目を計測し直す回数
+CONFIRM = 2
+
+# 手札を配るときのシード
+SEED = 20240101
+
+
+# ----------
+# スタブ
+# ----------
+
+
+class StubGuild:
+    def __init__(self, id: int):
+        self.id = id
+        self.members: dict[int, "StubMember"] = dict()
+
+    def get_member(self, id: int) -> "StubMember | None":
+        return self.members.get(id)
+
+
+class StubChannel:
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"channel{id}"
+
+
+class StubMember:
+    """
+    discord.Memberのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"player{id}"
+        self.display_name = self.name
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, **kwargs):
+        pass
+
+
+class StubContext:
+    """
+    commands.Contextのスタブ
+    """
+
+    def __init__(self, author: StubMember, guild: StubGuild, channel: StubChannel):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.interaction = None
+
+    async def send(self, **kwargs):
+        pass
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class StubBot:
+    shard_count = None
+
+
+# ----------
+# 準備
+# ----------
+
+
+def deal(number_of_players: int, level: int) -> Ito:
+    ito = Ito()
+    ito.set_level(level)
+    ito.set_seed(SEED)
+    for i in range(number_of_players):
+        ito.regist_player(StubMember(i))
+    ito.deal_cards()
+    return ito
+
+
+def play_order(ito: Ito) -> list[tuple[int, int]]:
+    """
+    失敗しない順番 (カード, プレイヤーID) のリストを作成する
+    """
+    return sorted(
+        (card, player.get_id())
+        for player in ito.get_players().values()
+        for card in player.get_cards_in_hand()
+    )
+
+
+# ----------
+# 計測
+# ----------
+# 各関数は計測する処理をnumber回繰り返し、(所要時間 (ns), 実行回数) を返す
+
+
+def loop(func: Callable[[], None], number: int) -> int:
+    """
+    関数をnumber回実行した所要時間 (ns) を計測する
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = perf_counter_ns()
+        for _ in range(number):
+            func()
+        return perf_counter_ns() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def bench_put_card(number_of_players: int, level: int, number: int):
+    players = list(deal(number_of_players, level).get_players().values())
+    hands = [
+        (int(dealt, 16), int(hand, 16))
+        for *_, dealt, hand in (player.to_snapshot() for player in players)
+    ]
+
+    # 手札を配った直後に戻してから全員が出し切る
+    def func():
+        for player, (dealt, hand) in zip(players, hands):
+            player.restore_hand(dealt, hand)
+            for _ in range(level):
+                player.put_card()
+
+    return loop(func, number), number * number_of_players * level
+
+
+def bench_has_smaller_card(number_of_players: int, level: int, number: int):
+    ito = deal(number_of_players, level)
+    players = list(ito.get_players().values())
+    cards = [card for card, _ in play_order(ito)]
+
+    def func():
+        for card in cards:
+            for player in players:
+                player.has_smaller_card(card)
+
+    return loop(func, number), number * len(cards) * number_of_players
+
+
+def bench_deal_cards(number_of_players: int, level: int, number: int):
+    ito = deal(number_of_players, level)
+
+    def func():
+        ito.initialize_game()
+        ito.deal_cards()
+
+    return loop(func, number), number
+
+
+def bench_is_minimun(number_of_players: int, level: int, number: int):
+    ito = deal(number_of_players, level)
+    cards = [card for card, _ in play_order(ito)]
+
+    def func():
+        for card in cards:
+            ito.is_minimun(card)
+
+    return loop(func, number), number * len(cards)
+
+
+def bench_is_cleared(number_of_players: int, level: int, number: int):
+    ito = deal(number_of_players, level)
+    # 半分のカードを場に出した状態で計測する
+    order = play_order(ito)
+    for card, _ in order[: len(order) // 2]:
+        ito.receive_card(card)
+    return loop(ito.is_cleared, number), number
+
+
+def bench_board(number_of_players: int, level: int, number: int):
+    ito = deal(number_of_players, level)
+    ito.set_guild(StubGuild(1))
+    ito.set_channel(StubChannel(10))
+    renderer = Renderer(ito)
+
+    # /putの後と同じく、状態が変わった直後にEmbedを作成する
+    def func():
+        ito.bump_version()
+        renderer.board("Success", "成功しました！", Colour.green())
+
+    return loop(func, number), number
+
+
+def bench_put_command(number_of_players: int, level: int, number: int):
+    async def play() -> tuple[int, int]:
+        my_cog = cog.MyCog(StubBot())
+        guild, channel = StubGuild(1), StubChannel(10)
+        contexts = {
+            i: StubContext(StubMember(i), guild, channel)
+            for i in range(number_of_players)
+        }
+        for ctx in contexts.values():
+            guild.members[ctx.author.id] = ctx.author
+            await my_cog.entry.callback(my_cog, ctx)
+        await my_cog.set_level.callback(my_cog, contexts[0], level=level)
+        await my_cog.set_seed.callback(my_cog, contexts[0], seed=SEED)
+        await my_cog.start.callback(my_cog, contexts[0])
+
+        # ゲームが終わるまで失敗しない順番でカードを出す
+        ito = my_cog.sessions.get(guild.id, channel.id).get_ito()
+        order = play_order(ito)
+        start = perf_counter_ns()
+        for _, player_id in order:
+            await my_cog.put.callback(my_cog, contexts[player_id])
+        return perf_counter_ns() - start, len(order)
+
+    # 1ゲームで実行できる回数は人数 x レベルのため、ゲームを繰り返す
+    elapsed = count = 0
+    while count < number:
+        game_elapsed, game_count = asyncio.run(play())
+        elapsed += game_elapsed
+        count += game_count
+    return elapsed, count
+
+
+BENCHMARKS: dict[str, Callable[[int, int, int], tuple[int, int]]] = {
+    "put_card": bench_put_card,
+    "has_smaller_card": bench_has_smaller_card,
+    "deal_cards": bench_deal_cards,
+    "is_minimun": bench_is_minimun,
+    "is_cleared": bench_is_cleared,
+    "board": bench_board,
+    "put_command": bench_put_command,
+}
+
+# 1回の計測で繰り返す回数
+# (1回が1μs未満の処理は、タイマーとループの誤差が小さくなるように多く繰り返す)
+NUMBERS: dict[str, int] = {
+    "put_card": 2000,
+    "has_smaller_card": 2000,
+    "deal_cards": 200,
+    "is_minimun": 10000,
+    "is_cleared": 100000,
+    "board": 200,
+    "put_command": 200,
+}
+
+
+class Reference:
+    """
+    マシンの速さの基準にする処理
+    エンジンと同じく、属性の更新・ビット演算・dictの更新を行う
+    """
+
+    __slots__ = ("mask", "table")
+
+    def __init__(self):
+        self.mask = 0
+        self.table = dict()
+
+    def step(self, value: int) -> int:
+        self.mask ^= 1 << value
+        self.table[value] = self.mask
+        return self.mask & -self.mask
+
+    def run(self):
+        for value in range(50):
+            self.step(value)
+
+
+# 基準の処理を1回の計測で繰り返す回数
+REFERENCE_NUMBER = 200
+
+
+def key_of(name: str, number_of_players: int, level: int) -> str:
+    return f"{name}[p={number_of_players},l={level}]"
+
+
+def measure(
+    name: str, number_of_players: int, level: int, repeat: int
+) -> tuple[float, float, float]:
+    """
+    ベンチマークと基準の処理を交互に繰り返し実行し、
+    それぞれの1回あたりの所要時間の最小値を求める
+
+    Returns
+    -------
+    ns: float
+        1回あたりの所要時間 (ns)
+    reference: float
+        基準の処理の1回あたりの所要時間 (ns)
+    noise: float
+        基準の処理との比のばらつき (下位25%の値 / 最小値 - 1、上限MAX_NOISE)
+    """
+    times: list[float] = list()
+    references: list[float] = list()
+    for _ in range(repeat):
+        ns = loop(Reference().run, REFERENCE_NUMBER) / REFERENCE_NUMBER
+        references.append(ns)
+        elapsed, count = BENCHMARKS[name](number_of_players, level, NUMBERS[name])
+        times.append(elapsed / count)
+    ratios = [ns / reference for ns, reference in zip(times, references)]
+    noise = min(statistics.quantiles(ratios, n=4)[0] / min(ratios) - 1, MAX_NOISE)
+    return round(min(times), 1), round(min(references), 1), round(noise, 3)
+
+
+def run(names: list[str], repeat: int) -> dict[str, list[float]]:
+    """
+    ベンチマークを実行する
+
+    Returns
+    -------
+    results: dict
+        キー : "処理名[p=人数,l=レベル]"
+        値 : [1回あたりの所要時間 (ns), 基準の処理の所要時間 (ns), ばらつき]
+    """
+    results: dict[str, list[float]] = dict()
+    for name in names:
+        for number_of_players in PLAYERS:
+            for level in LEVELS:
+                key = key_of(name, number_of_players, level)
+                results[key] = list(measure(name, number_of_players, level, repeat))
+                print(f"  {key:<32} {results[key][0]:>12.0f}ns")
+    return results
+
+
+# ----------
+# 比較
+# ----------
+
+
+def scale(result: list[float], baseline: list[float]) -> float:
+    """
+    ベースラインの所要時間を今回のマシンの速さに合わせる
+
+    Parameters
+    ----------
+    result: list[float]
+        今回の [所要時間, 基準の処理の所要時間, ばらつき]
+    baseline: list[float]
+        ベースラインの [所要時間, 基準の処理の所要時間, ばらつき]
+
+    Returns
+    -------
+    ns: float
+        今回の速さに換算したベースラインの所要時間 (ns)
+    """
+    return baseline[0] * result[1] / baseline[1]
+
+
+def is_regression(result: list[float], baseline: list[float], threshold: float) -> bool:
+    """
+    割合と差の両方が大きい場合に劣化とみなす
+    割合は今回とベースラインのばらつきの分だけ大きくする
+    """
+    current, expected = result[0], scale(result, baseline)
+    threshold += result[2] + baseline[2]
+    return threshold < current / expected - 1 and MIN_DELTA_NS < current - expected
+
+
+def confirm(
+    results: dict[str, list[float]],
+    baseline: dict[str, list[float]],
+    threshold: float,
+    repeat: int,
+):
+    """
+    劣化した項目だけを計測し直し、基準の処理との比が小さい方の結果を使う
+    """
+    for _ in range(CONFIRM):
+        keys = [
+            key
+            for key, result in results.items()
+            if key in baseline and is_regression(result, baseline[key], threshold)
+        ]
+        if not keys:
+            return
+        print(f"Confirming {len(keys)} regression(s)")
+        for key in keys:
+            name, params = key[:-1].split("[")
+            number_of_players, level = (int(param[2:]) for param in params.split(","))
+            result = list(measure(name, number_of_players, level, repeat))
+            if result[0] / result[1] < results[key][0] / results[key][1]:
+                results[key] = result
+
+
+def compare(
+    results: dict[str, list[float]],
+    baseline: dict[str, list[float]],
+    threshold: float,
+) -> list[str]:
+    """
+    ベースラインと比較したレポートを出力する
+    ベースラインは今回のマシンの速さに換算して表示する
+
+    Returns
+    -------
+    regressions: list[str]
+        劣化した項目
+    """
+    regressions: list[str] = list()
+    print(f"{'benchmark':<32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key, result in results.items():
+        current = result[0]
+        if key not in baseline:
+            print(f"{key:<32} {'-':>12} {current:>10.0f}ns {'new':>8}")
+            continue
+        expected = scale(result, baseline[key])
+        change = current / expected - 1
+        status = ""
+        if is_regression(result, baseline[key], threshold):
+            status = "  REGRESSION"
+            regressions.append(key)
+        elif change < -threshold:
+            status = "  improved"
+        print(
+            f"{key:<32} {expected:>10.0f}ns {current:>10.0f}ns"
+            f" {change * 100:>+7.1f}%{status}"
+        )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    # コマンドのログは計測しない
+    logger.remove()
+
+    names = args.only or list(BENCHMARKS)
+    print(f"repeat={args.repeat}")
+    results = run(names, args.repeat)
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    output = args.baseline if args.save_baseline else args.output
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Saved: {output}")
+    if args.save_baseline:
+        return 0
+
+    if not args.baseline.exists():
+        print(f"Baseline not found: {args.baseline}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())["results"]
+    confirm(results, baseline, args.threshold, args.repeat)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print()
+    regressions = compare(results, baseline, args.threshold)
+    print()
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold * 100:.0f}%")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Engine and rendering benchmarks")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--save-baseline", action="store_true")
+    sys.exit(main(parser.parse_args()))
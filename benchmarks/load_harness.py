@@ -0,0 +1,554 @@
+# 負荷試験
+
+# Discordに接続せずに、複数のサーバーで同時にゲームを進めたときの
+# コマンドの応答時間・メッセージの送信数・イベントループの遅延を計測する
+# ゲートウェイとHTTPはFakeDiscordで置き換える
+#   ゲートウェイ : コマンドはgateway_delay秒後に届き、1コマンドずつ別のタスクで実行する
+#                  (discord.pyと同じ)
+#   HTTP         : メッセージの送信はdelay±jitter秒かかる
+#                  送信先ごとにwindow秒間にlimit件を超えると429を返し、
+#                  discord.pyと同じくretry_after秒待ってから送り直す
+#                  ratelimit_rateの確率で、上限に関係なく429を返す
+# コマンドはMyCogのコールバックを直接呼び出す (引数の解析とチェックは行わない)
+# --live-boardの場合は/putの結果を盤面のメッセージの編集で表示する (cog.LIVE_BOARD)
+# --slashの場合はコマンドをスラッシュコマンドとして実行し、最初に応答するまでの時間 (ack) も記録する
+#   インタラクションへの応答とフォローアップはチャンネルのレート制限を受けない
+#   --fast-ackの場合はすぐに応答してから結果をフォローアップで送信する (cog.FAST_ACK)
+
+# 各サーバーのシナリオ
+#   1. 全員が/entry
+#   2. /start → 失敗しない順番で全員が/put (rounds回繰り返す)
+#   3. /start → 半分のカードを/put → /stop
+
+# 実行方法
+# python benchmarks/load_harness.py [--guilds 50] [--players 4] [--rounds 2]
+#     [--delay 0.05] [--channel-limit 5] [--window 5] [--ratelimit-rate 0.01]
+#     [--live-board] [--board-delay 1.0] [--slash] [--fast-ack]
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+from collections import defaultdict
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from loguru import logger
+import cog
+import metrics
+
+
+# Discordがインタラクションの応答を待つ時間 (秒)
+ACK_DEADLINE = 3.0
+
+
+class FakeDiscord:
+    """
+    ゲートウェイとHTTPの代わり
+
+    Attributes
+    ----------
+    __delay : float
+        HTTPの遅延 (秒)
+    __jitter : float
+        HTTPの遅延のばらつき (秒)
+    __gateway_delay : float
+        コマンドが届くまでの遅延 (秒)
+    __limit : int
+        送信先ごとにwindow秒間に送信できるメッセージの数
+    __window : float
+        レート制限の期間 (秒)
+    __ratelimit_rate : float
+        上限に関係なく429を返す確率
+    __retry_after : float
+        ratelimit_rateで429を返したときに待つ時間 (秒)
+    __random : random.Random
+    __buckets : dict
+        キー : 送信先
+        値 : [期間の終了時刻, 期間内に送信した数]
+    __sent : int
+        送信したメッセージの数
+    __rate_limited : int
+        429を返した回数
+    __tasks : set
+        実行中のコマンドのタスク
+    __message_ids : itertools.count
+        送信したメッセージに付けるID
+    """
+
+    def __init__(
+        self,
+        delay: float,
+        jitter: float,
+        gateway_delay: float,
+        limit: int,
+        window: float,
+        ratelimit_rate: float,
+        retry_after: float,
+        seed: int | None,
+    ):
+        self.__delay: float = delay
+        self.__jitter: float = jitter
+        self.__gateway_delay: float = gateway_delay
+        self.__limit: int = limit
+        self.__window: float = window
+        self.__ratelimit_rate: float = ratelimit_rate
+        self.__retry_after: float = retry_after
+        self.__random: random.Random = random.Random(seed)
+        self.__buckets: dict[str, list[float]] = dict()
+        self.__sent: int = 0
+        self.__rate_limited: int = 0
+        self.__tasks: set[asyncio.Task] = set()
+        self.__message_ids: itertools.count = itertools.count(1)
+
+    def next_message_id(self) -> int:
+        return next(self.__message_ids)
+
+    def get_sent(self) -> int:
+        return self.__sent
+
+    def get_rate_limited(self) -> int:
+        return self.__rate_limited
+
+    async def request(self, route: str | None):
+        """
+        メッセージを送信する
+        429が返された場合は待ってから送り直す
+
+        Parameters
+        ----------
+        route: str | None
+            送信先 (レート制限の単位、Noneの場合はレート制限を受けない)
+        """
+        while True:
+            jitter = self.__random.uniform(-self.__jitter, self.__jitter)
+            await asyncio.sleep(max(0.0, self.__delay + jitter))
+            retry_after = None if route is None else self.__check(route)
+            if retry_after is None:
+                self.__sent += 1
+                return
+            self.__rate_limited += 1
+            await asyncio.sleep(retry_after)
+
+    def __check(self, route: str) -> float | None:
+        """
+        レート制限を判定する
+
+        Returns
+        -------
+        retry_after: float | None
+            429の場合は待つ時間 (秒)、送信できる場合はNone
+        """
+        if self.__random.random() < self.__ratelimit_rate:
+            return self.__retry_after
+
+        now = asyncio.get_running_loop().time()
+        bucket = self.__buckets.get(route)
+        if bucket is None or bucket[0] <= now:
+            bucket = [now + self.__window, 0]
+            self.__buckets[route] = bucket
+        if self.__limit <= bucket[1]:
+            return bucket[0] - now
+        bucket[1] += 1
+        return None
+
+    async def dispatch(self, handler, *args) -> asyncio.Task:
+        """
+        コマンドをゲートウェイから届いたものとして実行する
+
+        Returns
+        -------
+        task: asyncio.Task
+            コマンドを実行するタスク
+        """
+        await asyncio.sleep(self.__gateway_delay)
+        task = asyncio.create_task(handler(*args))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+        return task
+
+
+class FakeGuild:
+    def __init__(self, id: int):
+        self.id = id
+        self.members: dict[int, "FakeMember"] = dict()
+
+    def get_member(self, id: int) -> "FakeMember | None":
+        return self.members.get(id)
+
+
+class FakeChannel:
+    """
+    discord.TextChannelの代わり
+    メッセージの送信・編集はFakeDiscordを通して行う
+    """
+
+    def __init__(self, id: int, discord: FakeDiscord):
+        self.id = id
+        self.name = f"channel{id}"
+        self.discord = discord
+
+    async def send(self, **kwargs) -> "FakeMessage":
+        await self.discord.request(f"channel:{self.id}")
+        return FakeMessage(self, self.discord.next_message_id())
+
+    def get_partial_message(self, id: int) -> "FakeMessage":
+        return FakeMessage(self, id)
+
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, id: int):
+        self.channel = channel
+        self.id = id
+
+    async def edit(self, **kwargs):
+        await self.channel.discord.request(f"channel:{self.channel.id}")
+
+
+class FakeMember:
+    """
+    discord.Memberの代わり
+    DMはFakeDiscordを通して送信する
+    """
+
+    def __init__(self, id: int, discord: FakeDiscord):
+        self.id = id
+        self.name = f"player{id}"
+        self.display_name = self.name
+        self.discord = discord
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, **kwargs):
+        await self.discord.request(f"dm:{self.id}")
+
+
+class FakeResponse:
+    """
+    discord.InteractionResponseの代わり
+    最初に応答した時刻を記録する
+    """
+
+    def __init__(self):
+        self.done_at: float | None = None
+
+    def is_done(self) -> bool:
+        return self.done_at is not None
+
+    def done(self):
+        if self.done_at is None:
+            self.done_at = perf_counter()
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.response = FakeResponse()
+
+
+class FakeContext:
+    """
+    commands.Contextの代わり
+    メッセージはFakeDiscordを通して送信する
+    """
+
+    def __init__(
+        self,
+        author: FakeMember,
+        guild: FakeGuild,
+        channel: FakeChannel,
+        interaction: FakeInteraction | None = None,
+    ):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.interaction = interaction
+
+    async def send(self, *args, **kwargs):
+        if self.interaction is None:
+            await self.author.discord.request(f"channel:{self.channel.id}")
+            return
+        # インタラクションへの応答・フォローアップはチャンネルのレート制限を受けない
+        await self.author.discord.request(None)
+        self.interaction.response.done()
+
+    async def defer(self, **kwargs):
+        # インタラクションへの応答はチャンネルのレート制限を受けない
+        await self.author.discord.request(None)
+        if self.interaction is not None:
+            self.interaction.response.done()
+
+
+class FakeBot:
+    """
+    commands.Botの代わり
+    盤面のメッセージはチャンネルのIDからFakeChannelを作成して送信する
+    """
+
+    shard_count = None
+
+    def __init__(self, discord: FakeDiscord):
+        self.discord = discord
+
+    def get_partial_messageable(self, id: int, **kwargs) -> FakeChannel:
+        return FakeChannel(id, self.discord)
+
+
+class LoopMonitor:
+    """
+    イベントループの遅延を計測する
+    interval秒ごとに起き、予定より遅れた時間を記録する
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: list[float] = list()
+        self.task: asyncio.Task | None = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - start - self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+
+class Harness:
+    """
+    サーバーごとのシナリオを同時に実行し、コマンドの応答時間を記録する
+
+    Attributes
+    ----------
+    cog : MyCog
+    discord : FakeDiscord
+    latencies : dict
+        キー : コマンド名
+        値 : 応答時間 (秒) のリスト
+    acks : dict
+        キー : コマンド名
+        値 : 最初に応答するまでの時間 (秒) のリスト (スラッシュコマンドのみ)
+    """
+
+    def __init__(self, discord: FakeDiscord, think: float, slash: bool = False):
+        self.cog = cog.MyCog(FakeBot(discord))
+        self.discord = discord
+        self.think = think
+        self.slash = slash
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.acks: dict[str, list[float]] = defaultdict(list)
+
+    async def invoke(self, name: str, ctx: FakeContext, kwargs: dict):
+        """
+        コマンドを実行し、届いてから終わるまでの時間を記録する
+        スラッシュコマンドの場合は最初に応答するまでの時間も記録する
+        """
+        command = getattr(self.cog, name)
+        if self.slash:
+            ctx = FakeContext(ctx.author, ctx.guild, ctx.channel, FakeInteraction())
+        start = perf_counter()
+        await command.callback(self.cog, ctx, **kwargs)
+        end = perf_counter()
+        self.latencies[name].append(end - start)
+        if self.slash:
+            done_at = ctx.interaction.response.done_at
+            self.acks[name].append((done_at or end) - start)
+
+    async def command(self, name: str, ctx: FakeContext, **kwargs):
+        """
+        コマンドをゲートウェイから送り、終わるまで待つ
+        """
+        task = await self.discord.dispatch(self.invoke, name, ctx, kwargs)
+        await task
+        if 0 < self.think:
+            await asyncio.sleep(self.think)
+
+    async def put_cards(
+        self, contexts: dict[int, FakeContext], ctx: FakeContext, limit: int | None
+    ):
+        """
+        失敗しない順番でlimit枚 (Noneの場合はすべて) のカードを出す
+        """
+        ito = self.cog.sessions.get(ctx.guild.id, ctx.channel.id).get_ito()
+        order = sorted(
+            (card, player.get_id())
+            for player in ito.get_players().values()
+            for card in player.get_cards_in_hand()
+        )
+        for _, player_id in order[:limit]:
+            await self.command("put", contexts[player_id])
+
+    async def scenario(self, guild_index: int, players: int, level: int, rounds: int):
+        guild = FakeGuild((guild_index + 1) << 22)
+        channel = FakeChannel(guild_index + 1, self.discord)
+        contexts = {
+            player_id: FakeContext(FakeMember(player_id, self.discord), guild, channel)
+            for player_id in range(guild_index * players, (guild_index + 1) * players)
+        }
+        for ctx in contexts.values():
+            guild.members[ctx.author.id] = ctx.author
+        host = next(iter(contexts.values()))
+
+        await asyncio.gather(*(self.command("entry", ctx) for ctx in contexts.values()))
+        await self.command("set_level", host, level=level)
+
+        for _ in range(rounds):
+            await self.command("start", host)
+            await self.put_cards(contexts, host, None)
+
+        await self.command("start", host)
+        await self.put_cards(contexts, host, players * level // 2)
+        await self.command("stop", host)
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "max": max(values) * 1000,
+    }
+
+
+async def main(args: argparse.Namespace) -> dict:
+    discord = FakeDiscord(
+        delay=args.delay,
+        jitter=args.jitter,
+        gateway_delay=args.gateway_delay,
+        limit=args.channel_limit,
+        window=args.window,
+        ratelimit_rate=args.ratelimit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    harness = Harness(discord, args.think, args.slash)
+    monitor = LoopMonitor()
+    monitor.start()
+
+    start = perf_counter()
+    await asyncio.gather(
+        *(
+            harness.scenario(i, args.players, args.level, args.rounds)
+            for i in range(args.guilds)
+        )
+    )
+    elapsed = perf_counter() - start
+    monitor.stop()
+
+    all_latencies = [v for values in harness.latencies.values() for v in values]
+    all_acks = [v for values in harness.acks.values() for v in values]
+    return {
+        "elapsed": elapsed,
+        "commands": {
+            name: summarize(values) for name, values in harness.latencies.items()
+        },
+        "all": summarize(all_latencies),
+        "acks": {name: summarize(values) for name, values in harness.acks.items()},
+        "all_acks": summarize(all_acks) if all_acks else None,
+        # Discordはインタラクションに3秒以内に応答しないと失敗にする
+        "ack_deadline_missed": sum(ACK_DEADLINE < ack for ack in all_acks),
+        "messages": discord.get_sent(),
+        "messages_per_sec": discord.get_sent() / elapsed,
+        "rate_limited": discord.get_rate_limited(),
+        "board": {
+            result: metrics.BOARD_UPDATES.get(result)
+            for result in ("received", "sent", "edited")
+        },
+        "loop_lag": {
+            "p50": percentile(monitor.lags, 50) * 1000,
+            "p99": percentile(monitor.lags, 99) * 1000,
+            "max": max(monitor.lags) * 1000,
+        },
+    }
+
+
+def print_report(args: argparse.Namespace, report: dict):
+    print(
+        f"guilds={args.guilds} players={args.players} level={args.level}"
+        f" rounds={args.rounds} delay={args.delay * 1000:.0f}ms"
+        f" limit={args.channel_limit}/{args.window:g}s"
+        f" ratelimit_rate={args.ratelimit_rate}"
+    )
+    print(f"{'command':<10} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = list(report["commands"].items()) + [("all", report["all"])]
+    for name, stats in rows:
+        print(
+            f"{name:<10} {stats['count']:>6}"
+            + "".join(f" {stats[key]:>7.1f}ms" for key in ("p50", "p95", "p99", "max"))
+        )
+    if args.slash:
+        print("ack (first response)")
+        rows = list(report["acks"].items()) + [("all", report["all_acks"])]
+        for name, stats in rows:
+            print(
+                f"{name:<10} {stats['count']:>6}"
+                + "".join(
+                    f" {stats[key]:>7.1f}ms" for key in ("p50", "p95", "p99", "max")
+                )
+            )
+        print(f"ack over {ACK_DEADLINE:g}s: {report['ack_deadline_missed']}")
+    lag = report["loop_lag"]
+    print(
+        f"elapsed {report['elapsed']:.2f}s, messages {report['messages']}"
+        f" ({report['messages_per_sec']:.1f}/s), rate limited {report['rate_limited']}"
+    )
+    if args.live_board:
+        board = report["board"]
+        print(
+            f"live board: {board['received']:.0f} updates →"
+            f" {board['sent']:.0f} sent + {board['edited']:.0f} edited"
+        )
+    print(
+        f"event loop lag p50 {lag['p50']:.2f}ms, p99 {lag['p99']:.2f}ms,"
+        f" max {lag['max']:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test with a fake Discord")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--think", type=float, default=0.0, help="コマンドの間隔 (秒)")
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--gateway-delay", type=float, default=0.02)
+    parser.add_argument("--channel-limit", type=int, default=5)
+    parser.add_argument("--window", type=float, default=5.0)
+    parser.add_argument("--ratelimit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--live-board", action="store_true")
+    parser.add_argument("--board-delay", type=float, default=cog.BOARD_DELAY)
+    parser.add_argument("--slash", action="store_true")
+    parser.add_argument("--fast-ack", action="store_true")
+    parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    args = parser.parse_args()
+
+    # コマンドのログは出力しない
+    logger.remove()
+    cog.LIVE_BOARD = args.live_board
+    cog.BOARD_DELAY = args.board_delay
+    cog.FAST_ACK = args.fast_ack
+    report = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(args, report)
@@ -0,0 +1,200 @@
+# ライブボード
+
+# ゲームごとに1つの盤面のメッセージを作成し、/putのたびに新しく送信せずに編集する
+# 短い間隔 (delay秒) の間に届いた更新はまとめて1回の編集にする
+# 盤面はItoの最新の状態から作成し、最近出されたカードを履歴として表示する
+# チャンネルとメッセージはIDだけを持ち、送信・編集のときに
+# PartialMessageable / PartialMessageを作成する (キャッシュのオブジェクトを保持しない)
+
+import asyncio
+from collections import deque
+from discord import Client, Colour, Embed, HTTPException, NotFound, PartialMessageable
+from render import Renderer, field
+import metrics
+
+
+# ----------
+# ロガー
+# ----------
+
+from loguru import logger
+
+
+# ----------
+# 定数
+# ----------
+
+# 更新をまとめる間隔 (秒)
+DEFAULT_DELAY = 1.0
+
+# 盤面に表示する履歴の数
+HISTORY = 5
+
+
+class LiveBoard:
+    """
+    ゲームの盤面のメッセージ
+
+    Attributes
+    ----------
+    __renderer : Renderer
+        表示クラス
+    __delay : float
+        更新をまとめる間隔 (秒)
+    __client : Client | None
+        PartialMessageableを作成するbot
+    __channel_id : int | None
+        盤面を送信するチャンネルのID
+    __message_id : int | None
+        送信した盤面のメッセージのID (まだ送信していない場合はNone)
+    __pending : tuple | None
+        まだ反映していない更新 (タイトル, 説明, 色)
+    __history : deque
+        最近出されたカード
+    __task : asyncio.Task | None
+        更新をまとめて反映するタスク
+    __sending : asyncio.Task | None
+        送信・編集中のタスク (close()でもキャンセルしない)
+    """
+
+    __slots__ = (
+        "__renderer",
+        "__delay",
+        "__client",
+        "__channel_id",
+        "__message_id",
+        "__pending",
+        "__history",
+        "__task",
+        "__sending",
+    )
+
+    def __init__(self, renderer: Renderer, delay: float = DEFAULT_DELAY):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        renderer: Renderer
+            表示クラス
+        delay: float
+            更新をまとめる間隔 (秒)
+        """
+        self.__renderer: Renderer = renderer
+        self.__delay: float = delay
+        self.__client: Client | None = None
+        self.__channel_id: int | None = None
+        self.__message_id: int | None = None
+        self.__pending: tuple[str, str, Colour] | None = None
+        self.__history: deque[str] = deque(maxlen=HISTORY)
+        self.__task: asyncio.Task | None = None
+        self.__sending: asyncio.Task | None = None
+
+    def update(
+        self,
+        client: Client,
+        channel_id: int,
+        title: str,
+        description: str,
+        colour: Colour,
+        note: str,
+    ):
+        """
+        盤面を更新する
+        delay秒後にそれまでの更新をまとめて反映する
+
+        Parameters
+        ----------
+        client: Client
+            bot
+        channel_id: int
+            盤面を送信するチャンネルのID
+        title: str
+        description: str
+        colour: Colour
+        note: str
+            履歴に追加する文字列
+        """
+        self.__client = client
+        self.__channel_id = channel_id
+        self.__pending = (title, description, colour)
+        self.__history.append(note)
+        metrics.BOARD_UPDATES.inc("received")
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        """
+        まだ反映していない更新がなくなるまで、delay秒ごとに盤面に反映する
+        """
+        try:
+            while self.__pending is not None:
+                await asyncio.sleep(self.__delay)
+                await self.flush()
+        finally:
+            # close()の後に新しいタスクが作られている場合はそのままにする
+            if self.__task is asyncio.current_task():
+                self.__task = None
+
+    async def flush(self):
+        """
+        まだ反映していない更新をすぐに盤面に反映する
+        送信・編集中の更新がある場合は、それが終わってから反映する
+        """
+        if self.__sending is not None and not self.__sending.done():
+            await asyncio.shield(self.__sending)
+        if self.__pending is None:
+            return
+        title, description, colour = self.__pending
+        self.__pending = None
+        embed = self.__renderer.board(
+            title,
+            description,
+            colour,
+            extra=[field("最近のカード", "\n".join(self.__history), False)],
+        )
+        channel = self.__client.get_partial_messageable(self.__channel_id)
+        # 更新をまとめるタスクがキャンセルされても、送信・編集は最後まで行う
+        # (途中でやめると、最後の盤面が表示されない)
+        self.__sending = asyncio.create_task(self.__send(channel, embed))
+        await asyncio.shield(self.__sending)
+
+    async def __send(self, channel: PartialMessageable, embed: Embed):
+        """
+        盤面を編集する (まだ送信していない場合・削除された場合は送信する)
+
+        Parameters
+        ----------
+        channel: PartialMessageable
+        embed: Embed
+        """
+        try:
+            if self.__message_id is not None:
+                try:
+                    message = channel.get_partial_message(self.__message_id)
+                    await message.edit(embed=embed)
+                    metrics.BOARD_UPDATES.inc("edited")
+                    return
+                except NotFound:
+                    # 盤面が削除された場合は送信し直す
+                    self.__message_id = None
+            message = await channel.send(embed=embed)
+            self.__message_id = message.id
+            metrics.BOARD_UPDATES.inc("sent")
+        except HTTPException as error:
+            logger.warning(f"Failed to update board: {error!r}")
+
+    async def close(self):
+        """
+        まだ反映していない更新を反映してから、盤面の更新を終了する
+        (すぐに終わったゲームでも最後の盤面を表示する)
+        次に更新した場合は新しいメッセージを送信する
+        """
+        task, self.__task = self.__task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        await self.flush()
+        self.__client = None
+        self.__channel_id = None
+        self.__message_id = None
+        self.__history.clear()
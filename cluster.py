@@ -0,0 +1,337 @@
+# クラスタ
+
+# botを複数のプロセス (ワーカー) に分けて起動する
+# 各ワーカーはシャードの一部を担当し、担当するサーバーのゲームだけを管理する
+# ワーカーとコーディネーターはUnixドメインソケットで通信し、
+# /reload・/quitなどの管理者コマンドをすべてのワーカーで実行する
+
+# 通信は1行1メッセージのJSON
+# ワーカー → コーディネーター
+#   {"op": "hello", "cluster": ワーカーの番号}
+#   {"op": "broadcast", "command": "reload" | "quit"}
+# コーディネーター → ワーカー
+#   {"op": "command", "command": "reload" | "quit"}
+# quitは停止の依頼の後に接続したワーカーにも送る (起動中のワーカーも停止させる)
+
+# 実行方法
+# python cluster.py --workers 2 --shards 4
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+from typing import Awaitable, Callable
+from loguru import logger
+import log
+
+
+# ソケットのパス
+DEFAULT_SOCKET = "ito-cluster.sock"
+
+# すべてのワーカーで実行できるコマンド
+COMMANDS = ("reload", "quit")
+
+
+def shard_slice(cluster_id: int, clusters: int, shard_count: int) -> list[int]:
+    """
+    ワーカーが担当するシャードの番号を取得する
+    シャードを順番にワーカーに割り当てる
+
+    Parameters
+    ----------
+    cluster_id: int
+        ワーカーの番号
+    clusters: int
+        ワーカーの数
+    shard_count: int
+        シャードの数
+
+    Returns
+    -------
+    shard_ids: list[int]
+    """
+    return [
+        shard_id for shard_id in range(shard_count) if shard_id % clusters == cluster_id
+    ]
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+class ClusterClient:
+    """
+    ワーカー側の通信クラス
+
+    Attributes
+    ----------
+    __cluster_id : int
+        ワーカーの番号
+    __reader : asyncio.StreamReader
+    __writer : asyncio.StreamWriter
+    __handler : Callable
+        コーディネーターからコマンドを受け取ったときに呼び出す関数
+    __task : asyncio.Task | None
+        受信するタスク
+    """
+
+    def __init__(
+        self,
+        cluster_id: int,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        handler: Callable[[str], Awaitable],
+    ):
+        """
+        コンストラクタ
+        connect()から呼び出す
+        """
+        self.__cluster_id: int = cluster_id
+        self.__reader: asyncio.StreamReader = reader
+        self.__writer: asyncio.StreamWriter = writer
+        self.__handler: Callable[[str], Awaitable] = handler
+        self.__task: asyncio.Task | None = None
+
+    @classmethod
+    async def connect(
+        cls, path: str, cluster_id: int, handler: Callable[[str], Awaitable]
+    ) -> "ClusterClient":
+        """
+        コーディネーターに接続する
+
+        Parameters
+        ----------
+        path: str
+            ソケットのパス
+        cluster_id: int
+            ワーカーの番号
+        handler: Callable
+            コマンドを受け取ったときに呼び出す関数 (引数はコマンド名)
+
+        Returns
+        -------
+        client: ClusterClient
+        """
+        reader, writer = await asyncio.open_unix_connection(path)
+        client = cls(cluster_id, reader, writer, handler)
+        writer.write(encode({"op": "hello", "cluster": cluster_id}))
+        await writer.drain()
+        client.__task = asyncio.create_task(client.__receive())
+        return client
+
+    def get_cluster_id(self) -> int:
+        """
+        ワーカーの番号を取得する
+
+        Returns
+        -------
+        cluster_id: int
+        """
+        return self.__cluster_id
+
+    async def broadcast(self, command: str):
+        """
+        すべてのワーカーでコマンドを実行するように依頼する
+        (自分自身にもコーディネーターから届く)
+
+        Parameters
+        ----------
+        command: str
+            COMMANDSのいずれか
+        """
+        self.__writer.write(encode({"op": "broadcast", "command": command}))
+        await self.__writer.drain()
+
+    async def __receive(self):
+        """
+        コーディネーターからのコマンドを受け取る
+        """
+        while line := await self.__reader.readline():
+            message = json.loads(line)
+            if message.get("op") == "command":
+                try:
+                    await self.__handler(message["command"])
+                except Exception:
+                    logger.exception(f"Cluster command failed: {message['command']}")
+        logger.debug("Disconnected from coordinator")
+
+    async def close(self):
+        """
+        接続を閉じる
+        """
+        if self.__task is not None and self.__task is not asyncio.current_task():
+            self.__task.cancel()
+        self.__writer.close()
+
+
+class Coordinator:
+    """
+    ワーカーを起動し、管理者コマンドを中継するクラス
+
+    Attributes
+    ----------
+    __path : str
+        ソケットのパス
+    __workers : int
+        ワーカーの数
+    __shard_count : int
+        シャードの数
+    __command : list[str]
+        ワーカーを起動するコマンド
+    __writers : dict
+        キー : ワーカーの番号
+        値 : asyncio.StreamWriter
+    __processes : dict
+        キー : ワーカーの番号
+        値 : asyncio.subprocess.Process
+    __quitting : bool
+        True: 停止を依頼された (後から接続したワーカーにもquitを送る)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        workers: int,
+        shard_count: int,
+        command: list[str] | None = None,
+    ):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        path: str
+            ソケットのパス
+        workers: int
+            ワーカーの数
+        shard_count: int
+            シャードの数 (ワーカーの数以上)
+        command: list[str] | None
+            ワーカーを起動するコマンド (Noneの場合はdiscordbot.py)
+        """
+        if shard_count < workers:
+            raise ValueError("シャードの数はワーカーの数以上にしてください")
+        self.__path: str = path
+        self.__workers: int = workers
+        self.__shard_count: int = shard_count
+        self.__command: list[str] = command or [sys.executable, "discordbot.py"]
+        self.__writers: dict[int, asyncio.StreamWriter] = dict()
+        self.__processes: dict[int, asyncio.subprocess.Process] = dict()
+        self.__quitting: bool = False
+
+    async def run(self) -> dict[int, int]:
+        """
+        ワーカーを起動し、すべてのワーカーが終了するまで待つ
+
+        Returns
+        -------
+        returncodes: dict
+            キー : ワーカーの番号
+            値 : 終了コード
+        """
+        if os.path.exists(self.__path):
+            os.remove(self.__path)
+        server = await asyncio.start_unix_server(self.__accept, self.__path)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(
+                sig, lambda: asyncio.create_task(self.broadcast("quit"))
+            )
+
+        for cluster_id in range(self.__workers):
+            shard_ids = shard_slice(cluster_id, self.__workers, self.__shard_count)
+            env = dict(
+                os.environ,
+                CLUSTER_SOCKET=self.__path,
+                CLUSTER_ID=str(cluster_id),
+                SHARDS=str(self.__shard_count),
+                SHARD_IDS=",".join(map(str, shard_ids)),
+            )
+            self.__processes[cluster_id] = await asyncio.create_subprocess_exec(
+                # Ctrl+Cはコーディネーターだけが受け取り、/quitとして中継する
+                *self.__command,
+                env=env,
+                start_new_session=True,
+            )
+            logger.info(f"Worker {cluster_id} started (shards: {shard_ids})")
+
+        returncodes = dict()
+        for cluster_id, process in self.__processes.items():
+            returncodes[cluster_id] = await process.wait()
+            logger.info(f"Worker {cluster_id} exited ({returncodes[cluster_id]})")
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        server.close()
+        await server.wait_closed()
+        os.remove(self.__path)
+        return returncodes
+
+    async def __accept(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """
+        ワーカーからの接続を受け付け、メッセージを処理する
+        """
+        cluster_id = None
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message.get("op") == "hello":
+                    cluster_id = message["cluster"]
+                    self.__writers[cluster_id] = writer
+                    logger.debug(f"Worker {cluster_id} connected")
+                    if self.__quitting:
+                        writer.write(encode({"op": "command", "command": "quit"}))
+                        await writer.drain()
+                elif message.get("op") == "broadcast":
+                    command = message["command"]
+                    if command in COMMANDS:
+                        logger.info(f"Broadcast from worker {cluster_id}: {command}")
+                        await self.broadcast(command)
+        except ConnectionError:
+            # ワーカーが停止した
+            pass
+
+        if cluster_id is not None and self.__writers.get(cluster_id) is writer:
+            del self.__writers[cluster_id]
+        writer.close()
+
+    async def broadcast(self, command: str):
+        """
+        すべてのワーカーにコマンドを送る
+
+        Parameters
+        ----------
+        command: str
+            COMMANDSのいずれか
+        """
+        if command == "quit":
+            self.__quitting = True
+        data = encode({"op": "command", "command": command})
+        for cluster_id, writer in list(self.__writers.items()):
+            try:
+                writer.write(data)
+                await writer.drain()
+            except ConnectionError:
+                logger.warning(f"Worker {cluster_id} is not reachable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ito bot cluster launcher")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    log.setup()
+    coordinator = Coordinator(args.socket, args.workers, args.shards or args.workers)
+    returncodes = asyncio.run(coordinator.run())
+    sys.exit(max(returncodes.values(), default=0))
+
+
+if __name__ == "__main__":
+    main()
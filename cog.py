@@ -1,12 +1,26 @@
 # スラッシュコマンド
 
 
-from functools import wraps
-from datetime import datetime
+import asyncio
+from os import environ
+from time import perf_counter
+from functools import partial, wraps
 from discord.ext import commands
-from discord import Embed, Colour
+from discord import Colour, HTTPException, Object
 from ito import Ito
-from player import Player
+from engine.game import CARD_LIMIT
+import render
+from session import Session, SessionKey
+from shard import ShardedSessions, DEFAULT_SHARD_CONCURRENCY
+from store import NullStore, SqliteStore, decode, encode, DEFAULT_INTERVAL
+from fanout import fan_out, DEFAULT_CONCURRENCY
+from guard import Guard, GuardPipeline
+from board import DEFAULT_DELAY
+import handoff
+import metrics
+import profiler
+import startup
+from handoff import InFlight, DEFAULT_DRAIN_TIMEOUT
 
 
 # ----------
@@ -16,6 +30,40 @@ from player import Player
 from loguru import logger
 
 
+# ----------
+# 定数
+# ----------
+
+# ゲーム開始時に同時に送信するDMの上限
+DM_CONCURRENCY = int(environ.get("DM_CONCURRENCY", DEFAULT_CONCURRENCY))
+
+# ゲームの保存先 (sqlite or none)
+STORE = environ.get("STORE", "sqlite")
+STORE_PATH = environ.get("STORE_PATH", "ito.sqlite3")
+STORE_INTERVAL = float(environ.get("STORE_INTERVAL", DEFAULT_INTERVAL))
+
+# シャードごとに同時に実行するコマンドの上限
+SHARD_CONCURRENCY = int(environ.get("SHARD_CONCURRENCY", DEFAULT_SHARD_CONCURRENCY))
+
+# リロード・停止時に実行中のコマンドを待つ時間の上限 (秒)
+DRAIN_TIMEOUT = float(environ.get("DRAIN_TIMEOUT", DEFAULT_DRAIN_TIMEOUT))
+
+# ライブボード (1の場合は/putの結果を1つの盤面のメッセージの編集で表示する)
+LIVE_BOARD = environ.get("LIVE_BOARD", "0") == "1"
+
+# ライブボードの更新をまとめる間隔 (秒)
+BOARD_DELAY = float(environ.get("BOARD_DELAY", DEFAULT_DELAY))
+
+# 高速応答 (1の場合はスラッシュコマンドにすぐ応答 (defer) し、結果はフォローアップで送信する)
+FAST_ACK = environ.get("FAST_ACK", "0") == "1"
+
+# コマンドごとのデバッグログを出力する頻度 (N回に1回)
+COMMAND_LOG_SAMPLE = int(environ.get("COMMAND_LOG_SAMPLE", 100))
+
+# 再起動中に実行されたコマンドへのメッセージ
+RESTARTING = "再起動中です\nしばらくしてからもう一度実行してね"
+
+
 # --------
 # Cog
 # --------
@@ -24,160 +72,471 @@ from loguru import logger
 class MyCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.ito = Ito()
+        if STORE == "sqlite":
+            self.store = SqliteStore(STORE_PATH, STORE_INTERVAL)
+        else:
+            self.store = NullStore()
+        # セッションはシャードごとに管理する (シャーディングしない場合は1つ)
+        self.sessions = ShardedSessions(
+            lambda: self.bot.shard_count or 1,
+            SHARD_CONCURRENCY,
+            on_evict=self.evict_session,
+        )
+        self.guards = GuardPipeline()
+        self.in_flight = InFlight()
+
+        # 保存されていて、まだ復元していないセッション
+        self.pending: dict[SessionKey, bytes] = dict()
+        # まだ復元していないセッションのプレイヤー (discord.Member.id → SessionKey)
+        self.pending_members: dict[int, SessionKey] = dict()
+        # 復元中のセッション
+        self.restoring: dict[SessionKey, asyncio.Task] = dict()
+        # 保存先の読込み (cog_load()で開始する)
+        self.loading: asyncio.Task | None = None
+
+    async def cog_load(self):
+        """
+        リロード前のCogからセッションを引き継ぐ
+        保存先の読込みは起動を待たせないように裏で行う
+        """
+        previous = handoff.take()
+        if previous is not None:
+            for key, ito in previous.get_sessions():
+                self.sessions.adopt(key, ito)
+            logger.debug(f"{len(self.sessions)} sessions handed off")
+        self.loading = asyncio.create_task(self.load_store(previous))
+
+        # セッション数・プレイヤー数は取得されたときに数える
+        metrics.SESSIONS.set_function(lambda: len(self.sessions))
+        metrics.PLAYERS.set_function(self.count_players)
+
+    async def load_store(self, previous: handoff.Handoff | None):
+        """
+        保存先を開き、保存されているセッションを読み込む
+        引き継いだセッションがある場合は読み込まずにそれを使う
+        (復元は各セッションに最初にアクセスしたときに行う)
+
+        Parameters
+        ----------
+        previous: handoff.Handoff | None
+            リロード前のCogから引き継いだデータ
+        """
+        self.store.open()
+        if previous is not None:
+            loaded = previous.get_pending()
+        else:
+            loaded = await self.store.load_all()
+        # 読込み中に破棄したセッションはそちらの方が新しい
+        self.pending = loaded | self.pending
+
+        # クラスタの場合は担当するシャードのセッションだけを復元する
+        shard_ids = getattr(self.bot, "shard_ids", None)
+        if shard_ids is not None:
+            self.pending = {
+                key: data
+                for key, data in self.pending.items()
+                if self.sessions.get_shard_id(key) in shard_ids
+            }
+        # 復元する前に別のゲームに参加できないように、プレイヤーを登録しておく
+        for key, data in self.pending.items():
+            for player_id, *_ in decode(data)["players"]:
+                self.pending_members[player_id] = key
+        self.store.start()
+        logger.debug(f"{len(self.pending)} sessions pending restore")
+
+    async def prepare_unload(self):
+        """
+        リロード・停止の前に呼び出す
+        実行中のコマンドが終わるのを待ってから、セッションを次のCogに引き継ぐ
 
-    # --------
-    # Decorator
-    # --------
+        discord.pyはコマンドを削除してからcog_unload()を呼び出し、
+        その例外も無視するため、コマンドが残っているうちにここで行う
+        (待っている間に実行されたコマンドには再起動中のメッセージを送信する)
+        失敗した場合はコマンドの受付を再開して例外を送出する
+        """
+        remaining = await self.in_flight.drain(DRAIN_TIMEOUT)
+        if remaining:
+            logger.warning(f"{remaining} commands still running after drain")
+        try:
+            await self.loading
+
+            # 盤面のメッセージにまだ反映していない更新を反映する
+            # (盤面のメッセージは引き継がないため、次の/putでは新しく送信する)
+            boards = [
+                session.get_board().close()
+                for session in self.sessions.get_sessions()
+                if session.has_board()
+            ]
+            await asyncio.gather(*boards)
+
+            handoff.export(self.sessions, self.pending)
+        except Exception:
+            logger.exception("Failed to hand off sessions")
+            self.in_flight.resume()
+            raise
+        logger.debug(f"{len(self.sessions)} sessions exported")
+
+    async def cog_unload(self):
+        """
+        残っている変更を保存する
+        (discord.pyはこの例外を無視するため、失敗した場合はログに出力する)
+        """
+        metrics.SESSIONS.set_function(None)
+        metrics.PLAYERS.set_function(None)
+        try:
+            await self.store.close()
+        except Exception:
+            logger.exception("Failed to close store")
+
+    # ----------
+    # セッション
+    # ----------
+
+    def get_session(self, ctx: commands.Context) -> Session:
+        """
+        コマンドが実行されたチャンネルのセッションを取得する
+        存在しない場合は新しく作成する
 
-    # 標準出力にログを出力
-    def log_wrapper(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            now = datetime.now().strftime("%Y/%m/%d %H:%M")
-            logger.debug(now)
-            ctx: commands.Context = args[1]
-            logger.debug(f"{func.__name__} command from {ctx.author}")
-            return_value = await func(*args, **kwargs)
-            print("--------")
-            return return_value
-
-        return decorator
-
-    # ゲーム中のみ実行できるコマンド
-    def only_in_game(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            self: MyCog = args[0]
-            ito = self.ito
-
-            # ゲームが開始されていない場合はエラーメッセージを送信
-            if not ito.is_ongoing():
-                embed = Embed(
-                    title=f"{func.__name__} command",
-                    description="ゲームが開始されていません",
-                    color=Colour.gold(),
-                )
-                now = datetime.now().strftime("%Y/%m/%d %H:%M")
-                embed.set_footer(text=now)
-                ctx: commands.Context = args[1]
-                await ctx.send(embed=embed)
-                return
+        Parameters
+        ----------
+        ctx: commands.Context
 
-            # ゲームが開始されている場合はコマンドを実行
-            return await func(*args, **kwargs)
+        Returns
+        -------
+        session: Session
+        """
+        guild_id = ctx.guild.id if ctx.guild is not None else None
+        return self.sessions.get_or_create(guild_id, ctx.channel.id)
 
-        return decorator
+    def evict_session(self, session: Session):
+        """
+        アイドル状態・上限超過でメモリから破棄したセッションを保存する
+        保存先からは削除せず、次にアクセスしたときに復元する
+        (プレイヤーがいないセッションは復元するものが無いので何もしない)
 
-    # ゲーム外のみ実行できるコマンド
-    def only_off_game(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            self: MyCog = args[0]
-            ito = self.ito
+        Parameters
+        ----------
+        session: Session
+        """
+        ito = session.get_ito()
+        if not ito.get_players():
+            return
+        key = session.get_key()
+        self.store.mark_dirty(session)
+        self.pending[key] = encode(session)
+        for player_id in ito.get_player_id_list():
+            self.pending_members[player_id] = key
 
-            # ゲームが開始されている場合はエラーメッセージを送信
-            if ito.is_ongoing():
-                embed = Embed(
-                    title=f"{func.__name__} command",
-                    description="ゲームが開始されています",
-                    color=Colour.gold(),
-                )
-                now = datetime.now().strftime("%Y/%m/%d %H:%M")
-                embed.set_footer(text=now)
-                ctx: commands.Context = args[1]
-                await ctx.send(embed=embed)
+    async def restore_session(self, ctx: commands.Context):
+        """
+        コマンドが実行されたチャンネルのセッションが保存されていれば復元する
+        コマンド実行者が参加している、まだ復元していないゲームも復元する
+        同じセッションを同時に復元する場合は、最初のコマンドの復元を待つ
+        (別のセッションの復元は待たない)
+
+        Parameters
+        ----------
+        ctx: commands.Context
+        """
+        # 保存先の読込みが終わっていない場合は待つ
+        if self.loading is not None and not self.loading.done():
+            await self.loading
+
+        guild_id = ctx.guild.id if ctx.guild is not None else None
+        key = (guild_id, ctx.channel.id)
+        if key in self.pending:
+            await self.restore_pending(key, ctx.guild, ctx.channel)
+
+        # コマンド実行者が参加しているゲームが別のチャンネルにある場合はそれも復元する
+        # (実行条件の判定 (Guard.CHANNEL) の前に参加登録を戻す)
+        other = self.pending_members.get(ctx.author.id)
+        if other is None or other == key or other not in self.pending:
+            return
+        other_guild_id, other_channel_id = other
+        if other_guild_id is None:
+            guild, channel = None, self.bot.get_channel(other_channel_id)
+        else:
+            guild = self.bot.get_guild(other_guild_id)
+            if guild is None:
+                # サーバーから抜けた場合は復元しない (復元するときにプレイヤーを除外する)
                 return
+            channel = guild.get_channel(other_channel_id)
+        await self.restore_pending(other, guild, channel)
 
-            # ゲームが開始されていない場合はコマンドを実行
-            return await func(*args, **kwargs)
-
-        return decorator
-
-    # プレイヤーのみ実行できるコマンド
-    def only_for_player(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            self: MyCog = args[0]
-            ito = self.ito
-            ctx: commands.Context = args[1]
-
-            # コマンド実行者がゲームに参加していない場合はエラーメッセージを送信
-            if ctx.author.id not in ito.get_players():
-                embed = Embed(
-                    title=f"{func.__name__} command",
-                    description="ゲームに参加してね！",
-                    color=Colour.gold(),
-                )
-                player_list = ito.get_player_name_list()
-                if len(player_list) == 0:
-                    players = "プレイヤーがまだいません"
-                else:
-                    players = "\n".join(player_list)
-                embed.add_field(name="参加者", value=players, inline=False)
-                now = datetime.now().strftime("%Y/%m/%d %H:%M")
-                embed.set_footer(text=now)
-                await ctx.send(embed=embed)
-                return
+    async def restore_pending(self, key: SessionKey, guild, channel):
+        """
+        保存されているセッションを復元する
+        同じセッションを同時に復元する場合は、最初の復元を待つ
+
+        Parameters
+        ----------
+        key: SessionKey
+        guild: discord.Guild | None
+            サーバー (DMの場合はNone)
+        channel: discord.abc.Messageable | None
+            チャンネル
+        """
+        task = self.restoring.get(key)
+        if task is None:
+            task = asyncio.create_task(self.load_session(key, guild, channel))
+            self.restoring[key] = task
+            task.add_done_callback(lambda _: self.restoring.pop(key, None))
+        # コマンドがキャンセルされても、待っている他のコマンドのために復元は続ける
+        await asyncio.shield(task)
+
+    async def load_session(self, key: SessionKey, guild, channel):
+        """
+        保存されているセッションを復元する
+        プレイヤーのdiscord.Memberはまとめて並列に取得する
+
+        Parameters
+        ----------
+        key: SessionKey
+        guild: discord.Guild | None
+            サーバー (DMの場合はNone)
+        channel: discord.abc.Messageable
+            チャンネル
+        """
+        data = self.pending.get(key)
+        if data is None:
+            return
 
-            # コマンド実行者がゲームに参加している場合はコマンドを実行
-            return await func(*args, **kwargs)
-
-        return decorator
-
-    # 登録されているチャンネルでのみ実行できるコマンド
-    def only_in_channel(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            self: MyCog = args[0]
-            ito = self.ito
-            ctx: commands.Context = args[1]
-
-            # 登録されているチャンネル以外の場合はエラーメッセージを送信
-            if ctx.channel.id != ito.get_channel().id:
-                embed = Embed(
-                    title=f"{func.__name__} command",
-                    description="以下のチャンネルが選択されています",
-                    color=Colour.gold(),
-                )
-                embed.add_field(
-                    name="チャンネル", value=ito.get_channel().name, inline=False
+        snapshot = decode(data)
+        ids = [player_id for player_id, *_ in snapshot["players"]]
+        members = await asyncio.gather(
+            *(self.resolve_member(guild, player_id) for player_id in ids)
+        )
+
+        # 他のゲームに参加しているプレイヤーは除外する (1人は1つのゲームにだけ参加できる)
+        player_ids = set()
+        for player_id, member in zip(ids, members):
+            joined = self.sessions.get_member_session(player_id)
+            if joined is not None and joined.get_key() != key:
+                logger.debug(f"Player {player_id} is in {joined.get_key()}")
+            elif member is not None:
+                player_ids.add(player_id)
+
+        ito = Ito()
+        ito.restore(snapshot, guild, channel, player_ids)
+        self.sessions.adopt(key, ito)
+        del self.pending[key]
+        for player_id in ids:
+            if self.pending_members.get(player_id) == key:
+                del self.pending_members[player_id]
+        logger.debug(f"Session restored: {key}")
+
+    async def resolve_member(self, guild, member_id: int):
+        """
+        プレイヤーのdiscord.Memberを取得する
+        キャッシュに無い場合はAPIから取得する
+
+        Parameters
+        ----------
+        guild: discord.Guild | None
+            サーバー (DMの場合はNone)
+        member_id: int
+            discord.Member.id
+
+        Returns
+        -------
+        member: discord.Member | discord.User | None
+            見つからない場合はNone
+        """
+        try:
+            if guild is None:
+                return self.bot.get_user(member_id) or await self.bot.fetch_user(
+                    member_id
                 )
-                now = datetime.now().strftime("%Y/%m/%d %H:%M")
-                embed.set_footer(text=now)
-                await ctx.send(embed=embed)
-                return
+            return guild.get_member(member_id) or await guild.fetch_member(member_id)
+        except HTTPException:
+            return None
+
+    async def send_dm(self, guild, member_id: int, embed):
+        """
+        プレイヤーにDMを送信する
+        discord.Memberがキャッシュに無い場合 (スラッシュ専用モードなど) は、
+        メンバーを取得せずにIDからDMチャンネルを作成して送信する
+
+        Parameters
+        ----------
+        guild: discord.Guild | None
+            サーバー (DMの場合はNone)
+        member_id: int
+            discord.Member.id
+        embed: discord.Embed
+        """
+        member = guild.get_member(member_id) if guild is not None else None
+        if member is None:
+            member = await self.bot.create_dm(Object(member_id))
+        await member.send(embed=embed)
+
+    def get_ito(self, ctx: commands.Context) -> Ito:
+        """
+        コマンドが実行されたチャンネルのゲームを取得する
+
+        Parameters
+        ----------
+        ctx: commands.Context
+
+        Returns
+        -------
+        ito: Ito
+        """
+        return self.get_session(ctx).get_ito()
+
+    async def ack(self, ctx: commands.Context, ephemeral: bool = False) -> bool:
+        """
+        スラッシュコマンドにまだ応答していなければ応答 (defer) する
+        応答した後のctx.send()はフォローアップとして送信される
+
+        Parameters
+        ----------
+        ctx: commands.Context
+        ephemeral: bool
+            True: 実行したプレイヤーだけに見える応答にする
+
+        Returns
+        -------
+        boolean
+            True: 応答した
+            False: すでに応答していた
+        """
+        if ctx.interaction is not None and ctx.interaction.response.is_done():
+            return False
+        await ctx.defer(ephemeral=ephemeral)
+        return True
+
+    def count_players(self) -> int:
+        """
+        すべてのセッションのプレイヤーの数を取得する
 
-            # 登録されているチャンネルの場合はコマンドを実行
-            return await func(*args, **kwargs)
+        Returns
+        -------
+        count: int
+        """
+        return sum(
+            len(session.get_ito().get_players())
+            for session in self.sessions.get_sessions()
+        )
 
-        return decorator
+    # --------
+    # Decorator
+    # --------
 
-    # チャンネルが登録されていない場合はチャンネルを登録するコマンド
-    def channel_registerd_check(func):
-        @wraps(func)
-        async def decorator(*args, **kwargs):
-            self: MyCog = args[0]
-            ito = self.ito
-            ctx: commands.Context = args[1]
+    # 実行条件を判定してからコマンドを実行する
+    def game_command(*guards: Guard, register: bool = True, board: bool = False):
+        """
+        コマンドの実行条件を宣言する
+
+        ログの出力、セッション内の排他制御、チャンネルの登録、
+        実行条件の判定を1つのデコレータでまとめて行う
+        高速応答の場合は、セッションの復元やロックを待つ前にスラッシュコマンドに応答する
+
+        Parameters
+        ----------
+        guards: Guard
+            コマンドの実行条件 (宣言した順に判定する)
+        register: bool
+            True: チャンネルが登録されていない場合は登録する
+        board: bool
+            True: ライブボードに結果を表示するコマンド
+                  (高速応答の場合は実行したプレイヤーだけに見える応答にする)
+        """
 
-            if ito.get_channel() == None:
-                ito.set_channel(ctx.channel)
-                logger.debug(f"{ctx.author} set channel: {ctx.channel.name}")
+        def wrapper(func):
+            name = func.__name__
 
-            return await func(*args, **kwargs)
+            @wraps(func)
+            async def decorator(*args, **kwargs):
+                self: MyCog = args[0]
+                ctx: commands.Context = args[1]
 
-        return decorator
+                # 再起動中は新しいコマンドを受け付けない
+                if self.in_flight.is_draining():
+                    metrics.COMMAND_REJECTIONS.inc(name, "restarting")
+                    embed = render.build(
+                        f"{name} command", RESTARTING, Colour.gold(), []
+                    )
+                    await ctx.send(embed=embed)
+                    return None
+
+                with self.in_flight.track(), profiler.track(name):
+                    start = perf_counter()
+
+                    # 3秒以内に応答する必要があるため、待つ可能性のある処理より先に応答する
+                    if FAST_ACK and ctx.interaction is not None:
+                        if await self.ack(ctx, ephemeral=board and LIVE_BOARD):
+                            metrics.COMMAND_ACK.observe(perf_counter() - start, name)
+
+                    await self.restore_session(ctx)
+                    session = self.get_session(ctx)
+                    guild_id, channel_id = session.get_key()
+                    log = logger.bind(
+                        command=name, guild=guild_id, session=f"{guild_id}:{channel_id}"
+                    )
+                    # コマンドごとに出力されるため間引く
+                    log.bind(sample=COMMAND_LOG_SAMPLE).debug(
+                        f"{name} command from {ctx.author}"
+                    )
+
+                    # セッション内の順番を待ってから、シャードの実行枠を取る
+                    # (順番を待つ間は実行枠を使わないので、1つのセッションに
+                    # コマンドが集中してもシャードの他のセッションは止まらない)
+                    slot = self.sessions.slot(session.get_key())
+                    async with session.serialize() as wait, slot:
+                        # 他のコマンドを待った場合はログを出力
+                        if 0 < wait:
+                            stats = session.get_stats()
+                            log.debug(
+                                f"{name} waited {wait * 1000:.1f}ms"
+                                f" (max waiting: {stats['max_waiting']})"
+                            )
+
+                        # チャンネルが登録されていない場合はチャンネルを登録
+                        ito = session.get_ito()
+                        if register and ito.get_channel_id() == None:
+                            ito.set_guild(ctx.guild)
+                            ito.set_channel(ctx.channel)
+                            log.debug(f"{ctx.author} set channel: {ctx.channel.name}")
+
+                        # 実行条件を満たさない場合はエラーメッセージを送信
+                        joined = self.sessions.get_member_session(ctx.author.id)
+                        embed = self.guards.check(
+                            name, guards, session, joined, ctx.author.id
+                        )
+                        if embed is not None:
+                            await ctx.send(embed=embed)
+                            return_value = None
+                        else:
+                            try:
+                                return_value = await func(*args, **kwargs)
+                            except Exception:
+                                metrics.COMMAND_ERRORS.inc(name)
+                                raise
+                            finally:
+                                # 変更は後でまとめて保存する
+                                # (プレイヤーがいないセッションは保存しない)
+                                if ito.get_players():
+                                    self.store.mark_dirty(session)
+
+                    elapsed = perf_counter() - start
+                    metrics.COMMAND_DURATION.observe(elapsed, name)
+                    latency = round(elapsed * 1000, 2)
+                    log.bind(latency_ms=latency).info(f"{name} command done")
+                    if startup.mark("first command"):
+                        logger.info(startup.report())
+                    return return_value
+
+            return decorator
+
+        return wrapper
 
     # --------
     # スラッシュコマンド
     # --------
 
     @commands.hybrid_command(name="entry", description="ゲームに参加する")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME)
     async def entry(self, ctx: commands.Context):
         """
         entry command
@@ -187,42 +546,35 @@ class MyCog(commands.Cog):
         コマンド実行者をプレイヤーに登録する
         """
 
-        ito = self.ito
-
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
+        session = self.get_session(ctx)
+        ito = session.get_ito()
+        renderer = session.get_renderer()
 
         if ctx.author.id in ito.get_players():
-            embed = Embed(
-                title="Entry command",
-                description="すでに登録されています",
-                color=Colour.gold(),
+            embed = render.build(
+                "Entry command",
+                "すでに登録されています",
+                Colour.gold(),
+                [render.field("参加者", renderer.player_list(), False)],
             )
-            players = "\n".join(ito.get_player_name_list())
-            embed.add_field(name="参加者", value=players, inline=False)
-            embed.set_footer(text=now)
             await ctx.send(embed=embed)
 
             logger.debug(f"{ctx.author} is already registered")
             return
 
         ito.regist_player(ctx.author)
+        self.sessions.bind_member(ctx.author.id, session.get_key())
 
-        embed = Embed(
-            title="Entry command",
-            description="新しいプレイヤーが参加しました！",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Entry command",
+            "新しいプレイヤーが参加しました！",
+            Colour.dark_blue(),
+            [render.field("参加者", renderer.player_list(), False)],
         )
-        players = "\n".join(ito.get_player_name_list())
-        embed.add_field(name="参加者", value=players, inline=False)
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @commands.hybrid_command(name="exit", description="ゲームから退出します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
     async def exit(self, ctx: commands.Context):
         """
         exit command
@@ -230,168 +582,120 @@ class MyCog(commands.Cog):
         プレイヤーを退出
         """
 
-        ito = self.ito
+        session = self.get_session(ctx)
+        ito = session.get_ito()
         ito.delete_player(ctx.author)
-
-        embed = Embed(
-            title="Exit command",
-            description="プレイヤーが退出しました",
-            color=Colour.dark_blue(),
+        self.sessions.unbind_member(ctx.author.id)
+        # 最後のプレイヤーが退出した場合は保存先から削除する
+        if not ito.get_players():
+            self.store.delete(session.get_key())
+
+        players = session.get_renderer().player_list("プレイヤーがまだいません")
+        embed = render.build(
+            "Exit command",
+            "プレイヤーが退出しました",
+            Colour.dark_blue(),
+            [render.field("参加者", players, False)],
         )
-        players = "\n".join(ito.get_player_name_list())
-        embed.add_field(name="参加者", value=players, inline=False)
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @commands.hybrid_command(name="start", description="ゲームを開始します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
     async def start(self, ctx: commands.Context):
         """
         start command
 
-        ゲームを開始
+        ゲームを開始
         """
 
-        ito = self.ito
+        session = self.get_session(ctx)
+        ito = session.get_ito()
+        renderer = session.get_renderer()
 
         # プレイヤーが2人未満の場合はエラーメッセージを送信
         if len(ito.get_players()) < 2:
-            embed = Embed(
-                title="Start command",
-                description="2人以上でプレイしてね！",
-                color=Colour.gold(),
+            players = renderer.player_list("プレイヤーがまだ参加していません")
+            embed = render.build(
+                "Start command",
+                "2人以上でプレイしてね！",
+                Colour.gold(),
+                [render.field("参加者", players, False)],
             )
-            if len(ito.get_players()) == 0:
-                players = "プレイヤーがまだ参加していません"
-            else:
-                players = "\n".join(ito.get_player_name_list())
-            embed.add_field(name="参加者", value=players, inline=False)
-            now = datetime.now().strftime("%Y/%m/%d %H:%M")
-            embed.set_footer(text=now)
             await ctx.send(embed=embed)
             return
 
-        await ctx.defer()
+        await self.ack(ctx)
 
-        logger.debug("Game start")
+        # カードが足りない場合はエラーメッセージを送信
+        try:
+            ito.deal_cards()
+        except ValueError:
+            ito.initialize_game()
+            embed = render.build(
+                "Start command",
+                "カードが足りません\nレベルを下げてね！",
+                Colour.gold(),
+                [],
+            )
+            await ctx.send(embed=embed)
+            return
 
-        ito.deal_cards()
+        logger.debug("Game start")
+        if session.has_board():
+            await session.get_board().close()
         ito.start_game()
+        metrics.GAMES.inc("started")
 
-        embed_channel = Embed(
-            title="Game start!!!",
-            description="ゲーム情報",
-            color=Colour.dark_blue(),
-        )
-        embed_channel.add_field(
-            name="チャンネル",
-            value=ito.get_channel_name(),
-            inline=False,
-        )
-        embed_channel.add_field(
-            name="ライフ",
-            value=str(ito.get_life()),
-            inline=True,
-        )
-        embed_channel.add_field(
-            name="レベル",
-            value=str(ito.get_level()),
-            inline=True,
-        )
-        embed_channel.add_field(
-            name="トークテーマ",
-            value=ito.get_theme(),
-            inline=False,
-        )
-
-        embed_dm = Embed(
-            title="Game start!!!",
-            description="ゲーム情報",
-            color=Colour.dark_blue(),
+        embed_channel = renderer.board(
+            "Game start!!!", "ゲーム情報", Colour.dark_blue(), channel=True
         )
 
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed_channel.set_footer(text=now)
-        embed_dm.set_footer(text=now)
-
-        players: list[Player] = list(ito.get_players().values())
-        for player in players:
+        # 各プレイヤーへのDMを並列に送信
+        dm_jobs = dict()
+        for player_id, embed_dm in renderer.dm_embeds().items():
+            dm_jobs[player_id] = partial(self.send_dm, ctx.guild, player_id, embed_dm)
+        result = await fan_out(dm_jobs, DM_CONCURRENCY)
+        metrics.DMS.inc("success", amount=len(result.get_succeeded()))
+        metrics.DMS.inc("failure", amount=len(result.get_failed()))
+
+        # DMを送信できなかったプレイヤーをチャンネルに表示
+        if not result.is_all_succeeded():
+            failed = result.get_failed()
+            for player_id, error in failed.items():
+                logger.debug(f"Failed to send DM to {player_id}: {error!r}")
+            names = [ito.get_player(player_id).get_name() for player_id in failed]
             embed_channel.add_field(
-                name=player.get_name(),
-                value=player.hand_to_string_close(),
-                inline=True,
-            )
-
-            embed_dm.clear_fields()
-
-            embed_dm.add_field(
-                name="チャンネル",
-                value=ito.get_channel_name(),
-                inline=False,
-            )
-            embed_dm.add_field(
-                name="ライフ",
-                value=str(ito.get_life()),
-                inline=True,
-            )
-            embed_dm.add_field(
-                name="レベル",
-                value=str(ito.get_level()),
-                inline=True,
-            )
-            embed_dm.add_field(
-                name="トークテーマ",
-                value=ito.get_theme(),
+                name="DMを送信できませんでした",
+                value="\n".join(names),
                 inline=False,
             )
 
-            embed_dm.add_field(
-                name="カード (他の人に教えないように！)",
-                value=player.hand_to_string_open(),
-                inline=False,
-            )
-            await player.get_member().send(embed=embed_dm)
-
         await ctx.send(embed=embed_channel)
 
     @commands.hybrid_command(name="stop", description="ゲームを終了します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_in_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.IN_GAME, Guard.PLAYER)
     async def stop(self, ctx: commands.Context):
         """
         stop command
 
-        ゲームを終了
+        ゲームを終了
         """
 
-        ito = self.ito
-        ito.initialize_game()
+        session = self.get_session(ctx)
+        if session.has_board():
+            await session.get_board().close()
+        session.get_ito().initialize_game()
+        metrics.GAMES.inc("stopped")
 
-        embed = Embed(
-            title="Stop command",
-            description="ゲームを終了しました",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Stop command", "ゲームを終了しました", Colour.dark_blue(), []
         )
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @commands.hybrid_command(
         name="put", description="手札の中で最小のカードを場に出します"
     )
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_in_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.IN_GAME, Guard.PLAYER, board=True)
     async def put(self, ctx: commands.Context):
         """
         put command
@@ -399,123 +703,143 @@ class MyCog(commands.Cog):
         手札の中で最小のカードを場に出す
         """
 
-        ito = self.ito
+        session = self.get_session(ctx)
+        ito = session.get_ito()
+        renderer = session.get_renderer()
         current_player = ito.get_player(ctx.author.id)
         card_put = current_player.put_card()
-        players: list[Player] = list(ito.get_players().values())
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
 
         if card_put == None:
-            embed = Embed(
-                title="Put command",
-                description="手札がありません",
-                color=Colour.gold(),
-            )
-            embed.add_field(name="ライフ", value=str(ito.get_life()), inline=True)
-            embed.add_field(name="レベル", value=str(ito.get_level()), inline=True)
-            embed.add_field(name="トークテーマ", value=ito.get_theme(), inline=False)
-            for player in players:
-                embed.add_field(
-                    name=player.get_name(),
-                    value=player.hand_to_string_close(),
-                    inline=True,
-                )
-            embed.set_footer(text=now)
+            embed = renderer.board("Put command", "手札がありません", Colour.gold())
             await ctx.send(embed=embed)
             return
 
         ito.receive_card(card_put)
-        count_penalty = 0
+        result = ito.resolve_put(card_put)
+        count_penalty = result.get_life_lost()
 
-        for player in players:
-            while player.has_smaller_card(card_put):
-                penalty = player.put_card()
-                ito.receive_card(penalty)
-                ito.decrease_life()
-                count_penalty += 1
+        # ゲームオーバー・ゲームクリアは盤面とは別に送信する
+        if (ito.is_gameover() or ito.is_cleared()) and session.has_board():
+            await session.get_board().close()
 
         if ito.is_gameover():
             logger.debug("Game over")
-            embed = Embed(
-                title="Game over",
-                description="小さいカードを場に出しました\nライフが0になりました\nゲームを終了します",
-                color=Colour.magenta(),
+            embed = renderer.board(
+                "Game over",
+                "小さいカードを場に出しました\nライフが0になりました\nゲームを終了します",
+                Colour.magenta(),
+                theme=False,
+                open=True,
             )
-            embed.add_field(name="ライフ", value="0", inline=True)
-            embed.add_field(name="レベル", value=str(ito.get_level()), inline=True)
-            for player in players:
-                embed.add_field(
-                    name=player.get_name(),
-                    value=player.hand_to_string_open(),
-                    inline=True,
-                )
-            embed.set_footer(text=now)
-            await ctx.send(embed=embed)
+            await self.announce(ctx, embed, f"{card_put}を出しました")
 
             ito.initialize_game()
+            metrics.GAMES.inc("lost")
             return
 
         if ito.is_cleared():
             logger.debug("Game clear")
-            embed = Embed(
-                title="Game clear",
-                description="ゲームをクリアしました！\nゲームを終了します",
-                color=Colour.green(),
+            embed = renderer.board(
+                "Game clear",
+                "ゲームをクリアしました！\nゲームを終了します",
+                Colour.green(),
+                theme=False,
+                open=True,
             )
-            embed.add_field(name="ライフ", value=str(ito.get_life()), inline=True)
-            embed.add_field(name="レベル", value=str(ito.get_level()), inline=True)
-            for player in players:
-                embed.add_field(
-                    name=player.get_name(),
-                    value=player.hand_to_string_open(),
-                    inline=True,
-                )
-            embed.set_footer(text=now)
-            await ctx.send(embed=embed)
+            await self.announce(ctx, embed, f"{card_put}を出しました")
 
             ito.initialize_game()
+            metrics.GAMES.inc("cleared")
             return
 
         if not ito.is_gameover() and 0 < count_penalty:
             logger.debug("Failure")
-            embed = Embed(
-                title="Failure",
-                description="失敗しました...\n小さいカードを場に出しました\n場に出された枚数分のライフを減らします\n次に小さいカードを場に出してください",
-                color=Colour.gold(),
-            )
-            embed.add_field(name="ライフ", value=str(ito.get_life()), inline=True)
-            embed.add_field(name="レベル", value=str(ito.get_level()), inline=True)
-            embed.add_field(name="トークテーマ", value=ito.get_theme(), inline=False)
-            for player in players:
-                embed.add_field(
-                    name=player.get_name(),
-                    value=player.hand_to_string_close(),
-                    inline=True,
+            penalties = [
+                f"{ito.get_player(player_id).get_name()}: "
+                + " ".join(str(card) for card in cards)
+                for player_id, cards in result.get_penalties().items()
+            ]
+            title = "Failure"
+            description = "失敗しました...\n小さいカードを場に出しました\n場に出された枚数分のライフを減らします\n次に小さいカードを場に出してください"
+            if LIVE_BOARD:
+                note = f"❌ {current_player.get_name()}: {card_put}"
+                note += f" (より小さいカード {' / '.join(penalties)})"
+                await self.update_board(
+                    ctx, session, title, description, Colour.gold(), note
                 )
-            embed.set_footer(text=now)
+                return
+            embed = renderer.board(
+                title,
+                description,
+                Colour.gold(),
+                extra=[
+                    render.field(
+                        f"{card_put}より小さいカード", "\n".join(penalties), False
+                    )
+                ],
+            )
             await ctx.send(embed=embed)
             return
 
         if count_penalty == 0:
             logger.debug("Success")
-            embed = Embed(
-                title="Success",
-                description="成功しました！\n次に小さいカードを場に出してください",
-                color=Colour.green(),
-            )
-            embed.add_field(name="ライフ", value=str(ito.get_life()), inline=True)
-            embed.add_field(name="レベル", value=str(ito.get_level()), inline=True)
-            embed.add_field(name="トークテーマ", value=ito.get_theme(), inline=False)
-            for player in players:
-                embed.add_field(
-                    name=player.get_name(),
-                    value=player.hand_to_string_close(),
-                    inline=True,
+            title = "Success"
+            description = "成功しました！\n次に小さいカードを場に出してください"
+            if LIVE_BOARD:
+                note = f"✅ {current_player.get_name()}: {card_put}"
+                await self.update_board(
+                    ctx, session, title, description, Colour.green(), note
                 )
-            embed.set_footer(text=now)
+                return
+            embed = renderer.board(title, description, Colour.green())
             await ctx.send(embed=embed)
             return
 
+    async def announce(self, ctx: commands.Context, embed, note: str):
+        """
+        ライブボードとは別に、全員に見えるメッセージを送信する
+        高速応答でライブボードを使う場合、/putへの応答は実行したプレイヤーだけに見えるため、
+        応答をnoteで済ませてから、2通目のフォローアップとして送信する
+
+        Parameters
+        ----------
+        ctx: commands.Context
+        embed: discord.Embed
+        note: str
+            実行したプレイヤーへの応答
+        """
+        if FAST_ACK and LIVE_BOARD and ctx.interaction is not None:
+            await ctx.send(note, ephemeral=True)
+        await ctx.send(embed=embed)
+
+    async def update_board(
+        self,
+        ctx: commands.Context,
+        session: Session,
+        title: str,
+        description: str,
+        colour: Colour,
+        note: str,
+    ):
+        """
+        /putの結果を盤面のメッセージに反映する
+        スラッシュコマンドの場合は、実行したプレイヤーだけに見える応答を返す
+
+        Parameters
+        ----------
+        ctx: commands.Context
+        session: Session
+        title: str
+        description: str
+        colour: Colour
+        note: str
+            盤面の履歴に追加する文字列
+        """
+        board = session.get_board(BOARD_DELAY)
+        board.update(self.bot, ctx.channel.id, title, description, colour, note)
+        if ctx.interaction is not None:
+            await ctx.send(note, ephemeral=True)
+
     @commands.hybrid_group(
         name="setting",
         description="Setting commands",
@@ -523,108 +847,112 @@ class MyCog(commands.Cog):
     )
     async def setting(self, ctx: commands.Context):
         cmds: set[commands.Command] = self.bot.commands
-        description = ""
-        for cmd in cmds:
-            description += f"`{cmd.name}` : {cmd.description}\n"
-        embed = Embed(
-            title="Settings",
-            description=description,
-            color=Colour.dark_blue(),
-        )
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed.set_footer(text=now)
+        description = "".join(f"`{cmd.name}` : {cmd.description}\n" for cmd in cmds)
+        embed = render.build("Settings", description, Colour.dark_blue(), [])
         await ctx.send(embed=embed)
 
     @setting.command(name="theme", description="テーマを設定します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
     async def set_theme(self, ctx: commands.Context, *, theme: str):
-        ito = self.ito
+        ito = self.get_ito(ctx)
         ito.set_theme(theme)
-        embed = Embed(
-            title="Set theme command",
-            description=f"トークテーマを設定しました",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Set theme command",
+            "トークテーマを設定しました",
+            Colour.dark_blue(),
+            [render.field("トークテーマ", ito.get_theme(), False)],
         )
-        embed.add_field(name="トークテーマ", value=ito.get_theme(), inline=False)
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @setting.command(name="channel", description="チャンネルを設定します")
-    @log_wrapper
-    @only_off_game
+    @game_command(Guard.OFF_GAME, register=False)
     async def set_channel(self, ctx: commands.Context):
-        ito = self.ito
+        ito = self.get_ito(ctx)
         ito.set_guild(ctx.guild)
         ito.set_channel(ctx.channel)
-        embed = Embed(
-            title="Set channel command",
-            description=f"チャンネルを設定しました",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Set channel command",
+            "チャンネルを設定しました",
+            Colour.dark_blue(),
+            [render.field("チャンネル", ito.get_channel_name(), False)],
         )
-        embed.add_field(name="チャンネル", value=ito.get_channel(), inline=False)
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @setting.command(name="life", description="ライフを設定します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
     async def set_life(self, ctx: commands.Context, *, life: int):
-        ito = self.ito
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
+        ito = self.get_ito(ctx)
         if life < 1 or 3 < life:
-            embed = Embed(
-                title="Set life command",
-                description="ライフは1~3の間で指定してね！",
-                color=Colour.gold(),
+            embed = render.build(
+                "Set life command", "ライフは1~3の間で指定してね！", Colour.gold(), []
             )
-            embed.set_footer(text=now)
             await ctx.send(embed=embed)
             return
 
         ito.set_life(life)
-        embed = Embed(
-            title="Set life command",
-            description=f"ライフを{life}に設定しました",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Set life command", f"ライフを{life}に設定しました", Colour.dark_blue(), []
         )
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
     @setting.command(name="level", description="レベルを設定します")
-    @log_wrapper
-    @channel_registerd_check
-    @only_in_channel
-    @only_off_game
-    @only_for_player
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
     async def set_level(self, ctx: commands.Context, *, level: int):
-        ito = self.ito
-        now = datetime.now().strftime("%Y/%m/%d %H:%M")
+        ito = self.get_ito(ctx)
         if level < 1 or 3 < level:
-            embed = Embed(
-                title="Set level command",
-                description="レベルは1~3の間で指定してね！",
-                color=Colour.gold(),
+            embed = render.build(
+                "Set level command", "レベルは1~3の間で指定してね！", Colour.gold(), []
             )
-            embed.set_footer(text=now)
             await ctx.send(embed=embed)
             return
 
         ito.set_level(level)
-        embed = Embed(
-            title="Set level command",
-            description=f"レベルを{level}に設定しました",
-            color=Colour.dark_blue(),
+        embed = render.build(
+            "Set level command",
+            f"レベルを{level}に設定しました",
+            Colour.dark_blue(),
+            [],
+        )
+        await ctx.send(embed=embed)
+
+    @setting.command(name="range", description="カードの範囲を設定します")
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
+    async def set_card_range(self, ctx: commands.Context, card_min: int, card_max: int):
+        ito = self.get_ito(ctx)
+        if card_min < 1 or card_max < card_min or CARD_LIMIT < card_max:
+            embed = render.build(
+                "Set range command",
+                f"カードの範囲は1~{CARD_LIMIT}の間で指定してね！",
+                Colour.gold(),
+                [],
+            )
+            await ctx.send(embed=embed)
+            return
+
+        ito.set_card_range(card_min, card_max)
+        embed = render.build(
+            "Set range command",
+            f"カードの範囲を{card_min}~{card_max}に設定しました",
+            Colour.dark_blue(),
+            [],
+        )
+        await ctx.send(embed=embed)
+
+    @setting.command(name="seed", description="カードを配るときのシードを設定します")
+    @game_command(Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
+    async def set_seed(self, ctx: commands.Context, *, seed: int | None = None):
+        ito = self.get_ito(ctx)
+        ito.set_seed(seed)
+        if seed is None:
+            description = "シードをランダムに戻しました"
+        else:
+            description = f"シードを{seed}に設定しました"
+        fields = list()
+        if ito.get_game_seed() is not None:
+            fields.append(render.field("前回のシード", str(ito.get_game_seed()), False))
+        embed = render.build(
+            "Set seed command", description, Colour.dark_blue(), fields
         )
-        embed.set_footer(text=now)
         await ctx.send(embed=embed)
 
 
@@ -0,0 +1,133 @@
+# スラッシュコマンドの同期
+
+# コマンドの定義からハッシュを計算し、前回同期したときのハッシュと
+# 同じであれば同期を省略する
+# ハッシュは同期する範囲 (全体 or サーバー) ごとにファイルに保存する
+
+import hashlib
+import json
+import os
+from discord import Object, app_commands
+from loguru import logger
+
+
+# 前回同期したハッシュを保存するファイルのパス
+DEFAULT_PATH = "sync_hash.json"
+
+
+def scope_key(tree: app_commands.CommandTree, guild: Object | None) -> str:
+    """
+    同期する範囲を表すキーを取得する
+    botごとに別のハッシュを保存するため、アプリケーションIDを含める
+
+    Parameters
+    ----------
+    tree: app_commands.CommandTree
+    guild: Object | None
+        サーバー (Noneの場合は全体)
+
+    Returns
+    -------
+    key: str
+        "application_id:global" or "application_id:guild_id"
+    """
+    scope = "global" if guild is None else str(guild.id)
+    return f"{tree.client.application_id}:{scope}"
+
+
+def tree_hash(tree: app_commands.CommandTree, guild: Object | None = None) -> str:
+    """
+    同期するコマンドの定義からハッシュを計算する
+    コマンドの順番には依存しない
+
+    Parameters
+    ----------
+    tree: app_commands.CommandTree
+    guild: Object | None
+        サーバー (Noneの場合は全体)
+
+    Returns
+    -------
+    hash: str
+    """
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load(path: str) -> dict[str, str]:
+    """
+    前回同期したハッシュを読み込む
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    hashes: dict
+        キー : scope_key()
+        値 : ハッシュ
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict()
+
+
+def save(path: str, hashes: dict[str, str]):
+    """
+    同期したハッシュを保存する
+    書き込み途中で停止してもファイルが壊れないように、一時ファイルから置き換える
+
+    Parameters
+    ----------
+    path: str
+    hashes: dict
+    """
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as file:
+        json.dump(hashes, file, indent=2, sort_keys=True)
+    os.replace(temp, path)
+
+
+async def sync_tree(
+    tree: app_commands.CommandTree,
+    guild: Object | None = None,
+    force: bool = False,
+    path: str = DEFAULT_PATH,
+) -> bool:
+    """
+    コマンドの定義が変わっている場合だけ同期する
+
+    Parameters
+    ----------
+    tree: app_commands.CommandTree
+    guild: Object | None
+        サーバー (Noneの場合は全体)
+    force: bool
+        True: 変わっていなくても同期する
+    path: str
+        ハッシュを保存するファイルのパス
+
+    Returns
+    -------
+    boolean
+        True: 同期した False: 省略した
+    """
+    key = scope_key(tree, guild)
+    digest = tree_hash(tree, guild)
+    hashes = load(path)
+    if not force and hashes.get(key) == digest:
+        logger.debug(f"Command sync skipped: {key}")
+        return False
+
+    await tree.sync(guild=guild)
+    hashes[key] = digest
+    save(path, hashes)
+    logger.debug(f"Command synced: {key}")
+    return True
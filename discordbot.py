@@ -1,19 +1,38 @@
 # 本体
 
+# 起動時間の計測 (他のモジュールより先に読み込む)
+import startup
+
 # 外部モジュールの読込み
+import asyncio
+from io import BytesIO
 from os import environ
 from functools import wraps
 from datetime import datetime
-from dotenv import load_dotenv
-from discord import Intents, Object, Embed, Colour, errors
-from discord.ext import commands
+from time import perf_counter
+
+with startup.phase("import dotenv"):
+    from dotenv import load_dotenv
+with startup.phase("import discord"):
+    from discord import Object, Embed, Colour, File, errors
+    from discord.ext import commands
 
 
 # ----------
 # ロガー
 # ----------
 
-from loguru import logger
+with startup.phase("import loguru"):
+    import log
+    from loguru import logger
+
+log.setup()
+
+import command_sync
+import gateway_config
+import metrics
+import profiler
+from cluster import ClusterClient
 
 
 # ----------
@@ -21,7 +40,8 @@ from loguru import logger
 # ----------
 
 # 環境変数の読込み
-load_dotenv()
+with startup.phase("load .env"):
+    load_dotenv()
 
 # BOTのアクセストークン
 TOKEN = environ["TOKEN"]
@@ -35,17 +55,57 @@ GUILD_ID = int(environ["GUILD_ID"])
 # "ito-bot-test"のチャンネルID
 CHANNEL_ID = int(environ["CHANNEL_ID"])
 
+# シャード数 (指定しない場合はシャーディングしない、"auto"の場合はDiscordの推奨値)
+SHARDS = environ.get("SHARDS")
+
+# クラスタのソケットとワーカーの番号 (cluster.pyから起動した場合のみ設定される)
+CLUSTER_SOCKET = environ.get("CLUSTER_SOCKET")
+CLUSTER_ID = int(environ.get("CLUSTER_ID", 0))
+
+# このプロセスが担当するシャード (指定しない場合はすべて)
+SHARD_IDS = environ.get("SHARD_IDS")
+
+# 前回同期したスラッシュコマンドのハッシュを保存するファイル
+SYNC_HASH_PATH = environ.get("SYNC_HASH_PATH", command_sync.DEFAULT_PATH)
+
+# メトリクスを公開するポート (指定しない場合は公開しない)
+# クラスタの場合はワーカーの番号を足したポートで公開する
+METRICS_PORT = environ.get("METRICS_PORT")
+METRICS_HOST = environ.get("METRICS_HOST", "127.0.0.1")
+
+# スラッシュ専用モード (メッセージを受信せず、スラッシュコマンドだけで動かす)
+SLASH_ONLY = environ.get("SLASH_ONLY", "0") == "1"
+
 
 # ----------
 # インスタンス生成
 # ----------
 
 # discord.py関連
-intents = Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="/", intents=intents)
+options = gateway_config.bot_options(SLASH_ONLY)
+if SHARDS is None:
+    bot = commands.Bot(**options)
+else:
+    # 各シャードは順番に接続し、すべてのシャードの接続後にon_readyが呼ばれる
+    bot = commands.AutoShardedBot(
+        **options,
+        shard_count=None if SHARDS == "auto" else int(SHARDS),
+        shard_ids=None if SHARD_IDS is None else list(map(int, SHARD_IDS.split(","))),
+    )
 bot.owner_ids = [ADMIN_ID]
 
+# クラスタのコーディネーターとの接続
+cluster: ClusterClient | None = None
+
+# True: 停止中
+closing = False
+
+# メトリクスのHTTPサーバー
+metrics_runner = None
+
+# プロファイリングの結果を送信するタスク
+profile_task: asyncio.Task | None = None
+
 
 # ----------
 # 起動時に動作する処理
@@ -55,29 +115,69 @@ bot.owner_ids = [ADMIN_ID]
 # Cogの読込み
 @bot.event
 async def setup_hook():
+    # ログインが完了してから呼び出される
+    startup.mark("login")
+    global cluster, metrics_runner
+    if METRICS_PORT is not None:
+        port = int(METRICS_PORT) + CLUSTER_ID
+        metrics_runner = await metrics.start_server(METRICS_HOST, port)
+        metrics.GATEWAY_LATENCY.set_function(gateway_latencies)
+        bot.add_listener(count_gateway_event, "on_socket_event_type")
+        logger.info(f"Metrics: http://{METRICS_HOST}:{port}/metrics")
+    if CLUSTER_SOCKET is not None:
+        cluster = await ClusterClient.connect(
+            CLUSTER_SOCKET, CLUSTER_ID, run_cluster_command
+        )
     try:
-        await bot.load_extension("cog")
+        with startup.phase("load extension cog"):
+            await bot.load_extension("cog")
         logger.debug("Cog loaded!")
     except errors.Forbidden:
         logger.debug("Failed to load extension")
 
 
+# スラッシュ専用モードではメッセージをコマンドとして解析しない
+if SLASH_ONLY:
+
+    @bot.event
+    async def on_message(message):
+        pass
+
+
+# シャードごとの接続完了を記録
+@bot.event
+async def on_shard_ready(shard_id: int):
+    startup.mark(f"shard {shard_id} ready")
+    logger.debug(f"Shard {shard_id} ready")
+
+
 # コマンドを同期
 @bot.event
 async def on_ready():
     GUILD = Object(GUILD_ID)
 
-    # スラッシュコマンドを同期
-    await bot.tree.sync()
+    ready = startup.mark("ready")
+    if ready:
+        mode = "slash only" if SLASH_ONLY else "default"
+        logger.info(f"Gateway mode: {mode} (intents: {bot.intents.value})")
+
+    # スラッシュコマンドを同期 (再接続時など、変わっていない場合は省略)
+    # クラスタの場合は最初のワーカーだけが同期する
+    if CLUSTER_ID == 0:
+        with startup.phase("command sync"):
+            await command_sync.sync_tree(bot.tree, path=SYNC_HASH_PATH)
     bot.tree.copy_global_to(guild=GUILD)
 
+    # 初回のみ起動時間を出力
+    if ready:
+        logger.info(startup.report())
+
     # 標準出力にログを出力
     logger.debug("Login succeeded!")
     command_set: set[commands.Command] = bot.commands
     command_list: list = [command.name for command in command_set]
     description = "\n".join(command_list)
     logger.debug(description)
-    print("--------")
 
 
 # --------
@@ -89,12 +189,23 @@ async def on_ready():
 def log_wrapper(func):
     @wraps(func)
     async def decorator(*args, **kwargs):
-        now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-        logger.debug(now)
+        start = perf_counter()
         ctx: commands.Context = args[0]
-        logger.debug(f"{func.__name__} command from {ctx.author}")
-        return_value = await func(*args, **kwargs)
-        print("--------")
+        guild_id = ctx.guild.id if ctx.guild is not None else None
+        command_logger = logger.bind(command=func.__name__, guild=guild_id)
+        command_logger.debug(f"{func.__name__} command from {ctx.author}")
+        try:
+            with profiler.track(func.__name__):
+                return_value = await func(*args, **kwargs)
+        except Exception:
+            metrics.COMMAND_ERRORS.inc(func.__name__)
+            raise
+        elapsed = perf_counter() - start
+        metrics.COMMAND_DURATION.observe(elapsed, func.__name__)
+        latency = round(elapsed * 1000, 2)
+        command_logger.bind(latency_ms=latency).info(f"{func.__name__} command done")
+        if startup.mark("first command"):
+            logger.info(startup.report())
         return return_value
 
     return decorator
@@ -156,23 +267,95 @@ async def inu(ctx: commands.Context):
 @log_wrapper
 @only_for_admin
 async def reload(ctx: commands.Context):
+    # クラスタの場合はすべてのワーカーでリロードする
+    if cluster is not None:
+        await cluster.broadcast("reload")
+        description = "すべてのワーカーにリロードを依頼しました"
+    else:
+        await reload_cog()
+        description = "コマンドをリロードしました"
+    embed = Embed(
+        title="Reload command",
+        description=description,
+        color=Colour.dark_blue(),
+    )
+    now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    embed.set_footer(text=now)
+    await ctx.send(embed=embed)
+
+
+# スラッシュコマンドを強制的に同期
+@bot.hybrid_command(name="sync", description="コマンドを強制的に同期します (admin only)")
+@log_wrapper
+@only_for_admin
+async def sync(ctx: commands.Context):
     GUILD = Object(GUILD_ID)
-    await bot.reload_extension("cog")
-    await bot.tree.sync()
+    await command_sync.sync_tree(bot.tree, force=True, path=SYNC_HASH_PATH)
     bot.tree.copy_global_to(guild=GUILD)
     embed = Embed(
-        title="Reload command",
-        description="コマンドをリロードしました",
+        title="Sync command",
+        description="コマンドを同期しました",
         color=Colour.dark_blue(),
     )
     now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
     embed.set_footer(text=now)
     await ctx.send(embed=embed)
 
-    command_set: set[commands.Command] = bot.commands
-    command_list: list = [command.name for command in command_set]
-    description = "\n".join(command_list)
-    logger.debug(description)
+
+# シャードごとの状態を表示
+@bot.hybrid_command(name="shards", description="シャードの状態を表示します (admin only)")
+@log_wrapper
+@only_for_admin
+async def shards(ctx: commands.Context):
+    embed = Embed(
+        title="Shards command",
+        description=f"シャード数: {bot.shard_count or 1}",
+        color=Colour.dark_blue(),
+    )
+    cog = bot.get_cog("MyCog")
+    stats = cog.sessions.get_shard_stats() if cog is not None else dict()
+    latencies = dict(bot.latencies) if SHARDS is not None else {0: bot.latency}
+    for shard_id in sorted(set(latencies) | set(stats)):
+        shard_stats = stats.get(shard_id)
+        value = f"ゲートウェイ: {latencies.get(shard_id, 0) * 1000:.0f}ms"
+        if shard_stats is not None:
+            value += (
+                f"\nセッション: {shard_stats['sessions']}"
+                f"\n待ち: {shard_stats['waiting']}"
+                f"\nコマンド: {shard_stats['rate']:.0f}/分"
+                f"\n平均: {shard_stats['latency_avg'] * 1000:.0f}ms"
+                f"\n最大: {shard_stats['latency_max'] * 1000:.0f}ms"
+            )
+        embed.add_field(name=f"Shard {shard_id}", value=value)
+    now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    embed.set_footer(text=now)
+    await ctx.send(embed=embed)
+
+
+# コマンドのプロファイリング
+@bot.hybrid_command(
+    name="profile", description="コマンドのプロファイルを取得します (admin only)"
+)
+@log_wrapper
+@only_for_admin
+async def profile(ctx: commands.Context, seconds: int = 60, count: int = 0):
+    global profile_task
+    if profiler.is_active():
+        description = "プロファイリング中です"
+    else:
+        session = profiler.start(seconds, count or None)
+        profile_task = asyncio.create_task(send_profile(ctx.channel, session))
+        description = f"プロファイリングを開始しました\n最大{seconds}秒"
+        if count:
+            description += f"、{count}回のコマンド"
+    embed = Embed(
+        title="Profile command",
+        description=description,
+        color=Colour.dark_blue(),
+    )
+    now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+    embed.set_footer(text=now)
+    await ctx.send(embed=embed)
 
 
 # botを停止
@@ -187,9 +370,92 @@ async def quit(ctx: commands.Context):
     embed.set_footer(text=now)
     await ctx.send(embed=embed)
 
+    # クラスタの場合はすべてのワーカーを停止する
+    if cluster is not None:
+        await cluster.broadcast("quit")
+    else:
+        await shutdown()
+
+
+# ----------
+# リロード・停止
+# ----------
+
+
+# Cogのコマンドが残っているうちに、実行中のコマンドを待ってセッションを書き出す
+# (失敗した場合は例外を送出し、Cogはそのまま動き続ける)
+async def prepare_unload():
+    cog = bot.get_cog("MyCog")
+    if cog is not None:
+        await cog.prepare_unload()
+
+
+# Cogをリロードする
+async def reload_cog():
+    GUILD = Object(GUILD_ID)
+    await prepare_unload()
+    await bot.reload_extension("cog")
+    if CLUSTER_ID == 0:
+        await command_sync.sync_tree(bot.tree, path=SYNC_HASH_PATH)
+    bot.tree.copy_global_to(guild=GUILD)
+
+    command_set: set[commands.Command] = bot.commands
+    command_list: list = [command.name for command in command_set]
+    description = "\n".join(command_list)
+    logger.debug(description)
+
+
+# botを停止する
+async def shutdown():
+    # 停止中に重ねて呼ばれた場合は何もしない
+    global closing
+    if closing:
+        return
+    closing = True
+
+    # 実行中のコマンドが終わるのを待ち、ゲームを保存してから停止する
+    # (書き出しに失敗しても、変更は保存先に保存してから停止する)
+    if "cog" in bot.extensions:
+        try:
+            await prepare_unload()
+        except Exception:
+            logger.warning("Stopping without handoff")
+        await bot.unload_extension("cog")
+    if cluster is not None:
+        await cluster.close()
+    if metrics_runner is not None:
+        await metrics.stop_server(metrics_runner)
     logger.debug("Logout")
-    print("--------")
     await bot.close()
+    await log.shutdown()
+
+
+# プロファイリングが終わったら結果をファイルで送信する
+async def send_profile(channel, session: profiler.Profile):
+    await session.wait()
+    report = session.report()
+    logger.info("Profile finished")
+    await channel.send(file=File(BytesIO(report.encode()), filename="profile.txt"))
+
+
+# シャードごとのゲートウェイの遅延 (メトリクス用)
+def gateway_latencies() -> dict[tuple[str], float]:
+    latencies = dict(bot.latencies) if SHARDS is not None else {0: bot.latency}
+    return {(str(shard_id),): latency for shard_id, latency in latencies.items()}
+
+
+# 受信したゲートウェイのイベントを数える (メトリクス用)
+async def count_gateway_event(event_type: str):
+    metrics.GATEWAY_EVENTS.inc(event_type)
+
+
+# コーディネーターから届いたコマンドを実行する
+async def run_cluster_command(command: str):
+    logger.debug(f"Cluster command: {command}")
+    if command == "reload":
+        await reload_cog()
+    elif command == "quit":
+        await shutdown()
 
 
 # ----------
@@ -198,4 +464,5 @@ async def quit(ctx: commands.Context):
 
 
 # Botの起動とDiscordサーバーへの接続
-bot.run(TOKEN)
+# discord.pyのログもlog.setup()で設定した出力先に出す
+bot.run(TOKEN, log_handler=None)
@@ -0,0 +1,7 @@
+# ゲームエンジン
+
+# itoのルールをdiscordに依存せずに扱うパッケージ
+# プレイヤーは整数のIDと名前で表す
+
+from engine.game import Game, PutResult, CARD_MIN, CARD_MAX, SNAPSHOT_VERSION
+from engine.player import Player
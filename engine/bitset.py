@@ -0,0 +1,93 @@
+# ビット集合
+
+# カードの集合を整数のビットで表す
+# カード番号nはn番目のビットに対応する
+# 最小のカードや、あるカードより小さいカードの有無をビット演算で求める
+
+
+def bit(card: int) -> int:
+    """
+    カード1枚だけを含む集合を取得する
+
+    Parameters
+    ----------
+    card: int
+        カード
+
+    Returns
+    -------
+    mask: int
+    """
+    return 1 << card
+
+
+def below(card: int) -> int:
+    """
+    カードより小さいカードをすべて含む集合を取得する
+
+    Parameters
+    ----------
+    card: int
+        カード
+
+    Returns
+    -------
+    mask: int
+    """
+    return (1 << card) - 1
+
+
+def lowest(mask: int) -> int | None:
+    """
+    集合の中で最小のカードを取得する
+
+    Parameters
+    ----------
+    mask: int
+        カードの集合
+
+    Returns
+    -------
+    card: int | None
+        最小のカード (集合が空の場合はNone)
+    """
+    if mask == 0:
+        return None
+    return (mask & -mask).bit_length() - 1
+
+
+def cards(mask: int) -> list[int]:
+    """
+    集合に含まれるカードを小さい順に取得する
+
+    Parameters
+    ----------
+    mask: int
+        カードの集合
+
+    Returns
+    -------
+    cards: list[int]
+    """
+    result: list[int] = list()
+    while mask:
+        low = mask & -mask
+        result.append(low.bit_length() - 1)
+        mask ^= low
+    return result
+
+
+def count(mask: int) -> int:
+    """
+    集合に含まれるカードの枚数を取得する
+
+    Parameters
+    ----------
+    mask: int
+        カードの集合
+
+    Returns
+    -------
+    count: int
+    """
+    return mask.bit_count()
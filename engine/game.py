@@ -0,0 +1,722 @@
+# ゲームエンジン
+
+# itoのルール (カードを配る・場に出す・勝敗) だけを扱うクラス
+# discordに依存せず、プレイヤーは整数のIDと名前で表す
+# discordのサーバー・チャンネルとの対応はito.Itoで行う
+
+from bisect import bisect_left
+from logging import getLogger, DEBUG
+import random
+from engine import bitset
+from engine.player import Player
+
+
+# ----------
+# ロガー
+# ----------
+
+
+# 出力先はlog.setup()で設定する
+logger = getLogger(__name__)
+
+# 配られた手札のログを出力する頻度 (N回に1回)
+HAND_LOG_SAMPLE = 10
+
+
+# ----------
+# 定数
+# ----------
+
+# カードの範囲 (デフォルト)
+CARD_MIN = 1
+CARD_MAX = 100
+
+# カードの最大値の上限
+# (手札・場は配られたカードの順位をビットの位置にして持つため、
+# 範囲の大きさは所要時間・メモリに影響しない)
+CARD_LIMIT = 10_000_000
+
+# ゲームごとのシードのビット数
+# (Discordの整数のオプションは±2^53までのため、/setting seedで指定できる範囲にする)
+SEED_BITS = 53
+
+# 保存形式のバージョン
+# 1: ビットの位置がカードの値
+# 2: ビットの位置が配られたカードの順位 (カードの値はcardsに保存する)
+SNAPSHOT_VERSION = 2
+
+# ゲームごとのシードを生成する乱数生成器
+# (Randomは1つあたり約2.5KBあるため、すべてのゲームで共有する)
+_seed_random = random.Random()
+
+
+def _to_ranks(mask: int, cards: list[int]) -> int:
+    """
+    カードの値をビットの位置にしたbitset (保存形式1) を、
+    配られたカードの順位をビットの位置にしたbitsetに変換する
+
+    Parameters
+    ----------
+    mask: int
+        カードの値をビットの位置にしたbitset
+    cards: list[int]
+        配られたカードの値 (小さい順)
+
+    Returns
+    -------
+    mask: int
+    """
+    ranks = 0
+    for card in bitset.cards(mask):
+        ranks |= bitset.bit(bisect_left(cards, card))
+    return ranks
+
+
+class PutResult:
+    """
+    カードを場に出した結果
+
+    Attributes
+    ----------
+    __card : int
+        場に出されたカード
+    __penalties : dict
+        キー : プレイヤーID
+        値 : 場に出されたカードより小さかったため捨てられたカードのリスト
+    __life_lost : int
+        減ったライフ
+    """
+
+    __slots__ = ("__card", "__penalties", "__life_lost")
+
+    def __init__(self, card: int, penalties: dict[int, list[int]], life_lost: int):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        card: int
+            場に出されたカード
+        penalties: dict
+            プレイヤーごとの捨てられたカード
+        life_lost: int
+            減ったライフ
+        """
+        self.__card: int = card
+        self.__penalties: dict[int, list[int]] = penalties
+        self.__life_lost: int = life_lost
+
+    def get_card(self) -> int:
+        """
+        場に出されたカードを取得する
+
+        Returns
+        -------
+        card: int
+        """
+        return self.__card
+
+    def get_penalties(self) -> dict[int, list[int]]:
+        """
+        プレイヤーごとの捨てられたカードを取得する
+
+        Returns
+        -------
+        penalties: dict[int, list[int]]
+        """
+        return self.__penalties
+
+    def get_life_lost(self) -> int:
+        """
+        減ったライフを取得する
+
+        Returns
+        -------
+        life_lost: int
+        """
+        return self.__life_lost
+
+
+class Game:
+    """
+    ゲームエンジン
+
+    Attributes
+    -------------------
+    __players : dict
+        プレイヤーのdict
+        キー : プレイヤーID
+        値 : Player
+    __life : int = 3
+        ライフ
+    __level : int = 1
+        レベル (各プレイヤーに配るカードの枚数)
+    __cards : list[int]
+        配られたカードの値 (小さい順、プレイヤーと共有する)
+        bitsetのn番目のビットはn番目に小さいカードを表す
+    __unplayed : int
+        場に出されていないカードの集合 (bitset)
+    __card_min : int = 1
+        カードの最小値
+    __card_max : int = 100
+        カードの最大値
+    __seed : int | None
+        固定するシード (Noneの場合はゲームごとに生成する)
+    __game_seed : int | None
+        直前に配ったカードのシード
+    __theme : str
+        トークテーマ
+    __ongoing : bool
+        ゲーム中フラグ (True : ゲーム中)
+    __version : int
+        状態の番号 (状態が変わるたびに増える)
+    """
+
+    # セッションの数だけ作られるため、__dict__を持たせない
+    # カードの持ち主などカードごとの情報は持たず、プレイヤーの手札のbitsetから求める
+    __slots__ = (
+        "__players",
+        "__life",
+        "__level",
+        "__cards",
+        "__unplayed",
+        "__card_min",
+        "__card_max",
+        "__seed",
+        "__game_seed",
+        "__theme",
+        "__ongoing",
+        "__version",
+    )
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.__players: dict[int:Player] = dict()
+        self.__life: int = 3
+        self.__level: int = 1
+        self.__cards: list[int] = list()
+        self.__unplayed: int = 0
+        self.__card_min: int = CARD_MIN
+        self.__card_max: int = CARD_MAX
+        self.__seed: int | None = None
+        self.__game_seed: int | None = None
+        self.__theme: str = "トークテーマを設定してください"
+        self.__ongoing: bool = False
+        self.__version: int = 0
+
+    # ----------
+    # setter
+    # ----------
+
+    def set_life(self, life: int):
+        """
+        ライフを設定する
+
+        Parameters
+        ----------
+        life: int
+            ライフ
+        """
+        self.__version += 1
+        self.__life = life
+
+    def set_level(self, level: int):
+        """
+        レベルを設定する
+
+        Parameters
+        ----------
+        level: int
+            レベル
+        """
+        self.__version += 1
+        self.__level = level
+
+    def set_card_range(self, card_min: int, card_max: int):
+        """
+        カードの範囲を設定する
+
+        Parameters
+        ----------
+        card_min: int
+            カードの最小値
+        card_max: int
+            カードの最大値
+
+        Raises
+        ------
+        ValueError
+            範囲が不正 (最大値がCARD_LIMITより大きい場合も含む)
+        """
+        if card_min < 0 or card_max < card_min or CARD_LIMIT < card_max:
+            raise ValueError(f"Invalid card range: {card_min}~{card_max}")
+        self.__card_min = card_min
+        self.__card_max = card_max
+
+    def set_seed(self, seed: int | None):
+        """
+        カードを配るときのシードを設定する
+        同じシード・同じプレイヤーで同じ手札が配られる
+
+        Parameters
+        ----------
+        seed: int | None
+            シード (Noneの場合はゲームごとにランダム)
+        """
+        self.__seed = seed
+
+    def set_theme(self, theme: str):
+        """
+        トークテーマを設定する
+
+        Parameters
+        ----------
+        theme: str
+            トークテーマ
+        """
+        self.__version += 1
+        self.__theme = theme
+
+    def start_game(self):
+        """
+        ゲームを開始する
+        """
+        self.__version += 1
+        self.__ongoing = True
+
+    def end_game(self):
+        """
+        ゲームを終了する
+        """
+        self.__version += 1
+        self.__ongoing = False
+
+    # ----------
+    # getter
+    # ----------
+
+    def get_players(self) -> dict[int:Player]:
+        """
+        プレイヤーを取得する
+
+        Returns
+        -------
+        players: dict[int: Player]
+        """
+        return self.__players
+
+    def get_player(self, id: int) -> Player:
+        """
+        プレイヤーを取得する
+
+        Returns
+        -------
+        player: Player
+        """
+        return self.__players[id]
+
+    def get_player_id_list(self) -> list[int]:
+        """
+        プレイヤーIDのリストを取得する
+
+        Returns
+        -------
+        player_id_list: dict_keys
+        """
+        return list(self.__players.keys())
+
+    def get_player_name_list(self) -> list[str]:
+        """
+        プレイヤー名のリストを取得する
+
+        Returns
+        -------
+        player_name_list: list[str]
+        """
+        players: list[Player] = list(self.__players.values())
+        return [player.get_name() for player in players]
+
+    def get_life(self) -> int:
+        """
+        ライフを取得する
+
+        Returns
+        -------
+        life: int
+        """
+        return self.__life
+
+    def get_level(self) -> int:
+        """
+        レベルを取得する
+
+        Returns
+        -------
+        level: int
+        """
+        return self.__level
+
+    def get_theme(self) -> str:
+        """
+        トークテーマを取得する
+
+        Returns
+        -------
+        theme: str
+        """
+        return self.__theme
+
+    def get_card_range(self) -> tuple[int, int]:
+        """
+        カードの範囲を取得する
+
+        Returns
+        -------
+        card_range: tuple[int, int]
+            (最小値, 最大値)
+        """
+        return self.__card_min, self.__card_max
+
+    def get_seed(self) -> int | None:
+        """
+        設定されているシードを取得する
+
+        Returns
+        -------
+        seed: int | None
+        """
+        return self.__seed
+
+    def get_game_seed(self) -> int | None:
+        """
+        直前に配ったカードのシードを取得する
+        set_seed()に渡すと同じ手札を再現できる
+
+        Returns
+        -------
+        game_seed: int | None
+        """
+        return self.__game_seed
+
+    def get_deck(self) -> dict[int, bool]:
+        """
+        カードを取得する
+
+        Returns
+        -------
+        deck: dict
+            キー : カード番号
+            場札フラグ : bool (True : 場に出されている)
+        """
+        unplayed = self.__unplayed
+        return {
+            card: not unplayed >> rank & 1 for rank, card in enumerate(self.__cards)
+        }
+
+    def get_version(self) -> int:
+        """
+        状態の番号を取得する
+        状態が変わるたびに増える
+
+        Returns
+        -------
+        version: int
+        """
+        return self.__version
+
+    def is_ongoing(self) -> bool:
+        """
+        ゲーム中か判定する
+
+        Returns
+        -------
+        boolean
+            True: ゲーム中
+            False: ゲーム中ではない
+        """
+        return self.__ongoing
+
+    # ----------
+    # ito関連
+    # ----------
+
+    def add_player(self, id: int, name: str):
+        """
+        プレイヤーを登録する
+
+        Parameters
+        ----------
+        id: int
+            プレイヤーID
+        name: str
+            プレイヤー名
+        """
+        self.__version += 1
+        self.__players[id] = Player(id, name)
+
+    def remove_player(self, id: int):
+        """
+        プレイヤーを削除する
+
+        Parameters
+        ----------
+        id: int
+            プレイヤーID
+
+        Raises
+        ------
+        KeyError
+            プレイヤーが登録されていない
+        """
+        self.__version += 1
+
+        try:
+            del self.__players[id]
+        except KeyError:
+            raise KeyError(f"Player not found: {id}")
+
+    def bump_version(self):
+        """
+        状態の番号を進める
+        ゲームの外の情報 (チャンネルなど) が変わったときに表示を更新するために使う
+        """
+        self.__version += 1
+
+    # カードを生成してプレイヤーに配る
+    def deal_cards(self):
+        """
+        カードを生成してプレイヤーに配る
+        場を生成する
+        """
+        self.__version += 1
+
+        players: list[Player] = list(self.__players.values())
+        level = self.__level
+        number_of_cards: int = len(players) * level
+
+        # 範囲内のカードが足りない場合は例外
+        card_range = range(self.__card_min, self.__card_max + 1)
+        if len(card_range) < number_of_cards:
+            raise ValueError(
+                f"Not enough cards: {number_of_cards} > {len(card_range)}"
+            )
+
+        # ゲームのシードを決めて、全員分のカードを一度に引く
+        if self.__seed is not None:
+            self.__game_seed = self.__seed
+        else:
+            self.__game_seed = _seed_random.getrandbits(SEED_BITS)
+        cards = random.Random(self.__game_seed).sample(card_range, number_of_cards)
+
+        # 配られたカードだけに小さい順に番号を付け、その番号でbitsetを作る
+        values = sorted(cards)
+        self.__cards = values
+        self.__unplayed = bitset.below(number_of_cards)
+
+        # 引いたカードをレベル数ずつプレイヤーに配る
+        for index, player in enumerate(players):
+            player.set_values(values)
+            player.receive_cards(cards[index * level : (index + 1) * level])
+
+        # ログ出力 (手札の一覧は間引いて出力する)
+        logger.debug(f"Cards dealt (seed: {self.__game_seed})")
+        if logger.isEnabledFor(DEBUG):
+            hands = ", ".join(
+                f"{player.get_name()}: {player.hand_to_string_open()}"
+                for player in players
+            )
+            logger.debug(f"Hands: {hands}", extra={"sample": HAND_LOG_SAMPLE})
+
+    def receive_card(self, card: int):
+        """
+        カードを受け取る
+
+        Parameters
+        ----------
+        card: int
+            カード
+        """
+        self.__version += 1
+        rank = bisect_left(self.__cards, card)
+        if rank < len(self.__cards) and self.__cards[rank] == card:
+            self.__unplayed &= ~bitset.bit(rank)
+
+    def resolve_put(self, card_put: int) -> PutResult:
+        """
+        場に出されたカードより小さいカードをすべて捨てさせ、
+        捨てられた枚数分のライフを減らす
+
+        Parameters
+        ----------
+        card_put: int
+            場に出されたカード
+
+        Returns
+        -------
+        result: PutResult
+        """
+        self.__version += 1
+        # 場に出されていないカードの中で場に出されたカードより小さいもの
+        below = self.__unplayed & bitset.below(bisect_left(self.__cards, card_put))
+        if not below:
+            return PutResult(card_put, dict(), 0)
+
+        # 各プレイヤーの手札から捨てさせる (最小のカードが小さいプレイヤーから並べる)
+        cards = self.__cards
+        discarded: list[tuple[int, int, list[int]]] = list()
+        for player_id, player in self.__players.items():
+            mask = player.discard_below(card_put)
+            if mask:
+                values = [cards[rank] for rank in bitset.cards(mask)]
+                discarded.append((values[0], player_id, values))
+        discarded.sort()
+        penalties = {player_id: cards for _, player_id, cards in discarded}
+
+        life_lost = bitset.count(below)
+        self.__unplayed ^= below
+        self.__life -= life_lost
+
+        return PutResult(card_put, penalties, life_lost)
+
+    def is_minimun(self, card_put: int) -> bool:
+        """
+        場に出されたカードが
+        場に出ていないカードの中で
+        最小か判定する
+
+        Parameters
+        ----------
+        card: int
+            カード
+
+        Returns
+        -------
+        boolean
+            True: 最小 False: 最小ではない
+        """
+        rank = bitset.lowest(self.__unplayed)
+        return rank is not None and card_put == self.__cards[rank]
+
+    def decrease_life(self):
+        """
+        ライフを減らす
+        """
+        self.__version += 1
+        self.__life -= 1
+
+    def is_gameover(self) -> bool:
+        """
+        ゲームオーバーになっているか判定する
+
+        Returns
+        -------
+        boolean
+            True: ゲームオーバー
+            False: ゲームオーバーしていない
+        """
+        if self.__life > 0:
+            return False
+        else:
+            return True
+
+    def is_cleared(self) -> bool:
+        """
+        ゲームクリアになっているか判定する
+
+        Returns
+        -------
+        boolean
+            True: ゲームがクリアしている
+            False: ゲームがクリアしていない
+        """
+        return self.__unplayed == 0
+
+    # ----------
+    # 保存
+    # ----------
+
+    def to_snapshot(self) -> dict:
+        """
+        ゲームの状態を保存用に変換する
+
+        Returns
+        -------
+        snapshot: dict
+        """
+        return {
+            "v": SNAPSHOT_VERSION,
+            "life": self.__life,
+            "level": self.__level,
+            "theme": self.__theme,
+            "ongoing": self.__ongoing,
+            "range": [self.__card_min, self.__card_max],
+            "seed": self.__seed,
+            "game_seed": self.__game_seed,
+            "cards": self.__cards,
+            "unplayed": f"{self.__unplayed:x}",
+            "players": [player.to_snapshot() for player in self.__players.values()],
+        }
+
+    def restore(self, snapshot: dict, player_ids: set[int] | None = None):
+        """
+        保存したゲームの状態を復元する
+        残すプレイヤーを指定した場合は、それ以外のプレイヤーとそのカードを除外する
+
+        Parameters
+        ----------
+        snapshot: dict
+            to_snapshot()で作成したdict
+        player_ids: set[int] | None
+            残すプレイヤーID (Noneの場合はすべて残す)
+        """
+        self.__version += 1
+        self.__life = snapshot["life"]
+        self.__level = snapshot["level"]
+        self.__theme = snapshot["theme"]
+        self.__ongoing = snapshot["ongoing"]
+        self.__card_min, self.__card_max = snapshot["range"]
+        self.__seed = snapshot["seed"]
+        self.__game_seed = snapshot["game_seed"]
+        if snapshot["v"] < 2:
+            # 保存形式1はカードの値がビットの位置なので、順位に変換する
+            cards = bitset.cards(int(snapshot["deck"], 16))
+        else:
+            cards = snapshot["cards"]
+        self.__cards = cards
+
+        def load(mask: str) -> int:
+            mask = int(mask, 16)
+            if snapshot["v"] < 2:
+                return _to_ranks(mask, cards)
+            return mask
+
+        self.__unplayed = load(snapshot["unplayed"])
+
+        self.__players.clear()
+        for player_id, name, dealt, hand in snapshot["players"]:
+            dealt = load(dealt)
+            if player_ids is not None and player_id not in player_ids:
+                # 見つからなかったプレイヤーのカードは場に出たことにする
+                logger.debug(f"Player not found: {name}")
+                self.__unplayed &= ~dealt
+                continue
+
+            player = Player(player_id, name)
+            player.set_values(cards)
+            player.restore_hand(dealt, load(hand))
+            self.__players[player_id] = player
+
+    def initialize_game(self):
+        """
+        ゲームをリセットする
+        """
+        self.__version += 1
+        self.__life = 3
+        self.__cards = list()
+        self.__unplayed = 0
+        self.__ongoing = False
+        players: list[Player] = list(self.__players.values())
+        for player in players:
+            player.reset_hand()
@@ -0,0 +1,370 @@
+# プレイヤークラス
+
+# プレイヤーのIDと名前と
+# 手札情報を格納するクラス
+
+# 2024/01/23 hand_to_string_dm()を追加
+# 2024/01/23 hand_to_string_channel()を追加
+
+from bisect import bisect_left
+from engine import bitset
+
+
+class Player:
+    """
+    プレイヤー
+
+    Attributes
+    ----------
+    __id : int
+        プレイヤーID (discord.Member.id)
+    __name : str
+        プレイヤー名
+    __values : list[int] | None
+        ゲームで配られたカードの値 (小さい順、ゲームと共有する)
+        bitsetのn番目のビットはn番目に小さいカードを表す
+        (Noneの場合はカードの値そのものをビットの位置にする)
+    __dealt : int
+        配られたカードの集合 (bitset)
+    __hand : int
+        手札に入っているカードの集合 (bitset)
+    __open_string : str | None
+        hand_to_string_open()のキャッシュ
+    __close_string : str | None
+        hand_to_string_close()のキャッシュ
+    """
+
+    # セッションの数だけ作られるため、__dict__を持たせない
+    __slots__ = (
+        "__id",
+        "__name",
+        "__values",
+        "__dealt",
+        "__hand",
+        "__open_string",
+        "__close_string",
+    )
+
+    def __init__(self, id: int, name: str):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        id: int
+            プレイヤーID
+        name: str
+            プレイヤー名
+        """
+        self.__id: int = id
+        self.__name: str = name
+
+        # ゲームで配られたカードの値 (ビットの位置 → カードの値)
+        self.__values: list[int] | None = None
+
+        # 配られたカード
+        self.__dealt: int = 0
+
+        # 手札
+        self.__hand: int = 0
+
+        # 手札の文字列 (手札が変わるとNoneに戻る)
+        self.__open_string: str | None = None
+        self.__close_string: str | None = None
+
+    # ----------
+    # getter
+    # ----------
+
+    def get_name(self) -> str:
+        """
+        名前を取得
+
+        Returns
+        -------
+        name: str
+        """
+        return self.__name
+
+    def get_id(self) -> int:
+        """
+        IDを取得
+
+        Returns
+        -------
+        id: int
+        """
+        return self.__id
+
+    def get_hand(self) -> dict[int:bool]:
+        """
+        手札を取得
+
+        Returns
+        -------
+        hand: dict
+            カード番号 : int
+            手札フラグ : bool (True : 手札に入っている)
+        """
+        hand = self.__hand
+        return {
+            self.__value(rank): bool(hand >> rank & 1)
+            for rank in bitset.cards(self.__dealt)
+        }
+
+    def get_cards_in_hand(self) -> list[int]:
+        """
+        手札の中にあるカードを小さい順に取得
+
+        Returns
+        -------
+        cards_in_hand: list
+        """
+        return [self.__value(rank) for rank in bitset.cards(self.__hand)]
+
+    def get_minimum(self) -> int | None:
+        """
+        手札の中で最小のカードを取得
+
+        Returns
+        -------
+        card: int | None
+            最小のカード (手札が無い場合はNone)
+        """
+        rank = bitset.lowest(self.__hand)
+        return None if rank is None else self.__value(rank)
+
+    def hand_to_string_open(self) -> str:
+        """
+        手札を文字列で取得
+        DM用
+        カードをすべて表示
+
+        Returns
+        -------
+        hand: str
+        """
+        if self.__open_string is None:
+            self.__open_string = "".join(
+                f"{self.__value(rank)} " for rank in bitset.cards(self.__dealt)
+            )
+        return self.__open_string
+
+    def hand_to_string_close(self) -> str:
+        """
+        手札を文字列で取得
+        テキストチャンネル用
+        場に出していないカードは?と表示
+
+        Returns
+        -------
+        hand: str
+        """
+        if self.__close_string is None:
+            hand = self.__hand
+            self.__close_string = "".join(
+                "? " if hand >> rank & 1 else f"{self.__value(rank)} "
+                for rank in bitset.cards(self.__dealt)
+            )
+        return self.__close_string
+
+    # ----------
+    # ito関連
+    # ----------
+
+    def __value(self, rank: int) -> int:
+        """
+        ビットの位置をカードの値に変換する
+
+        Parameters
+        ----------
+        rank: int
+            ビットの位置
+
+        Returns
+        -------
+        card: int
+        """
+        return rank if self.__values is None else self.__values[rank]
+
+    def __rank(self, card: int) -> int:
+        """
+        カードの値より小さい、配られたカードの枚数を取得する
+        (配られたカードの場合はそのカードのビットの位置になる)
+
+        Parameters
+        ----------
+        card: int
+
+        Returns
+        -------
+        rank: int
+        """
+        return card if self.__values is None else bisect_left(self.__values, card)
+
+    def set_values(self, values: list[int] | None):
+        """
+        ゲームで配られたカードの値を設定する
+        手札はn番目に小さいカードをn番目のビットで持つため、
+        カードの範囲が大きくても手札の大きさは配られた枚数で決まる
+
+        Parameters
+        ----------
+        values: list[int] | None
+            配られたカードの値 (小さい順)
+        """
+        self.__open_string = None
+        self.__close_string = None
+        self.__values = values
+
+    def receive_card(self, card: int):
+        """
+        カードを受け取る
+        (set_values()を呼び出した場合は、その中のカードだけを受け取れる)
+
+        Parameters
+        ----------
+        card: int
+            加えるカードの数字
+        """
+        self.__open_string = None
+        self.__close_string = None
+        # 手札を追加
+        mask = bitset.bit(self.__rank(card))
+        self.__dealt |= mask
+        self.__hand |= mask
+
+    def receive_cards(self, cards: list[int]):
+        """
+        複数のカードをまとめて受け取る
+
+        Parameters
+        ----------
+        cards: list[int]
+            加えるカードの数字のリスト
+        """
+        self.__open_string = None
+        self.__close_string = None
+        mask = 0
+        for card in cards:
+            mask |= bitset.bit(self.__rank(card))
+        self.__dealt |= mask
+        self.__hand |= mask
+
+    def put_card(self) -> int | None:
+        """
+        手札の中で最小のカードを捨てる
+
+        Returns
+        -------
+        card: int | None
+            最小のカード (手札が無い場合はNone)
+        """
+        self.__close_string = None
+
+        # 2024/01/23 例外処理を追加
+
+        hand_min = bitset.lowest(self.__hand)
+        if hand_min is None:
+            return None
+        self.__hand ^= bitset.bit(hand_min)
+        return self.__value(hand_min)
+
+    def discard_card(self, card: int):
+        """
+        指定したカードを手札から捨てる
+
+        Parameters
+        ----------
+        card: int
+            捨てるカード
+        """
+        self.__close_string = None
+        rank = self.__rank(card)
+        # 配られていないカードの場合は何もしない
+        values = self.__values
+        if values is None or (rank < len(values) and values[rank] == card):
+            self.__hand &= ~bitset.bit(rank)
+
+    def discard_below(self, card_put: int) -> int:
+        """
+        場に出されたカードより小さいカードをすべて手札から捨てる
+
+        Parameters
+        ----------
+        card_put: int
+            場に出されたカード
+
+        Returns
+        -------
+        discarded: int
+            捨てたカードの集合 (bitset、ビットの位置はset_values()の順番)
+        """
+        discarded = self.__hand & bitset.below(self.__rank(card_put))
+        if discarded:
+            self.__close_string = None
+            self.__hand ^= discarded
+        return discarded
+
+    def has_smaller_card(self, card_put: int) -> bool:
+        """
+        カードが場に出された時に
+        自分の手札がすべて
+        場に出されたカードよりも大きいか
+        チェックする
+
+        手札を持っていない場合はFalseを返す
+
+        Parameters
+        ----------
+        card_put: int
+            場に出されたカード
+
+        Returns
+        -------
+        boolean
+            True: 手札の中に場に出されたカード以下のカードが存在する
+            False: 自分の手札がすべて場に出されたカードよりも大きい or 手札が無い
+        """
+        return self.__hand & bitset.below(self.__rank(card_put + 1)) != 0
+
+    # ----------
+    # 保存
+    # ----------
+
+    def to_snapshot(self) -> list:
+        """
+        プレイヤーの状態を保存用に変換する
+
+        Returns
+        -------
+        snapshot: list
+            [プレイヤーID, 名前, 配られたカード (16進数), 手札 (16進数)]
+        """
+        return [self.get_id(), self.get_name(), f"{self.__dealt:x}", f"{self.__hand:x}"]
+
+    def restore_hand(self, dealt: int, hand: int):
+        """
+        保存した手札を復元する
+
+        Parameters
+        ----------
+        dealt: int
+            配られたカードの集合 (bitset、ビットの位置はset_values()の順番)
+        hand: int
+            手札に入っているカードの集合 (bitset、ビットの位置はset_values()の順番)
+        """
+        self.__open_string = None
+        self.__close_string = None
+        self.__dealt = dealt
+        self.__hand = hand
+
+    def reset_hand(self):
+        """
+        手札をリセットする
+        """
+        self.__open_string = None
+        self.__close_string = None
+        self.__values = None
+        self.__dealt = 0
+        self.__hand = 0
@@ -0,0 +1,293 @@
+# 勝率シミュレーター
+
+# engine.Gameと同じルールでゲームをまとめてシミュレーションし、
+# (人数, レベル, ライフ) ごとの勝率と失うライフの期待値を求める
+# 1ゲームを1行として、配る・出す順番を決める・失敗を数える処理をNumPyでまとめて行う
+# カードは配る枚数だけを選ぶため、使うメモリはカードの範囲の大きさに依存しない
+# バッチはプロセスプールで並列に実行する
+
+# ルール
+# 各プレイヤーは手札の最小のカードから順に出す (/put)
+# 出されたカードより小さいカードが残っていた場合、その枚数分ライフが減る
+# ライフが0以下になった時点で負け、すべてのカードがなくなれば勝ち
+# → 失ったカードの合計がライフ未満なら勝ち
+
+# 出す順番のモデル
+# 各カードに「プレイヤーが感じる大きさ」= カード + 誤差 を割り当て、その小さい順に出す
+# 手札は小さい順にしか出せないため、プレイヤーごとに累積最大値をとる
+#   perfect  : 誤差なし (必ず勝つ)
+#   gaussian : 正規分布 N(0, scale)
+#   uniform  : 一様分布 U(-scale, scale)
+
+# 実行方法
+# python -m engine.simulate --players 2 3 4 5 --levels 1 2 3 --lives 1 2 3 \
+#     --games 1000000 --error gaussian --scale 5
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine.game import CARD_MIN, CARD_MAX
+
+
+# 誤差のモデル
+ERROR_MODELS = ("perfect", "gaussian", "uniform")
+
+# 1回の処理でシミュレーションするゲーム数
+DEFAULT_BATCH_SIZE = 100_000
+
+
+def deal(rng: np.random.Generator, games: int, k: int, size: int) -> np.ndarray:
+    """
+    ゲームごとに0~size-1からk枚を重複なしで選ぶ
+    Floydの方法をゲーム数分まとめて行うため、使うメモリはゲーム数 x kだけで
+    カードの範囲の大きさには依存しない
+
+    Parameters
+    ----------
+    rng: np.random.Generator
+    games: int
+        ゲーム数
+    k: int
+        選ぶ枚数
+    size: int
+        カードの範囲の大きさ
+
+    Returns
+    -------
+    cards: np.ndarray
+        (games, k) の配列 (行の中はランダムな順番)
+    """
+    cards = np.empty((games, k), dtype=np.int64)
+    for i, j in enumerate(range(size - k, size)):
+        # 0~jから1枚選び、選択済みの場合はjにする
+        drawn = rng.integers(0, j + 1, games)
+        chosen = (cards[:, :i] == drawn[:, None]).any(axis=1)
+        cards[:, i] = np.where(chosen, j, drawn)
+    # Floydの方法は後ろほど大きいカードになりやすいので、配る前に並べ替える
+    return rng.permuted(cards, axis=1)
+
+
+def simulate_batch(
+    players: int,
+    level: int,
+    games: int,
+    error: str,
+    scale: float,
+    card_range: tuple[int, int],
+    seed: np.random.SeedSequence,
+) -> np.ndarray:
+    """
+    ゲームをまとめてシミュレーションし、失ったカードの枚数の分布を返す
+
+    Parameters
+    ----------
+    players: int
+        人数
+    level: int
+        レベル (各プレイヤーに配るカードの枚数)
+    games: int
+        ゲーム数
+    error: str
+        誤差のモデル (ERROR_MODELSのいずれか)
+    scale: float
+        誤差の大きさ
+    card_range: tuple[int, int]
+        (カードの最小値, カードの最大値)
+    seed: np.random.SeedSequence
+
+    Returns
+    -------
+    histogram: np.ndarray
+        i番目の要素 : 失ったカードがi枚だったゲーム数 (長さは人数 x レベル + 1)
+    """
+    rng = np.random.default_rng(seed)
+    card_min, card_max = card_range
+    number_of_cards = players * level
+
+    # カードを配る (ゲームごとに範囲内のカードから重複なしで選ぶ)
+    cards = deal(rng, games, number_of_cards, card_max - card_min + 1)
+    cards = (cards + card_min).reshape(games, players, level)
+    cards.sort(axis=2)
+
+    # 出す順番を決める
+    if error == "gaussian":
+        perceived = cards + rng.normal(0.0, scale, cards.shape)
+    elif error == "uniform":
+        perceived = cards + rng.uniform(-scale, scale, cards.shape)
+    else:
+        perceived = cards.astype(np.float64)
+    perceived = np.maximum.accumulate(perceived, axis=2)
+
+    # 同じ大きさに感じたカードは手札の小さい順に出す (安定ソート)
+    perceived = perceived.reshape(games, number_of_cards)
+    order = np.argsort(perceived, axis=1, kind="stable")
+    played = np.take_along_axis(cards.reshape(games, number_of_cards), order, axis=1)
+
+    # それまでに出されたカードの最大値より小さいカードは捨てられる
+    running_max = np.maximum.accumulate(played, axis=1)
+    lost = (played[:, 1:] < running_max[:, :-1]).sum(axis=1)
+    return np.bincount(lost, minlength=number_of_cards + 1)
+
+
+def summarize(histogram: np.ndarray, life: int) -> dict[str, float]:
+    """
+    失ったカードの枚数の分布から勝率と失うライフの期待値を求める
+
+    Parameters
+    ----------
+    histogram: np.ndarray
+        simulate_batch()の結果
+    life: int
+        ライフ
+
+    Returns
+    -------
+    summary: dict
+        win_rate : 勝率
+        life_loss : 失うライフの期待値 (ゲームオーバーになった場合はライフ分)
+    """
+    games = histogram.sum()
+    lost = np.arange(len(histogram))
+    return {
+        "win_rate": float(histogram[:life].sum() / games),
+        "life_loss": float((np.minimum(lost, life) * histogram).sum() / games),
+    }
+
+
+def simulate(
+    players: list[int],
+    levels: list[int],
+    lives: list[int],
+    games: int = 1_000_000,
+    error: str = "gaussian",
+    scale: float = 5.0,
+    card_range: tuple[int, int] = (CARD_MIN, CARD_MAX),
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int | None = None,
+    seed: int | None = None,
+) -> list[dict]:
+    """
+    (人数, レベル, ライフ) の組み合わせごとに勝率をシミュレーションする
+    同じ (人数, レベル) のゲームをすべてのライフの集計に使う
+
+    Parameters
+    ----------
+    players: list[int]
+        人数
+    levels: list[int]
+        レベル
+    lives: list[int]
+        ライフ
+    games: int
+        組み合わせごとのゲーム数
+    error: str
+        誤差のモデル (ERROR_MODELSのいずれか)
+    scale: float
+        誤差の大きさ
+    card_range: tuple[int, int]
+        (カードの最小値, カードの最大値)
+    batch_size: int
+        1回の処理でシミュレーションするゲーム数
+    workers: int | None
+        プロセス数 (Noneの場合はCPUの数、1の場合は並列化しない)
+    seed: int | None
+        シード (同じシードで同じ結果になる)
+
+    Returns
+    -------
+    results: list[dict]
+        players, level, life, games, win_rate, life_loss
+        カードが足りない組み合わせは含まない
+    """
+    if error not in ERROR_MODELS:
+        raise ValueError(f"Unknown error model: {error}")
+
+    size = card_range[1] - card_range[0] + 1
+    grid = [(p, l) for p in players for l in levels if p * l <= size]
+    batches = [
+        min(batch_size, games - start) for start in range(0, games, batch_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(grid) * len(batches))
+
+    jobs = list()
+    for index, (number_of_players, level) in enumerate(grid):
+        for offset, batch in enumerate(batches):
+            jobs.append(
+                (
+                    number_of_players,
+                    level,
+                    batch,
+                    error,
+                    scale,
+                    card_range,
+                    seeds[index * len(batches) + offset],
+                )
+            )
+
+    if workers == 1:
+        histograms = [simulate_batch(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            histograms = list(executor.map(simulate_batch, *zip(*jobs)))
+
+    results: list[dict] = list()
+    for index, (number_of_players, level) in enumerate(grid):
+        histogram = sum(histograms[index * len(batches) : (index + 1) * len(batches)])
+        for life in lives:
+            results.append(
+                {
+                    "players": number_of_players,
+                    "level": level,
+                    "life": life,
+                    "games": games,
+                    **summarize(histogram, life),
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ito win rate simulator")
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 3, 4, 5, 6])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--lives", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--error", choices=ERROR_MODELS, default="gaussian")
+    parser.add_argument("--scale", type=float, default=5.0)
+    parser.add_argument("--card-range", type=int, nargs=2, default=[CARD_MIN, CARD_MAX])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="JSONで出力する")
+    args = parser.parse_args()
+
+    results = simulate(
+        args.players,
+        args.levels,
+        args.lives,
+        games=args.games,
+        error=args.error,
+        scale=args.scale,
+        card_range=tuple(args.card_range),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        seed=args.seed,
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"error={args.error} scale={args.scale} games={args.games}")
+    print(f"{'players':>7} {'level':>5} {'life':>4} {'win':>7} {'loss':>6}")
+    for row in results:
+        print(
+            f"{row['players']:>7} {row['level']:>5} {row['life']:>4}"
+            f" {row['win_rate'] * 100:>6.2f}% {row['life_loss']:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
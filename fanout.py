@@ -0,0 +1,124 @@
+# 並列送信
+
+# 複数の宛先へのメッセージ送信を同時実行数を制限しながら並列に行う
+# 一部の送信が失敗しても他の送信は継続し、宛先ごとの結果を返す
+
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+# 同時に送信するDMの上限
+DEFAULT_CONCURRENCY = 8
+
+
+class FanoutResult:
+    """
+    並列送信の結果
+
+    Attributes
+    ----------
+    __succeeded : list
+        送信に成功した宛先
+    __failed : dict
+        キー : 送信に失敗した宛先
+        値 : 発生した例外
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.__succeeded: list[Hashable] = list()
+        self.__failed: dict[Hashable, BaseException] = dict()
+
+    def add_success(self, key: Hashable):
+        """
+        送信に成功した宛先を追加する
+
+        Parameters
+        ----------
+        key: Hashable
+            宛先
+        """
+        self.__succeeded.append(key)
+
+    def add_failure(self, key: Hashable, error: BaseException):
+        """
+        送信に失敗した宛先を追加する
+
+        Parameters
+        ----------
+        key: Hashable
+            宛先
+        error: BaseException
+            発生した例外
+        """
+        self.__failed[key] = error
+
+    def get_succeeded(self) -> list[Hashable]:
+        """
+        送信に成功した宛先を取得する
+
+        Returns
+        -------
+        succeeded: list
+        """
+        return self.__succeeded
+
+    def get_failed(self) -> dict[Hashable, BaseException]:
+        """
+        送信に失敗した宛先を取得する
+
+        Returns
+        -------
+        failed: dict
+        """
+        return self.__failed
+
+    def is_all_succeeded(self) -> bool:
+        """
+        すべての送信に成功したか判定する
+
+        Returns
+        -------
+        boolean
+            True: すべて成功 False: 失敗した宛先がある
+        """
+        return len(self.__failed) == 0
+
+
+async def fan_out(
+    jobs: dict[Hashable, Callable[[], Awaitable]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> FanoutResult:
+    """
+    送信処理を同時実行数を制限しながら並列に実行する
+
+    Parameters
+    ----------
+    jobs: dict
+        キー : 宛先
+        値 : 送信処理を返す関数
+    concurrency: int
+        同時実行数の上限
+
+    Returns
+    -------
+    result: FanoutResult
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    result = FanoutResult()
+
+    async def run(key: Hashable, job: Callable[[], Awaitable]):
+        async with semaphore:
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                result.add_failure(key, error)
+                return
+        result.add_success(key)
+
+    await asyncio.gather(*(run(key, job) for key, job in jobs.items()))
+    return result
@@ -0,0 +1,80 @@
+# ゲートウェイの設定
+
+# botに渡すIntentsとキャッシュの設定を作成する
+# 通常モード
+#   デフォルトのIntents + message_content
+#   メッセージも受信し、"/"で始まるメッセージをテキストコマンドとして解析する
+# スラッシュ専用モード
+#   サーバー・チャンネルの情報 (Intents.guilds) だけを受信する
+#   メッセージ・リアクション・入力中などのイベントはDiscordから送られてこない
+#   メッセージ・メンバーのキャッシュと、起動時のメンバーの取得 (chunking) も行わない
+#   コマンドはすべてスラッシュコマンドとして実行する
+
+# 環境変数
+# SLASH_ONLY : "1"の場合はスラッシュ専用モード (デフォルト: 0)
+
+from discord import Intents, MemberCacheFlags
+from discord.ext import commands
+
+
+# テキストコマンドの接頭辞
+COMMAND_PREFIX = "/"
+
+# 通常モードで保持するメッセージの数 (discord.pyのデフォルト)
+DEFAULT_MAX_MESSAGES = 1000
+
+
+def make_intents(slash_only: bool) -> Intents:
+    """
+    受信するイベントの種類を作成する
+
+    Parameters
+    ----------
+    slash_only: bool
+        True: スラッシュ専用モード
+
+    Returns
+    -------
+    intents: Intents
+    """
+    if slash_only:
+        # スラッシュコマンドの実行に必要なのはサーバーとチャンネルの情報だけ
+        # (実行したメンバーの情報はインタラクションに含まれる)
+        return Intents(guilds=True)
+    intents = Intents.default()
+    intents.message_content = True
+    return intents
+
+
+def bot_options(slash_only: bool) -> dict:
+    """
+    commands.Bot / commands.AutoShardedBotに渡す引数を作成する
+
+    Parameters
+    ----------
+    slash_only: bool
+        True: スラッシュ専用モード
+
+    Returns
+    -------
+    options: dict
+    """
+    intents = make_intents(slash_only)
+    if slash_only:
+        return {
+            # メッセージを受信しないため、接頭辞は使われない
+            "command_prefix": commands.when_mentioned,
+            # テキストコマンドのヘルプは使わない
+            "help_command": None,
+            "intents": intents,
+            "member_cache_flags": MemberCacheFlags.none(),
+            "max_messages": None,
+            "chunk_guilds_at_startup": False,
+        }
+    return {
+        "command_prefix": COMMAND_PREFIX,
+        "intents": intents,
+        "member_cache_flags": MemberCacheFlags.from_intents(intents),
+        "max_messages": DEFAULT_MAX_MESSAGES,
+        "chunk_guilds_at_startup": intents.members,
+    }
@@ -0,0 +1,147 @@
+# コマンドの実行条件
+
+# コマンドごとに必要な条件を宣言し、まとめて1回で判定する
+# 条件を満たさない場合のエラーメッセージは条件ごとに事前に用意しておく
+
+from enum import Enum
+from discord import Embed, Colour
+import metrics
+import render
+from session import Session
+
+
+class Guard(Enum):
+    """
+    コマンドの実行条件
+    """
+
+    # 別のチャンネルのゲームに参加していない
+    CHANNEL = "channel"
+    # ゲーム中
+    IN_GAME = "in_game"
+    # ゲーム中ではない
+    OFF_GAME = "off_game"
+    # ゲームに参加している
+    PLAYER = "player"
+
+
+# 条件を満たさない場合のエラーメッセージ
+ERRORS: dict[Guard, str] = {
+    Guard.CHANNEL: "以下のチャンネルのゲームに参加しています",
+    Guard.IN_GAME: "ゲームが開始されていません",
+    Guard.OFF_GAME: "ゲームが開始されています",
+    Guard.PLAYER: "ゲームに参加してね！",
+}
+
+
+class GuardPipeline:
+    """
+    コマンドの実行条件を判定するクラス
+
+    Attributes
+    ----------
+    __responses : dict
+        キー : (コマンド名, Guard)
+        値 : エラーメッセージのEmbedの元になるdict
+
+    判定した回数・条件を満たさなかった回数はメトリクス
+    (ito_guard_checks_total / ito_command_rejections_total) で確認する
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.__responses: dict[tuple[str, Guard], tuple] = dict()
+
+    def check(
+        self,
+        command: str,
+        guards: tuple[Guard, ...],
+        session: Session,
+        joined: Session | None,
+        author_id: int,
+    ) -> Embed | None:
+        """
+        コマンドの実行条件を順番に判定する
+        条件を満たさないものが見つかった時点で判定をやめる
+
+        Parameters
+        ----------
+        command: str
+            コマンド名
+        guards: tuple[Guard, ...]
+            コマンドの実行条件
+        session: Session
+            コマンドが実行されたチャンネルのセッション
+        joined: Session | None
+            コマンド実行者が参加しているセッション
+        author_id: int
+            コマンド実行者のdiscord.Member.id
+
+        Returns
+        -------
+        embed: Embed | None
+            エラーメッセージ (すべての条件を満たす場合はNone)
+        """
+        ito = session.get_ito()
+        for guard in guards:
+            metrics.GUARD_CHECKS.inc(guard.value)
+
+            if guard is Guard.CHANNEL:
+                passed = joined is None or joined is session
+            elif guard is Guard.IN_GAME:
+                passed = ito.is_ongoing()
+            elif guard is Guard.OFF_GAME:
+                passed = not ito.is_ongoing()
+            else:
+                passed = author_id in ito.get_players()
+
+            if not passed:
+                metrics.COMMAND_REJECTIONS.inc(command, guard.value)
+                return self.__reject(command, guard, session, joined)
+
+        return None
+
+    def __reject(
+        self,
+        command: str,
+        guard: Guard,
+        session: Session,
+        joined: Session | None,
+    ) -> Embed:
+        """
+        エラーメッセージを作成する
+
+        Parameters
+        ----------
+        command: str
+            コマンド名
+        guard: Guard
+            満たさなかった条件
+        session: Session
+            コマンドが実行されたチャンネルのセッション
+        joined: Session | None
+            コマンド実行者が参加しているセッション
+
+        Returns
+        -------
+        embed: Embed
+        """
+        key = (command, guard)
+        response = self.__responses.get(key)
+        if response is None:
+            response = (f"{command} command", ERRORS[guard], Colour.gold())
+            self.__responses[key] = response
+
+        # 条件ごとに表示する情報を追加する
+        fields = list()
+        if guard is Guard.CHANNEL:
+            channel_name = joined.get_ito().get_channel_name()
+            fields.append(render.field("チャンネル", channel_name, False))
+        elif guard is Guard.PLAYER:
+            players = session.get_renderer().player_list("プレイヤーがまだいません")
+            fields.append(render.field("参加者", players, False))
+
+        title, description, colour = response
+        return render.build(title, description, colour, fields)
@@ -0,0 +1,198 @@
+# 引き継ぎ
+
+# Cogをリロードするときに、実行中のゲームを新しいCogに引き継ぐ
+# 古いCogは実行中のコマンドが終わるのを待ってからセッションを書き出し、
+# 新しいCogはディスクから読み直さずにメモリ上のItoをそのまま使う
+# このモジュール (とito.py) はCogのリロードでは読み直されないため、
+# 引き継ぎの間もデータが残る
+
+import asyncio
+from contextlib import contextmanager
+from ito import Ito
+from session import SessionKey
+from shard import ShardedSessions
+
+
+# 実行中のコマンドを待つ時間の上限 (秒)
+DEFAULT_DRAIN_TIMEOUT = 10.0
+
+
+class InFlight:
+    """
+    実行中のコマンドを数えるクラス
+
+    Attributes
+    ----------
+    __count : int
+        実行中のコマンドの数
+    __draining : bool
+        True: 新しいコマンドを受け付けない
+    __idle : asyncio.Event
+        実行中のコマンドが無いときにセットされる
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.__count: int = 0
+        self.__draining: bool = False
+        self.__idle: asyncio.Event = asyncio.Event()
+        self.__idle.set()
+
+    def get_count(self) -> int:
+        """
+        実行中のコマンドの数を取得する
+
+        Returns
+        -------
+        count: int
+        """
+        return self.__count
+
+    def is_draining(self) -> bool:
+        """
+        新しいコマンドを受け付けない状態か判定する
+
+        Returns
+        -------
+        boolean
+            True: 受け付けない False: 受け付ける
+        """
+        return self.__draining
+
+    @contextmanager
+    def track(self):
+        """
+        コマンドの実行中であることを記録する
+
+        Examples
+        --------
+        with in_flight.track():
+            ...
+        """
+        self.__count += 1
+        self.__idle.clear()
+        try:
+            yield
+        finally:
+            self.__count -= 1
+            if self.__count == 0:
+                self.__idle.set()
+
+    async def drain(self, timeout: float = DEFAULT_DRAIN_TIMEOUT) -> int:
+        """
+        新しいコマンドの受付を止め、実行中のコマンドが終わるのを待つ
+
+        Parameters
+        ----------
+        timeout: float
+            待つ時間の上限 (秒)
+
+        Returns
+        -------
+        count: int
+            時間内に終わらなかったコマンドの数
+        """
+        self.__draining = True
+        try:
+            await asyncio.wait_for(self.__idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.__count
+
+    def resume(self):
+        """
+        新しいコマンドの受付を再開する
+        リロードを中止した場合に呼び出す
+        """
+        self.__draining = False
+
+
+class Handoff:
+    """
+    引き継ぐデータ
+
+    Attributes
+    ----------
+    __sessions : list
+        (SessionKey, Ito) のリスト (最近使われていない順)
+    __pending : dict
+        キー : SessionKey
+        値 : まだ復元していない保存用のバイト列
+    """
+
+    def __init__(
+        self,
+        sessions: list[tuple[SessionKey, Ito]],
+        pending: dict[SessionKey, bytes],
+    ):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        sessions: list
+            (SessionKey, Ito) のリスト
+        pending: dict
+            まだ復元していないセッション
+        """
+        self.__sessions: list[tuple[SessionKey, Ito]] = sessions
+        self.__pending: dict[SessionKey, bytes] = pending
+
+    def get_sessions(self) -> list[tuple[SessionKey, Ito]]:
+        """
+        引き継ぐセッションを取得する
+
+        Returns
+        -------
+        sessions: list
+        """
+        return self.__sessions
+
+    def get_pending(self) -> dict[SessionKey, bytes]:
+        """
+        まだ復元していないセッションを取得する
+
+        Returns
+        -------
+        pending: dict
+        """
+        return self.__pending
+
+
+# 新しいCogに渡すデータ
+_handoff: Handoff | None = None
+
+
+def export(sessions: ShardedSessions, pending: dict[SessionKey, bytes]):
+    """
+    セッションを書き出す
+    古いCogのprepare_unload()で呼び出す
+
+    Parameters
+    ----------
+    sessions: ShardedSessions
+    pending: dict
+        まだ復元していないセッション
+    """
+    global _handoff
+    _handoff = Handoff(
+        [(session.get_key(), session.get_ito()) for session in sessions.get_sessions()],
+        dict(pending),
+    )
+
+
+def take() -> Handoff | None:
+    """
+    書き出されたセッションを受け取る
+    新しいCogのcog_load()で呼び出す
+
+    Returns
+    -------
+    handoff: Handoff | None
+        引き継ぐデータが無い場合はNone
+    """
+    global _handoff
+    handoff, _handoff = _handoff, None
+    return handoff
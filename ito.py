@@ -4,496 +4,300 @@
 
 # 2024/01/22 itoクラスに名称変更
 
-# 進行中のゲーム情報を格納するクラス
+# 進行中のゲームとdiscordのサーバー・チャンネル・メンバーを対応づけるクラス
+# ルールはengine.Gameで扱う
 
-from logging import getLogger, StreamHandler, DEBUG
-import discord
-from discord import Guild, TextChannel, VoiceChannel
-import random
-from player import Player
+# 2026/10/18 discordのオブジェクトを持たず、IDと名前だけを持つように変更
+#            オブジェクトが必要な場合はbotのキャッシュから取得する
 
+from discord import Guild, TextChannel, VoiceChannel, Member, User
+from engine import Game
 
-# ----------
-# ロガー
-# ----------
 
-
-logger = getLogger(__name__)
-handler = StreamHandler()
-handler.setLevel(DEBUG)
-logger.setLevel(DEBUG)
-logger.addHandler(handler)
-logger.propagate = False
-
-
-class Ito:
+class Ito(Game):
     """
     itoクラス
 
+    discordのオブジェクトはゲートウェイのキャッシュを保持し続けないよう、
+    IDと設定したときの名前だけを持つ
+
     Attributes
     -------------------
-    __guild : discord.Guild
-        サーバー
-    __channel : discord.TextChannel
-        ゲームが開始されたチャンネル
-    __voice_channel : discord.VoiceChannel
-        通話しているボイスチャンネル
-    __players : dict
-        プレイヤーのdict
-        キー : discord.Member.id
-        値 : Player
-    __life : int = 3
-        ライフ
-    __level : int = 1
-        レベル (各プレイヤーに配るカードの枚数)
-    __deck : dict
-        キー : カード番号
-        場札フラグ : bool (True : 場に出されている)
-    __theme : str
-        トークテーマ
-    __ongoing : bool
-        ゲーム中フラグ (True : ゲーム中)
+    __guild_id : int | None
+        サーバーID
+    __channel_id : int | None
+        ゲームが開始されたチャンネルのID
+    __channel_name : str | None
+        ゲームが開始されたチャンネルの名前
+    __voice_channel_id : int | None
+        通話しているボイスチャンネルのID
+    __voice_channel_name : str | None
+        通話しているボイスチャンネルの名前
     """
 
+    __slots__ = (
+        "__guild_id",
+        "__channel_id",
+        "__channel_name",
+        "__voice_channel_id",
+        "__voice_channel_name",
+    )
+
     def __init__(self):
         """
         コンストラクタ
         """
-        self.__guild: Guild = None
-        self.__channel: TextChannel = None
-        self.__voice_channel: VoiceChannel = None
-        self.__players: dict[int:Player] = dict()
-        self.__life: int = 3
-        self.__level: int = 1
-        self.__deck: dict[int, bool] = dict()
-        self.__theme: str = "トークテーマを設定してください"
-        self.__ongoing: bool = False
+        super().__init__()
+        self.__guild_id: int | None = None
+        self.__channel_id: int | None = None
+        self.__channel_name: str | None = None
+        self.__voice_channel_id: int | None = None
+        self.__voice_channel_name: str | None = None
 
     # ----------
     # setter
     # ----------
 
-    def set_guild(self, guild: Guild):
+    def set_guild(self, guild: Guild | None):
         """
-        サーバーIDを設定する
+        サーバーを設定する
+        サーバーIDだけを保持する
 
         Parameters
         ----------
-        guild_id: int
-            サーバーID
+        guild: Guild | None
+            サーバー (DMの場合はNone)
         """
-        self.__guild = guild
+        self.bump_version()
+        self.__guild_id = guild.id if guild is not None else None
 
     def set_channel(self, channel: TextChannel):
         """
         チャンネルを設定する
+        チャンネルIDと名前だけを保持する
 
         Parameters
         ----------
         channel: TextChannel
             チャンネル
         """
-        self.__channel = channel
+        self.bump_version()
+        self.__channel_id = channel.id
+        self.__channel_name = getattr(channel, "name", None)
 
     def set_voice_channel(self, voice_channel: VoiceChannel):
         """
-        ボイスチャンネルを設定する
+        ボイスチャンネルを設定する
+        ボイスチャンネルIDと名前だけを保持する
 
         Parameters
         ----------
         voice_channel: VoiceChannel
-            ボイスチャンネル
-        """
-        self.__voice_channel = voice_channel
-
-    def set_life(self, life: int):
-        """
-        ライフを設定する
-
-        Parameters
-        ----------
-        life: int
-            ライフ
-        """
-        self.__life = life
-
-    def set_level(self, level: int):
-        """
-        レベルを設定する
-
-        Parameters
-        ----------
-        level: int
-            レベル
-        """
-        self.__level = level
-
-    def set_theme(self, theme: str):
-        """
-        トークテーマを設定する
-
-        Parameters
-        ----------
-        theme: str
-            トークテーマ
-        """
-        self.__theme = theme
-
-    def start_game(self):
-        """
-        ゲームを開始する
-        """
-        self.__ongoing = True
-
-    def end_game(self):
+            ボイスチャンネル
         """
-        ゲームを終了する
-        """
-        self.__ongoing = False
+        self.bump_version()
+        self.__voice_channel_id = voice_channel.id
+        self.__voice_channel_name = voice_channel.name
 
     # ----------
     # getter
     # ----------
 
-    def get_guild(self) -> Guild | None:
-        """
-        サーバーを取得する
-
-        Returns
-        -------
-        guild: Guild
+    def get_guild(self, client) -> Guild | None:
         """
-        return self.__guild
+        サーバーをbotのキャッシュから取得する
 
-    def get_guild_id(self) -> int:
-        """
-        サーバーIDを取得する
+        Parameters
+        ----------
+        client: discord.Client
 
         Returns
         -------
-        guild_id: int
+        guild: Guild | None
+            キャッシュに無い場合はNone
         """
-        return self.__guild.id
+        if self.__guild_id is None:
+            return None
+        return client.get_guild(self.__guild_id)
 
-    def get_guild_name(self) -> str:
+    def get_guild_id(self) -> int | None:
         """
-        サーバー名を取得する
+        サーバーIDを取得する
 
         Returns
         -------
-        guild_name: str
+        guild_id: int | None
         """
-        return self.__guild.name
+        return self.__guild_id
 
-    def get_channel(self) -> TextChannel | None:
+    def get_channel(self, client) -> TextChannel | None:
         """
-        チャンネルを取得する
+        チャンネルをbotのキャッシュから取得する
+
+        Parameters
+        ----------
+        client: discord.Client
 
         Returns
         -------
-        channel: TextChannel
+        channel: TextChannel | None
+            チャンネルが設定されていない場合・キャッシュに無い場合はNone
         """
-        return self.__channel
+        if self.__channel_id is None:
+            return None
+        return client.get_channel(self.__channel_id)
 
-    def get_channel_id(self) -> int:
+    def get_channel_id(self) -> int | None:
         """
         チャンネルIDを取得する
 
         Returns
         -------
-        channel_id: int
+        channel_id: int | None
+            チャンネルが設定されていない場合はNone
         """
-        return self.__channel.id
+        return self.__channel_id
 
-    def get_channel_name(self) -> str:
+    def get_channel_name(self) -> str | None:
         """
         チャンネル名を取得する
+        チャンネルを設定したときの名前を返す
 
         Returns
         -------
-        channel_name: str
-        """
-        return self.__channel.name
-
-    def get_voice_channel(self) -> VoiceChannel | None:
-        """
-        ボイスチャンネルを取得する
-
-        Returns
-        -------
-        voice_channel: VoiceChannel
-        """
-        return self.__voice_channel
-
-    def get_voice_channel_id(self) -> int:
-        """
-        ボイスチャンネルIDを取得する
-
-        Returns
-        -------
-        voice_channel_id: int
-        """
-        return self.__voice_channel.id
-
-    def get_voice_channel_name(self) -> str:
-        """
-        ボイスチャンネル名を取得する
-
-        Returns
-        -------
-        voice_channel_name: str
-        """
-        return self.__voice_channel.name
-
-    def get_players(self) -> dict[int:Player]:
+        channel_name: str | None
         """
-        プレイヤーを取得する
+        return self.__channel_name
 
-        Returns
-        -------
-        players: dict[int: Player]
+    def get_voice_channel(self, client) -> VoiceChannel | None:
         """
-        return self.__players
+        ボイスチャンネルをbotのキャッシュから取得する
 
-    def get_player(self, id: discord.Member.id) -> Player:
-        """
-        プレイヤーを取得する
-
-        Returns
-        -------
-        player: Player
-        """
-        return self.__players[id]
-
-    def get_player_id_list(self) -> list[discord.Member.id]:
-        """
-        プレイヤーIDのリストを取得する
-
-        Returns
-        -------
-        player_id_list: dict_keys
-        """
-        return list(self.__players.keys())
-
-    def get_player_name_list(self) -> list[discord.Member.name]:
-        """
-        プレイヤー名のリストを取得する
-
-        Returns
-        -------
-        player_name_list: discord.Member.name
-        """
-        players: list[Player] = list(self.__players.values())
-        return [player.get_name() for player in players]
-
-    def get_life(self) -> int:
-        """
-        ライフを取得する
+        Parameters
+        ----------
+        client: discord.Client
 
         Returns
         -------
-        life: int
+        voice_channel: VoiceChannel | None
         """
-        return self.__life
+        if self.__voice_channel_id is None:
+            return None
+        return client.get_channel(self.__voice_channel_id)
 
-    def get_level(self) -> int:
+    def get_voice_channel_id(self) -> int | None:
         """
-        レベルを取得する
+        ボイスチャンネルIDを取得する
 
         Returns
         -------
-        level: int
+        voice_channel_id: int | None
         """
-        return self.__level
+        return self.__voice_channel_id
 
-    def get_theme(self) -> str:
+    def get_voice_channel_name(self) -> str | None:
         """
-        トークテーマを取得する
+        ボイスチャンネル名を取得する
+        ボイスチャンネルを設定したときの名前を返す
 
         Returns
         -------
-        theme: str
+        voice_channel_name: str | None
         """
-        return self.__theme
+        return self.__voice_channel_name
 
-    def get_deck(self) -> dict:
-        """
-        カードを取得する
-
-        Returns
-        -------
-        deck: dict
+    def get_member(self, guild: Guild | None, id: int) -> Member | User | None:
         """
-        return self.__deck
+        プレイヤーのdiscord.Memberをbotのキャッシュから取得する
 
-    def is_ongoing(self) -> bool:
-        """
-        ゲーム中か判定する
+        Parameters
+        ----------
+        guild: Guild | None
+            サーバー (DMの場合はNone)
+        id: int
+            discord.Member.id
 
         Returns
         -------
-        boolean
-            True: ゲーム中
-            False: ゲーム中ではない
+        member: Member | User | None
+            プレイヤーではない場合・キャッシュに無い場合はNone
         """
-        return self.__ongoing
+        if id not in self.get_players() or guild is None:
+            return None
+        return guild.get_member(id)
 
     # ----------
     # ito関連
     # ----------
 
-    # プレイヤーを登録する
-    def regist_player(self, member: discord.Member):
+    def regist_player(self, member: Member):
         """
         プレイヤーを登録する
+        IDと名前だけを保持する
 
         Parameters
         ----------
-        player: Player
-            プレイヤー
+        member: discord.Member
         """
-        # discord.Member.idをキーとして要素を追加
-        self.__players[member.id] = Player(member)
+        self.add_player(member.id, member.name)
 
-    def delete_player(self, player: discord.Member):
+    def delete_player(self, member: Member):
         """
         プレイヤーを削除する
 
         Parameters
         ----------
-        player: Player
-            プレイヤー
+        member: discord.Member
         """
-
         try:
-            del self.__players[player.id]
+            self.remove_player(member.id)
         except KeyError:
-            raise KeyError("Player not found: " + player.name)
-
-    # カードを生成してプレイヤーに配る
-    def deal_cards(self):
-        """
-        カードを生成してプレイヤーに配る
-        場を生成する
-        """
-
-        # 仮のセットを生成する
-        temporary_deck = set()
+            raise KeyError("Player not found: " + member.name)
 
-        # プレイヤー数分の乱数を追加する
-        number_of_cards: int = len(self.__players) * self.__level
-        while len(temporary_deck) <= number_of_cards:
-            temporary_deck.add(random.randint(1, 100))
-        temporary_list = list(temporary_deck)
-
-        # deckをプレイヤーに配る
-        players: list[Player] = list(self.__players.values())
-        # レベル数分繰り返す
-        for turn in range(self.__level):
-            # 各プレイヤーにカードを配る
-            for player in players:
-                number = temporary_list.pop()
-                player.receive_card(number)
-
-                # deckに追加
-                self.__deck[number] = False
-
-        # ログ出力
-        logger.debug("Cards dealt")
-        for player in players:
-            logger.debug(f"{player.get_name()}: {player.hand_to_string_open()}")
-
-    def receive_card(self, card: int):
-        """
-        カードを受け取る
-
-        Parameters
-        ----------
-        card: int
-            カード
-        """
-        self.__deck[card] = True
-
-    def is_minimun(self, card_put: int) -> bool:
-        """
-        場に出されたカードが
-        場に出ていないカードの中で
-        最小か判定する
-
-        Parameters
-        ----------
-        card: int
-            カード
-
-        Returns
-        -------
-        boolean
-            True: 最小 False: 最小ではない
-        """
-        temporary_list = list()
-
-        # deckの中で捨てられていないカードを抽出
-        # deckでfor文
-        for card_deck in self.__deck.keys():
-            # カードが捨てられていない場合
-            if self.__deck[card_deck] == False:
-                temporary_list.append(card_deck)
-
-        deck_minimun = min(temporary_list)
-
-        if card_put == deck_minimun:
-            return True
-        else:
-            return False
-
-    def decrease_life(self):
-        """
-        ライフを減らす
-        """
-        self.__life -= 1
+    # ----------
+    # 保存
+    # ----------
 
-    def is_gameover(self) -> bool:
+    def to_snapshot(self) -> dict:
         """
-        ゲームオーバーになっているか判定する
+        ゲームの状態を保存用に変換する
+        discordのオブジェクトはIDだけを保存する
 
         Returns
         -------
-        boolean
-            True: ゲームオーバー
-            False: ゲームオーバーしていない
+        snapshot: dict
         """
-        if self.__life > 0:
-            return False
-        else:
-            return True
+        snapshot = super().to_snapshot()
+        snapshot["guild"] = self.__guild_id
+        snapshot["channel"] = self.__channel_id
+        return snapshot
 
-    def is_cleared(self) -> bool:
+    def restore(
+        self,
+        snapshot: dict,
+        guild: Guild | None,
+        channel: TextChannel | None,
+        player_ids: set[int],
+    ):
         """
-        ゲームクリアになっているか判定する
+        保存したゲームの状態を復元する
+        見つからなかったプレイヤーとそのカードは除外する
 
-        Returns
-        -------
-        boolean
-            True: ゲームがクリアしている
-            False: ゲームがクリアしていない
-        """
-        # deckの中でFalseになっているカードの数を数える
-        deck: dict[int:bool] = self.__deck
-        deck_put = list(deck.values())
-        false_count = deck_put.count(False)
-
-        if false_count == 0:
-            return True
-        else:
-            return False
-
-    def initialize_game(self):
-        """
-        ゲームをリセットする
-        """
-        self.__life = 3
-        self.__deck.clear()
-        self.__ongoing = False
-        players: list[Player] = list(self.__players.values())
-        for player in players:
-            player.reset_hand()
+        Parameters
+        ----------
+        snapshot: dict
+            to_snapshot()で作成したdict
+        guild: Guild | None
+            サーバー
+        channel: TextChannel | None
+            チャンネル
+        player_ids: set[int]
+            見つかったプレイヤーのID
+        """
+        super().restore(snapshot, player_ids)
+        self.__guild_id = guild.id if guild is not None else None
+        self.__channel_id = None
+        self.__channel_name = None
+        if channel is not None:
+            self.__channel_id = channel.id
+            self.__channel_name = getattr(channel, "name", None)
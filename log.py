@@ -0,0 +1,184 @@
+# ロガー
+
+# bot本体・Cog・ゲームのログを1か所で設定する
+# ログはキューに入れて別スレッドで出力するため、イベントループを止めない
+# ファイルのローテーションも出力用のスレッドで行う
+
+# 環境変数
+# LOG_LEVEL : 出力するレベル (デフォルト: INFO)
+# DISCORD_LOG_LEVEL : discord.pyのログの出力するレベル (デフォルト: INFO)
+#   DEBUGにするとゲートウェイで受信した内容 (メッセージの本文など) も出力されるので注意
+# LOG_FORMAT : json or text (デフォルト: json)
+# LOG_FILE : ログファイルのパス (指定しない場合は標準出力のみ)
+# LOG_ROTATION : ローテーションの条件 (デフォルト: 10 MB)
+# LOG_RETENTION : 残すログファイルの期間 (デフォルト: 7 days)
+
+import inspect
+import json
+import logging
+import sys
+from os import environ
+from loguru import logger
+
+
+# JSONに出力するextraのキー
+FIELDS = ("command", "guild", "session", "latency_ms")
+
+# 間引きするログの出力回数
+_sample_counts: dict[str, int] = dict()
+
+
+def _sample_filter(record: dict) -> bool:
+    """
+    間引き対象のログをN回に1回だけ出力する
+    logger.bind(sample=N)で出力したログが対象
+
+    Parameters
+    ----------
+    record: dict
+        loguruのレコード
+
+    Returns
+    -------
+    boolean
+        True: 出力する False: 出力しない
+    """
+    rate = record["extra"].get("sample")
+    if not rate or rate <= 1:
+        return True
+
+    key = f"{record['name']}:{record['line']}"
+    count = _sample_counts.get(key, 0)
+    _sample_counts[key] = count + 1
+    return count % rate == 0
+
+
+def _json_format(record: dict) -> str:
+    """
+    レコードを1行のJSONに変換する
+
+    Parameters
+    ----------
+    record: dict
+        loguruのレコード
+
+    Returns
+    -------
+    format: str
+    """
+    data = {
+        "time": record["time"].isoformat(timespec="milliseconds"),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "message": record["message"],
+    }
+    extra = record["extra"]
+    for key in FIELDS:
+        if key in extra:
+            data[key] = extra[key]
+    if record["exception"] is not None:
+        data["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(data, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def _text_format(record: dict) -> str:
+    """
+    レコードを人が読みやすい形式に変換する
+
+    Parameters
+    ----------
+    record: dict
+        loguruのレコード
+
+    Returns
+    -------
+    format: str
+    """
+    fields = " ".join(
+        f"{key}={record['extra'][key]}" for key in FIELDS if key in record["extra"]
+    )
+    record["extra"]["_fields"] = f" | {fields}" if fields else ""
+    return (
+        "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level>"
+        " | {name}:{function}:{line} - {message}{extra[_fields]}\n{exception}"
+    )
+
+
+class InterceptHandler(logging.Handler):
+    """
+    標準のloggingのログをloguruに渡すハンドラ
+    discord.pyやゲームのログも同じ出力先に出す
+    """
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        extra = {
+            key: getattr(record, key)
+            for key in FIELDS + ("sample",)
+            if hasattr(record, key)
+        }
+        # ログを出力した関数を呼び出し元として記録する
+        frame, depth = inspect.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+
+        logger.bind(**extra).opt(depth=depth, exception=record.exc_info).log(
+            level, record.getMessage()
+        )
+
+
+def setup():
+    """
+    ロガーを設定する
+    起動時に1回だけ呼び出す
+    """
+    level = environ.get("LOG_LEVEL", "INFO")
+    if environ.get("LOG_FORMAT", "json") == "text":
+        format = _text_format
+    else:
+        format = _json_format
+
+    # 標準出力 (別スレッドで出力)
+    logger.remove()
+    logger.add(
+        sys.stdout,
+        level=level,
+        format=format,
+        filter=_sample_filter,
+        enqueue=True,
+        colorize=format is _text_format,
+    )
+
+    # ファイル (ローテーションも別スレッドで行う)
+    if "LOG_FILE" in environ:
+        logger.add(
+            environ["LOG_FILE"],
+            level=level,
+            format=_json_format,
+            filter=_sample_filter,
+            enqueue=True,
+            rotation=environ.get("LOG_ROTATION", "10 MB"),
+            retention=environ.get("LOG_RETENTION", "7 days"),
+            compression="gz",
+        )
+
+    # 標準のloggingをloguruに渡す
+    # (ルートのレベルもLOG_LEVELにしないと、ゲームのDEBUGのログがloguruに届かない)
+    logging.basicConfig(
+        handlers=[InterceptHandler()], level=logger.level(level).no, force=True
+    )
+    # discord.pyのDEBUGのログにはゲートウェイの内容が含まれるため、別に設定する
+    logging.getLogger("discord").setLevel(environ.get("DISCORD_LOG_LEVEL", "INFO"))
+
+
+async def shutdown():
+    """
+    キューに残っているログを出力してから終了する
+    """
+    await logger.complete()
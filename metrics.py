@@ -0,0 +1,440 @@
+# メトリクス
+
+# コマンドの所要時間やゲームの結果などを集計し、
+# Prometheusのテキスト形式でHTTPから取得できるようにする
+# 記録はdictの加算だけで行い、テキストは取得されたときだけ作成する
+# このモジュールはCogのリロードでは読み直されないため、リロードしても集計は続く
+
+# 環境変数
+# METRICS_PORT : 公開するポート (指定しない場合は公開しない)
+#                クラスタの場合はワーカーの番号を足したポートで公開する
+# METRICS_HOST : 公開するアドレス (デフォルト: 127.0.0.1)
+
+import asyncio
+import logging
+import math
+import os
+from bisect import bisect_left
+from typing import Callable
+from aiohttp import web
+
+
+# コマンドの所要時間のバケット (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 取得する値を返す関数 (ラベルの値のタプル → 値のdict、ラベルが無い場合は値)
+Collector = Callable[[], float | dict[tuple[str, ...], float]]
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if 0 < value else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """
+    メトリクスの基底クラス
+
+    Attributes
+    ----------
+    name : str
+        メトリクス名
+    help : str
+        説明
+    labels : tuple[str, ...]
+        ラベル名
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        """
+        コンストラクタ
+        作成したメトリクスはREGISTRYに登録する
+
+        Parameters
+        ----------
+        name: str
+            メトリクス名
+        help: str
+            説明
+        labels: tuple[str, ...]
+            ラベル名
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def samples(self) -> list[str]:
+        """
+        Prometheusのテキスト形式の行を作成する
+
+        Returns
+        -------
+        lines: list[str]
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        HELP・TYPEを含めたテキストを作成する
+
+        Returns
+        -------
+        text: str
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """
+    増えるだけの値
+
+    Attributes
+    ----------
+    __values : dict
+        キー : ラベルの値のタプル
+        値 : 値
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.__values: dict[tuple[str, ...], float] = dict()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        """
+        値を増やす
+
+        Parameters
+        ----------
+        label_values: str
+            ラベルの値 (ラベル名と同じ順番)
+        amount: float
+            増やす量
+        """
+        values = self.__values
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        """
+        値を取得する
+
+        Parameters
+        ----------
+        label_values: str
+            ラベルの値
+
+        Returns
+        -------
+        value: float
+        """
+        return self.__values.get(label_values, 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self.__values.items()
+        ]
+
+
+class Gauge(Metric):
+    """
+    増減する値
+    取得されたときに関数を呼び出して値を求めることもできる
+
+    Attributes
+    ----------
+    __values : dict
+        キー : ラベルの値のタプル
+        値 : 値
+    __function : Collector | None
+        値を求める関数
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.__values: dict[tuple[str, ...], float] = dict()
+        self.__function: Collector | None = None
+
+    def set(self, value: float, *label_values: str):
+        """
+        値を設定する
+
+        Parameters
+        ----------
+        value: float
+        label_values: str
+            ラベルの値
+        """
+        self.__values[label_values] = value
+
+    def set_function(self, function: Collector | None):
+        """
+        取得されたときに値を求める関数を設定する
+        (Noneの場合は解除する)
+
+        Parameters
+        ----------
+        function: Collector | None
+        """
+        self.__function = function
+
+    def samples(self) -> list[str]:
+        values = self.__values
+        if self.__function is not None:
+            collected = self.__function()
+            values = collected if isinstance(collected, dict) else {(): collected}
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """
+    値の分布
+
+    Attributes
+    ----------
+    __buckets : tuple[float, ...]
+        バケットの上限
+    __counts : dict
+        キー : ラベルの値のタプル
+        値 : バケットごとの件数 (累積しない、最後の要素は+Inf)
+    __sums : dict
+        キー : ラベルの値のタプル
+        値 : 値の合計
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.__buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self.__counts: dict[tuple[str, ...], list[int]] = dict()
+        self.__sums: dict[tuple[str, ...], float] = dict()
+
+    def observe(self, value: float, *label_values: str):
+        """
+        値を記録する
+
+        Parameters
+        ----------
+        value: float
+        label_values: str
+            ラベルの値
+        """
+        counts = self.__counts.get(label_values)
+        if counts is None:
+            counts = [0] * (len(self.__buckets) + 1)
+            self.__counts[label_values] = counts
+            self.__sums[label_values] = 0.0
+        counts[bisect_left(self.__buckets, value)] += 1
+        self.__sums[label_values] += value
+
+    def samples(self) -> list[str]:
+        lines = list()
+        names = self.labels + ("le",)
+        for key, counts in self.__counts.items():
+            total = 0
+            for bound, count in zip(self.__buckets + (math.inf,), counts):
+                total += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self.__sums[key])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+# 登録されたメトリクス
+REGISTRY: list[Metric] = list()
+
+
+# ----------
+# メトリクス
+# ----------
+
+COMMAND_DURATION = Histogram(
+    "ito_command_duration_seconds", "Command latency", ("command",)
+)
+COMMAND_ACK = Histogram(
+    "ito_command_ack_seconds",
+    "Time until a slash command is acknowledged (FAST_ACK only)",
+    ("command",),
+)
+COMMAND_ERRORS = Counter(
+    "ito_command_errors_total", "Commands that raised an exception", ("command",)
+)
+COMMAND_REJECTIONS = Counter(
+    "ito_command_rejections_total",
+    "Commands rejected by a guard",
+    ("command", "guard"),
+)
+GUARD_CHECKS = Counter(
+    "ito_guard_checks_total", "Guard evaluations before a command", ("guard",)
+)
+DMS = Counter("ito_dms_total", "Direct messages sent at game start", ("result",))
+GAMES = Counter(
+    "ito_games_total", "Games by outcome (started/cleared/lost/stopped)", ("result",)
+)
+BOARD_UPDATES = Counter(
+    "ito_board_updates_total",
+    "Live board updates (received/sent/edited)",
+    ("result",),
+)
+RATE_LIMITS = Counter(
+    "ito_rate_limits_total", "Discord rate limit responses (429)", ("scope",)
+)
+SESSIONS = Gauge("ito_sessions", "Active sessions")
+PLAYERS = Gauge("ito_players", "Players in active sessions")
+GATEWAY_LATENCY = Gauge(
+    "ito_gateway_latency_seconds", "Gateway heartbeat latency", ("shard",)
+)
+GATEWAY_EVENTS = Counter(
+    "ito_gateway_events_total", "Gateway events received", ("event",)
+)
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Resident memory size")
+
+
+def rss_bytes() -> float:
+    """
+    プロセスの常駐メモリのサイズを取得する
+    /procが無い環境ではNaNを返す
+
+    Returns
+    -------
+    rss: float
+        バイト数
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except OSError:
+        return math.nan
+    return float(pages * os.sysconf("SC_PAGE_SIZE"))
+
+
+PROCESS_RSS.set_function(rss_bytes)
+
+
+class RateLimitHandler(logging.Handler):
+    """
+    discord.pyのレート制限のログを数えるハンドラ
+    discord.pyはレート制限をイベントで通知しないため、ログから数える
+    グローバルのレート制限では"We are being rate limited"の直後に (awaitを挟まずに)
+    "Global rate limit"のログが出力されるため、ルートの制限はイベントループの
+    次の処理で数え、その前に"Global rate limit"が来た場合はglobalだけを数える
+
+    Attributes
+    ----------
+    __pending : bool
+        まだ数えていないルートの制限があるか
+    """
+
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.__pending: bool = False
+
+    def emit(self, record: logging.LogRecord):
+        message = record.msg
+        if not isinstance(message, str):
+            return
+        if message.startswith("We are being rate limited"):
+            self.__flush()
+            self.__pending = True
+            try:
+                asyncio.get_running_loop().call_soon(self.__flush)
+            except RuntimeError:
+                # イベントループの外ではすぐに数える
+                self.__flush()
+        elif message.startswith("Global rate limit"):
+            self.__pending = False
+            RATE_LIMITS.inc("global")
+
+    def __flush(self):
+        """
+        まだ数えていないルートの制限を数える
+        """
+        if self.__pending:
+            self.__pending = False
+            RATE_LIMITS.inc("route")
+
+
+def render() -> str:
+    """
+    すべてのメトリクスをPrometheusのテキスト形式に変換する
+
+    Returns
+    -------
+    text: str
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """
+    /metricsを公開するHTTPサーバーを起動する
+    discord.pyのレート制限のログも数え始める
+
+    Parameters
+    ----------
+    host: str
+    port: int
+
+    Returns
+    -------
+    runner: web.AppRunner
+        stop_server()に渡す
+    """
+    logging.getLogger("discord.http").addHandler(RateLimitHandler(logging.WARNING))
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def stop_server(runner: web.AppRunner):
+    """
+    HTTPサーバーを停止する
+
+    Parameters
+    ----------
+    runner: web.AppRunner
+    """
+    await runner.cleanup()
@@ -0,0 +1,437 @@
+# プロファイラ
+
+# 管理者の指示で、一定時間または次のN回のコマンドについて
+# CPU時間とメモリの確保をコマンドごとに集計する
+#   CPU    : 別スレッドから一定間隔でメインスレッドのスタックを取得し (サンプリング)、
+#            そのとき実行中だったタスクのコマンドごとに関数の出現回数を数える
+#   メモリ : コマンドの前後でtracemallocのスナップショットを取り、増えた箇所を数える
+#            スナップショットの取得は重いため、同時に1つのコマンドだけ、
+#            コマンドごとに最初のMEMORY_RUNS回だけ記録する
+#            (同時に実行されていた他のコマンドの確保も含む)
+# サンプリングのスレッドがGILを待たずにスタックを取得できるように、
+# プロファイリング中はスレッドの切り替え間隔を短くする
+# プロファイリングしていないときは、track()が何もしないコンテキストマネージャを返すだけ
+# 他のモジュールの読込み時間に影響しないように、標準ライブラリだけを使う
+
+import asyncio
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from time import monotonic
+from types import CodeType
+
+
+# サンプリングの間隔 (秒)
+DEFAULT_INTERVAL = 0.005
+
+# プロファイリングする時間の上限 (秒)
+MAX_SECONDS = 600
+
+# レポートに表示する件数
+TOP = 15
+
+# tracemallocで記録するスタックの深さ
+TRACE_DEPTH = 1
+
+# メモリの確保を記録するコマンドごとの回数
+MEMORY_RUNS = 10
+
+# コマンドの外で取得したサンプルの名前
+OUTSIDE = "(outside commands)"
+IDLE = "(idle)"
+
+# メモリの確保の記録から除くファイル (プロファイラ自身)
+IGNORED_FILES = (__file__, tracemalloc.__file__)
+
+# イベントループがタスクやコールバックを呼び出す関数
+# スタックはここまでを記録する (これより外側はすべてのサンプルで同じため)
+_HANDLE_RUN = asyncio.Handle._run.__code__
+
+
+def _label(code: CodeType) -> str:
+    """
+    関数の表示名を作成する
+
+    Parameters
+    ----------
+    code: CodeType
+
+    Returns
+    -------
+    label: str
+        "関数名 (ディレクトリ/ファイル名:行)"
+    """
+    path = os.path.join(*code.co_filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class Profile:
+    """
+    1回のプロファイリング
+
+    Attributes
+    ----------
+    __seconds : float
+        プロファイリングする時間 (秒)
+    __remaining : int | None
+        あと何回のコマンドでプロファイリングを終えるか (Noneの場合は時間だけ)
+    __interval : float
+        サンプリングの間隔 (秒)
+    __memory : bool
+        True: メモリの確保も記録する
+    __own_tracemalloc : bool
+        True: このプロファイリングでtracemallocを開始した
+    __switch_interval : float
+        開始前のスレッドの切り替え間隔 (秒)
+    __started : float
+        開始した時刻 (time.monotonic)
+    __finished : float | None
+        終了した時刻 (time.monotonic)
+    __samples : int
+        サンプルの数
+    __overhead : int
+        プロファイラ自身 (スナップショットの取得など) を実行していたサンプルの数
+    __self : dict
+        キー : コマンド名
+        値 : 実行中だった関数ごとのサンプルの数 (Counter)
+    __cumulative : dict
+        キー : コマンド名
+        値 : スタックに含まれていた関数ごとのサンプルの数 (Counter)
+    __allocations : dict
+        キー : コマンド名
+        値 : 確保した箇所ごとのバイト数 (Counter)
+    __memory_runs : Counter
+        コマンドごとのメモリの確保を記録した回数
+    __measuring : bool
+        True: メモリの確保を記録中のコマンドがある
+    __commands : Counter
+        コマンドごとの実行回数
+    __stop : threading.Event
+        サンプリングのスレッドを止める
+    __done : asyncio.Event
+        プロファイリングが終わったときにセットされる
+    __loop : asyncio.AbstractEventLoop
+        コマンドを実行するイベントループ
+    __tasks : dict
+        キー : コマンドを実行中のasyncio.Task
+        値 : コマンド名
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        commands: int | None,
+        interval: float,
+        memory: bool,
+    ):
+        """
+        コンストラクタ
+        start()から呼び出す
+        """
+        self.__seconds: float = seconds
+        self.__remaining: int | None = commands
+        self.__interval: float = interval
+        self.__memory: bool = memory
+        self.__own_tracemalloc: bool = False
+        self.__switch_interval: float = sys.getswitchinterval()
+        self.__started: float = monotonic()
+        self.__finished: float | None = None
+        self.__samples: int = 0
+        self.__overhead: int = 0
+        self.__self: dict[str, Counter] = dict()
+        self.__cumulative: dict[str, Counter] = dict()
+        self.__allocations: dict[str, Counter] = dict()
+        self.__memory_runs: Counter = Counter()
+        self.__measuring: bool = False
+        self.__commands: Counter = Counter()
+        self.__stop: threading.Event = threading.Event()
+        self.__done: asyncio.Event = asyncio.Event()
+        self.__loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self.__tasks: dict[asyncio.Task, str] = dict()
+        self.__thread: threading.Thread = threading.Thread(
+            target=self.__sample_loop,
+            args=(threading.main_thread().ident,),
+            name="profiler",
+            daemon=True,
+        )
+
+    # ----------
+    # 開始・終了
+    # ----------
+
+    def _start(self):
+        if self.__memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_DEPTH)
+            self.__own_tracemalloc = True
+        sys.setswitchinterval(min(self.__switch_interval, self.__interval / 10))
+        self.__thread.start()
+
+    def _stop(self):
+        if self.__finished is not None:
+            return
+        self.__finished = monotonic()
+        self.__stop.set()
+        self.__thread.join()
+        sys.setswitchinterval(self.__switch_interval)
+        if self.__own_tracemalloc:
+            tracemalloc.stop()
+        self.__done.set()
+
+    async def wait(self):
+        """
+        プロファイリングが終わるまで待つ
+        時間を過ぎた場合は終了する
+        """
+        try:
+            await asyncio.wait_for(self.__done.wait(), self.__seconds)
+        except asyncio.TimeoutError:
+            stop()
+
+    # ----------
+    # 記録
+    # ----------
+
+    def __sample_loop(self, thread_id: int):
+        """
+        一定間隔でメインスレッドのスタックを記録する
+        (サンプリング用のスレッドで実行する)
+        """
+        while not self.__stop.wait(self.__interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.__record_stack(frame)
+
+    def __record_stack(self, frame):
+        """
+        スタックを実行中のコマンドごとに記録する
+        コマンドのタスクを実行していなかった場合はコマンドの外として記録する
+        """
+        leaf = frame
+        labels: list[str] = list()
+        while frame is not None:
+            code = frame.f_code
+            if code is _HANDLE_RUN:
+                break
+            # プロファイラ自身の処理はコマンドに含めない
+            if code.co_filename == __file__:
+                self.__overhead += 1
+                return
+            labels.append(_label(code))
+            frame = frame.f_back
+        if not labels:
+            labels.append(_label(leaf.f_code))
+
+        command = self.__tasks.get(asyncio.current_task(self.__loop))
+        if command is None:
+            # イベントループの待機中
+            if leaf.f_code.co_name in ("select", "poll"):
+                command = IDLE
+            else:
+                command = OUTSIDE
+
+        self.__samples += 1
+        self.__self.setdefault(command, Counter())[labels[0]] += 1
+        self.__cumulative.setdefault(command, Counter()).update(set(labels))
+
+    def _begin(self, name: str) -> tracemalloc.Snapshot | None:
+        task = asyncio.current_task()
+        if task is not None:
+            self.__tasks[task] = name
+        if (
+            not self.__memory
+            or self.__measuring
+            or MEMORY_RUNS <= self.__memory_runs[name]
+        ):
+            return None
+        self.__measuring = True
+        return _snapshot()
+
+    def _end(self, name: str, before: tracemalloc.Snapshot | None):
+        self.__tasks.pop(asyncio.current_task(), None)
+        self.__commands[name] += 1
+        if before is not None:
+            self.__measuring = False
+            self.__memory_runs[name] += 1
+            after = _snapshot()
+            allocations = self.__allocations.setdefault(name, Counter())
+            for stat in after.compare_to(before, "lineno"):
+                if 0 < stat.size_diff:
+                    frame = stat.traceback[0]
+                    path = os.path.join(*frame.filename.split(os.sep)[-2:])
+                    allocations[f"{path}:{frame.lineno}"] += stat.size_diff
+
+        if self.__remaining is not None:
+            self.__remaining -= 1
+            if self.__remaining <= 0:
+                stop()
+
+    # ----------
+    # レポート
+    # ----------
+
+    def report(self, top: int = TOP) -> str:
+        """
+        コマンドごとの集計結果を作成する
+
+        Parameters
+        ----------
+        top: int
+            関数・確保した箇所を表示する件数
+
+        Returns
+        -------
+        report: str
+        """
+        elapsed = (self.__finished or monotonic()) - self.__started
+        total = max(1, self.__samples + self.__overhead)
+        idle = sum(self.__self.get(IDLE, Counter()).values())
+        lines = [
+            f"Profile: {elapsed:.1f}s, interval {self.__interval * 1000:.0f}ms,"
+            f" {self.__samples} samples (idle {idle * 100 / total:.0f}%,"
+            f" profiler {self.__overhead * 100 / total:.0f}%)",
+            "Commands: "
+            + (
+                ", ".join(f"{name} x{n}" for name, n in self.__commands.most_common())
+                or "none"
+            ),
+        ]
+        if self.__memory:
+            lines.append("Allocations include commands running at the same time")
+
+        names = [name for name, _ in self.__commands.most_common()]
+        names += [name for name in self.__self if name not in names and name != IDLE]
+        for name in names:
+            samples = sum(self.__self.get(name, Counter()).values())
+            runs = self.__commands[name]
+            lines += ["", f"== {name} ({runs} runs, {samples} samples) =="]
+            for title, counter in (
+                ("CPU self", self.__self.get(name)),
+                ("CPU cumulative", self.__cumulative.get(name)),
+            ):
+                if not counter:
+                    continue
+                lines.append(f"-- {title} --")
+                for label, count in counter.most_common(top):
+                    lines.append(f"{count:>7} {count * 100 / samples:>5.1f}%  {label}")
+            allocations = self.__allocations.get(name)
+            if allocations:
+                lines.append(f"-- Allocations ({self.__memory_runs[name]} runs) --")
+                for site, size in allocations.most_common(top):
+                    lines.append(f"{size / 1024:>10.1f} KiB  {site}")
+        return "\n".join(lines) + "\n"
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """
+    プロファイラ自身の確保を除いたスナップショットを取得する
+
+    Returns
+    -------
+    snapshot: tracemalloc.Snapshot
+    """
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, path) for path in IGNORED_FILES]
+    )
+
+
+# 実行中のプロファイリング
+_active: Profile | None = None
+
+# プロファイリングしていないときに返すコンテキストマネージャ
+_NULL = nullcontext()
+
+
+def is_active() -> bool:
+    """
+    プロファイリング中か判定する
+
+    Returns
+    -------
+    boolean
+    """
+    return _active is not None
+
+
+def start(
+    seconds: float,
+    commands: int | None = None,
+    interval: float = DEFAULT_INTERVAL,
+    memory: bool = True,
+) -> Profile:
+    """
+    プロファイリングを開始する
+
+    Parameters
+    ----------
+    seconds: float
+        プロファイリングする時間 (秒、MAX_SECONDSまで)
+    commands: int | None
+        指定した回数のコマンドを実行したら終了する
+    interval: float
+        サンプリングの間隔 (秒)
+    memory: bool
+        True: メモリの確保も記録する
+
+    Returns
+    -------
+    profile: Profile
+    """
+    global _active
+    if _active is not None:
+        raise RuntimeError("Profiler is already running")
+    _active = Profile(min(seconds, MAX_SECONDS), commands, interval, memory)
+    _active._start()
+    return _active
+
+
+def stop():
+    """
+    プロファイリングを終了する
+    """
+    global _active
+    profile, _active = _active, None
+    if profile is not None:
+        profile._stop()
+
+
+class _Tracker:
+    """
+    コマンドの実行中にメモリの確保を記録するコンテキストマネージャ
+    """
+
+    def __init__(self, profile: Profile, name: str):
+        self.__profile: Profile = profile
+        self.__name: str = name
+        self.__before: tracemalloc.Snapshot | None = None
+
+    def __enter__(self):
+        self.__before = self.__profile._begin(self.__name)
+
+    def __exit__(self, *exc_info):
+        # 実行中に終了した場合は記録しない
+        if self.__profile is _active:
+            self.__profile._end(self.__name, self.__before)
+
+
+def track(name: str):
+    """
+    コマンドの実行を記録する
+    プロファイリングしていない場合は何もしない
+
+    Parameters
+    ----------
+    name: str
+        コマンド名
+
+    Examples
+    --------
+    with profiler.track("put"):
+        ...
+    """
+    if _active is None:
+        return _NULL
+    return _Tracker(_active, name)
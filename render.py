@@ -0,0 +1,281 @@
+# 表示クラス
+
+# ゲームの状態からEmbedを作成する
+# ライフ・レベル・トークテーマや各プレイヤーの手札の表示は
+# Itoの状態が変わるまでキャッシュして使い回す
+
+from time import localtime, strftime, time
+from discord import Embed, Colour
+from ito import Ito
+
+
+# ----------
+# フッター
+# ----------
+
+# フッターの時刻 (分単位でキャッシュ)
+_footer_minute: int = -1
+_footer_text: str = ""
+
+
+def now() -> str:
+    """
+    フッターに表示する現在時刻を取得する
+    同じ分の間は前回作成した文字列を返す
+
+    Returns
+    -------
+    now: str
+        "%Y/%m/%d %H:%M"
+    """
+    global _footer_minute, _footer_text
+    current = time()
+    minute = int(current // 60)
+    if minute != _footer_minute:
+        _footer_minute = minute
+        _footer_text = strftime("%Y/%m/%d %H:%M", localtime(current))
+    return _footer_text
+
+
+def field(name: str, value: str, inline: bool) -> dict:
+    """
+    Embedのフィールドを作成する
+
+    Parameters
+    ----------
+    name: str
+    value: str
+    inline: bool
+
+    Returns
+    -------
+    field: dict
+    """
+    return {"name": name, "value": value, "inline": inline}
+
+
+def build(title: str, description: str, colour: Colour, fields: list[dict]) -> Embed:
+    """
+    フィールドのリストからEmbedを作成する
+
+    Parameters
+    ----------
+    title: str
+    description: str
+    colour: Colour
+    fields: list[dict]
+        field()で作成したフィールドのリスト
+
+    Returns
+    -------
+    embed: Embed
+    """
+    return Embed.from_dict(
+        {
+            "title": title,
+            "description": description,
+            "color": colour.value,
+            "fields": list(fields),
+            "footer": {"text": now()},
+        }
+    )
+
+
+class Renderer:
+    """
+    表示クラス
+
+    Attributes
+    ----------
+    __ito : Ito
+        ゲーム
+    __version : int
+        キャッシュを作成したときのItoの状態の番号
+    __cache : dict
+        キー : フィールドの種類
+        値 : フィールドのリスト
+    """
+
+    __slots__ = ("__ito", "__version", "__cache")
+
+    def __init__(self, ito: Ito):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        ito: Ito
+            ゲーム
+        """
+        self.__ito: Ito = ito
+        self.__version: int = -1
+        self.__cache: dict[str, list[dict]] = dict()
+
+    def __cached(self, kind: str) -> list[dict] | None:
+        """
+        キャッシュを取得する
+        Itoの状態が変わっていた場合はキャッシュを破棄する
+
+        Parameters
+        ----------
+        kind: str
+            フィールドの種類
+
+        Returns
+        -------
+        fields: list[dict] | None
+        """
+        version = self.__ito.get_version()
+        if version != self.__version:
+            self.__version = version
+            self.__cache.clear()
+            return None
+        return self.__cache.get(kind)
+
+    # ----------
+    # フィールド
+    # ----------
+
+    def header_fields(self, theme: bool = True, channel: bool = False) -> list[dict]:
+        """
+        ライフ・レベル・トークテーマのフィールドを取得する
+
+        Parameters
+        ----------
+        theme: bool
+            True: トークテーマを表示する
+        channel: bool
+            True: チャンネルを表示する
+
+        Returns
+        -------
+        fields: list[dict]
+        """
+        kind = f"header:{theme}:{channel}"
+        fields = self.__cached(kind)
+        if fields is None:
+            ito = self.__ito
+            fields = list()
+            if channel:
+                fields.append(field("チャンネル", ito.get_channel_name(), False))
+            # ゲームオーバー時にライフがマイナスにならないようにする
+            fields.append(field("ライフ", str(max(0, ito.get_life())), True))
+            fields.append(field("レベル", str(ito.get_level()), True))
+            if theme:
+                fields.append(field("トークテーマ", ito.get_theme(), False))
+            self.__cache[kind] = fields
+        return fields
+
+    def hand_fields(self, open: bool = False) -> list[dict]:
+        """
+        各プレイヤーの手札のフィールドを取得する
+
+        Parameters
+        ----------
+        open: bool
+            True: すべてのカードを表示する
+            False: 場に出していないカードは?と表示する
+
+        Returns
+        -------
+        fields: list[dict]
+        """
+        kind = f"hand:{open}"
+        fields = self.__cached(kind)
+        if fields is None:
+            fields = [
+                field(
+                    player.get_name(),
+                    player.hand_to_string_open()
+                    if open
+                    else player.hand_to_string_close(),
+                    True,
+                )
+                for player in self.__ito.get_players().values()
+            ]
+            self.__cache[kind] = fields
+        return fields
+
+    def player_list(self, empty: str = "") -> str:
+        """
+        参加者の一覧を取得する
+
+        Parameters
+        ----------
+        empty: str
+            参加者がいない場合に表示する文字列
+
+        Returns
+        -------
+        players: str
+        """
+        fields = self.__cached("players")
+        if fields is None:
+            players = "\n".join(self.__ito.get_player_name_list())
+            fields = [field("参加者", players, False)]
+            self.__cache["players"] = fields
+        return fields[0]["value"] or empty
+
+    # ----------
+    # Embed
+    # ----------
+
+    def board(
+        self,
+        title: str,
+        description: str,
+        colour: Colour,
+        *,
+        theme: bool = True,
+        open: bool = False,
+        channel: bool = False,
+        extra: list[dict] = (),
+    ) -> Embed:
+        """
+        ゲームの状態を表示するEmbedを作成する
+
+        Parameters
+        ----------
+        title: str
+        description: str
+        colour: Colour
+        theme: bool
+            True: トークテーマを表示する
+        open: bool
+            True: すべてのカードを表示する
+        channel: bool
+            True: チャンネルを表示する
+        extra: list[dict]
+            手札の前に追加するフィールド
+
+        Returns
+        -------
+        embed: Embed
+        """
+        fields = self.header_fields(theme, channel) + list(extra)
+        fields += self.hand_fields(open)
+        return build(title, description, colour, fields)
+
+    def dm_embeds(self) -> dict[int, Embed]:
+        """
+        ゲーム開始時に各プレイヤーに送るDMのEmbedを作成する
+        共通部分は一度だけ作成し、手札のフィールドだけを追加する
+
+        Returns
+        -------
+        embeds: dict
+            キー : discord.Member.id
+            値 : Embed
+        """
+        base = self.header_fields(theme=True, channel=True)
+        embeds: dict[int, Embed] = dict()
+        for player_id, player in self.__ito.get_players().items():
+            hand = field(
+                "カード (他の人に教えないように！)",
+                player.hand_to_string_open(),
+                False,
+            )
+            embeds[player_id] = build(
+                "Game start!!!", "ゲーム情報", Colour.dark_blue(), base + [hand]
+            )
+        return embeds
@@ -0,0 +1,517 @@
+# セッション管理クラス
+
+# サーバー・チャンネルごとに独立したゲームを管理する
+# (guild_id, channel_id) をキーとしてItoを保持し、
+# 一定時間使われていないセッションを破棄する
+
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import monotonic, perf_counter
+from typing import Callable
+from ito import Ito
+from render import Renderer
+from board import LiveBoard, DEFAULT_DELAY
+
+
+# セッションのキー (guild_id, channel_id)
+SessionKey = tuple[int | None, int]
+
+
+class Session:
+    """
+    セッションクラス
+
+    Attributes
+    ----------
+    __key : SessionKey
+        (guild_id, channel_id)
+    __ito : Ito
+        ゲーム
+    __last_access : float
+        最後にアクセスされた時刻 (time.monotonic)
+    __renderer : Renderer | None
+        表示クラス (最初に使うときに作成する)
+    __board : LiveBoard | None
+        盤面のメッセージ (最初に使うときに作成する)
+    __lock : asyncio.Lock
+        ゲームを変更するコマンドを1つずつ実行するためのロック
+    __waiting : int
+        ロックを待っているコマンドの数
+    __max_waiting : int
+        ロックを待っているコマンドの数の最大値
+    __commands : int
+        ロックを取得したコマンドの数
+    __wait_total : float
+        ロックの待ち時間の合計 (秒)
+    __wait_max : float
+        ロックの待ち時間の最大値 (秒)
+    """
+
+    __slots__ = (
+        "__key",
+        "__ito",
+        "__last_access",
+        "__renderer",
+        "__board",
+        "__lock",
+        "__waiting",
+        "__max_waiting",
+        "__commands",
+        "__wait_total",
+        "__wait_max",
+    )
+
+    def __init__(self, key: SessionKey, ito: Ito | None = None):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        key: SessionKey
+            (guild_id, channel_id)
+        ito: Ito | None
+            復元したゲーム (Noneの場合は新しく作成する)
+        """
+        self.__key: SessionKey = key
+        self.__ito: Ito = ito if ito is not None else Ito()
+        self.__last_access: float = monotonic()
+        self.__renderer: Renderer | None = None
+        self.__board: LiveBoard | None = None
+        self.__lock: asyncio.Lock = asyncio.Lock()
+        self.__waiting: int = 0
+        self.__max_waiting: int = 0
+        self.__commands: int = 0
+        self.__wait_total: float = 0.0
+        self.__wait_max: float = 0.0
+
+    def get_key(self) -> SessionKey:
+        """
+        キーを取得する
+
+        Returns
+        -------
+        key: SessionKey
+        """
+        return self.__key
+
+    def get_ito(self) -> Ito:
+        """
+        ゲームを取得する
+
+        Returns
+        -------
+        ito: Ito
+        """
+        return self.__ito
+
+    def get_renderer(self) -> Renderer:
+        """
+        表示クラスを取得する
+
+        Returns
+        -------
+        renderer: Renderer
+        """
+        if self.__renderer is None:
+            self.__renderer = Renderer(self.__ito)
+        return self.__renderer
+
+    def get_board(self, delay: float = DEFAULT_DELAY) -> LiveBoard:
+        """
+        盤面のメッセージを取得する
+
+        Parameters
+        ----------
+        delay: float
+            更新をまとめる間隔 (秒) (最初に作成するときだけ使う)
+
+        Returns
+        -------
+        board: LiveBoard
+        """
+        if self.__board is None:
+            self.__board = LiveBoard(self.get_renderer(), delay)
+        return self.__board
+
+    def has_board(self) -> bool:
+        """
+        盤面のメッセージを作成済みか判定する
+
+        Returns
+        -------
+        boolean
+        """
+        return self.__board is not None
+
+    def get_last_access(self) -> float:
+        """
+        最後にアクセスされた時刻を取得する
+
+        Returns
+        -------
+        last_access: float
+        """
+        return self.__last_access
+
+    def touch(self):
+        """
+        最終アクセス時刻を更新する
+        """
+        self.__last_access = monotonic()
+
+    # ----------
+    # 排他制御
+    # ----------
+
+    @asynccontextmanager
+    async def serialize(self):
+        """
+        セッション内のコマンドを1つずつ実行する
+        別のセッションのコマンドとは並列に実行される
+
+        Examples
+        --------
+        async with session.serialize():
+            ...
+        """
+        wait = 0.0
+        if self.__lock.locked():
+            # 他のコマンドが実行中の場合は順番を待つ
+            self.__waiting += 1
+            self.__max_waiting = max(self.__max_waiting, self.__waiting)
+            start = perf_counter()
+            try:
+                await self.__lock.acquire()
+            finally:
+                self.__waiting -= 1
+            wait = perf_counter() - start
+        else:
+            await self.__lock.acquire()
+
+        self.__commands += 1
+        self.__wait_total += wait
+        self.__wait_max = max(self.__wait_max, wait)
+        try:
+            yield wait
+        finally:
+            self.__lock.release()
+
+    def is_busy(self) -> bool:
+        """
+        コマンドの実行中、またはロックを待っているコマンドがあるか判定する
+
+        Returns
+        -------
+        boolean
+        """
+        return self.__lock.locked() or 0 < self.__waiting
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        ロックの待ち状況を取得する
+
+        Returns
+        -------
+        stats: dict
+            waiting : 現在ロックを待っているコマンドの数
+            max_waiting : ロックを待っているコマンドの数の最大値
+            commands : ロックを取得したコマンドの数
+            wait_total : 待ち時間の合計 (秒)
+            wait_max : 待ち時間の最大値 (秒)
+        """
+        return {
+            "waiting": self.__waiting,
+            "max_waiting": self.__max_waiting,
+            "commands": self.__commands,
+            "wait_total": self.__wait_total,
+            "wait_max": self.__wait_max,
+        }
+
+
+class SessionManager:
+    """
+    セッション管理クラス
+
+    Attributes
+    ----------
+    __sessions : OrderedDict
+        キー : SessionKey
+        値 : Session
+        最近使われたセッションほど末尾にある
+    __members : dict
+        キー : discord.Member.id
+        値 : 参加しているセッションのSessionKey
+    __max_sessions : int
+        保持するセッションの上限 (超えた場合は最も古いものから破棄)
+    __ttl : float
+        最後のアクセスからセッションを破棄するまでの秒数
+    __on_evict : Callable | None
+        アイドル状態・上限超過でセッションを破棄したときに呼び出す関数
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: float = 6 * 60 * 60,
+        on_evict: Callable[[Session], None] | None = None,
+        members: dict[int, SessionKey] | None = None,
+    ):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        max_sessions: int
+            保持するセッションの上限
+        ttl: float
+            アイドル状態のセッションを破棄するまでの秒数
+        on_evict: Callable | None
+            アイドル状態・上限超過でセッションを破棄したときに呼び出す関数
+            (引数は破棄したSession、保存して後で復元できるようにする)
+        members: dict | None
+            プレイヤーの参加登録 (複数のSessionManagerで共有する場合に渡す)
+        """
+        self.__sessions: OrderedDict[SessionKey, Session] = OrderedDict()
+        self.__members: dict[int, SessionKey] = (
+            members if members is not None else dict()
+        )
+        self.__max_sessions: int = max_sessions
+        self.__ttl: float = ttl
+        self.__on_evict: Callable[[Session], None] | None = on_evict
+
+    def __len__(self) -> int:
+        return len(self.__sessions)
+
+    # ----------
+    # セッション
+    # ----------
+
+    def get(self, guild_id: int | None, channel_id: int) -> Session | None:
+        """
+        セッションを取得する
+        存在しない場合はNoneを返す
+
+        Parameters
+        ----------
+        guild_id: int | None
+            サーバーID (DMの場合はNone)
+        channel_id: int
+            チャンネルID
+
+        Returns
+        -------
+        session: Session | None
+        """
+        key = (guild_id, channel_id)
+        session = self.__sessions.get(key)
+        if session is None:
+            return None
+
+        session.touch()
+        self.__sessions.move_to_end(key)
+        return session
+
+    def get_or_create(self, guild_id: int | None, channel_id: int) -> Session:
+        """
+        セッションを取得する
+        存在しない場合は新しく作成する
+
+        Parameters
+        ----------
+        guild_id: int | None
+            サーバーID (DMの場合はNone)
+        channel_id: int
+            チャンネルID
+
+        Returns
+        -------
+        session: Session
+        """
+        session = self.get(guild_id, channel_id)
+        if session is not None:
+            return session
+
+        # 新しいセッションを作る前に古いセッションを破棄する
+        self.evict()
+
+        key = (guild_id, channel_id)
+        session = Session(key)
+        self.__sessions[key] = session
+        return session
+
+    def adopt(self, key: SessionKey, ito: Ito) -> Session:
+        """
+        復元したゲームをセッションとして登録し、プレイヤーの参加登録も行う
+        (1人のプレイヤーは1つのゲームにだけ参加できる)
+
+        Parameters
+        ----------
+        key: SessionKey
+        ito: Ito
+            復元したゲーム
+
+        Returns
+        -------
+        session: Session
+
+        Raises
+        ------
+        ValueError
+            プレイヤーが他のセッションに参加している
+            (呼び出し側でそのプレイヤーを除外してから復元する)
+        """
+        conflicts = [
+            member_id
+            for member_id in ito.get_player_id_list()
+            if self.__members.get(member_id, key) != key
+            and self.__members[member_id] in self.__sessions
+        ]
+        if conflicts:
+            raise ValueError(f"Players already in another session: {conflicts}")
+
+        self.remove(key)
+        self.evict()
+
+        session = Session(key, ito)
+        self.__sessions[key] = session
+        for member_id in ito.get_player_id_list():
+            self.__members[member_id] = key
+        return session
+
+    def remove(self, key: SessionKey) -> Session | None:
+        """
+        セッションを破棄する
+        参加していたプレイヤーの登録も解除する
+        (on_evictは呼び出さない)
+
+        Parameters
+        ----------
+        key: SessionKey
+
+        Returns
+        -------
+        session: Session | None
+            破棄したセッション (存在しない場合はNone)
+        """
+        session = self.__sessions.pop(key, None)
+        if session is None:
+            return None
+
+        for member_id in session.get_ito().get_player_id_list():
+            if self.__members.get(member_id) == key:
+                del self.__members[member_id]
+        return session
+
+    def evict(self) -> list[SessionKey]:
+        """
+        アイドル状態のセッションと上限を超えたセッションを破棄する
+        コマンドの実行中・待機中のセッションは破棄しない
+
+        Returns
+        -------
+        evicted: list[SessionKey]
+            破棄したセッションのキー
+        """
+        deadline = monotonic() - self.__ttl
+
+        # 先頭ほど古いので、期限内のセッションが見つかった時点で止める
+        remaining = len(self.__sessions)
+        evicted: list[SessionKey] = list()
+        for key, session in self.__sessions.items():
+            over_capacity = remaining >= self.__max_sessions
+            if not over_capacity and deadline < session.get_last_access():
+                break
+            if session.is_busy():
+                continue
+            evicted.append(key)
+            remaining -= 1
+
+        for key in evicted:
+            session = self.remove(key)
+            if self.__on_evict is not None:
+                self.__on_evict(session)
+        return evicted
+
+    def get_sessions(self) -> list[Session]:
+        """
+        すべてのセッションを取得する
+
+        Returns
+        -------
+        sessions: list[Session]
+        """
+        return list(self.__sessions.values())
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        すべてのセッションのロックの待ち状況を集計する
+
+        Returns
+        -------
+        stats: dict
+            sessions : セッション数
+            waiting : 現在ロックを待っているコマンドの数
+            commands : ロックを取得したコマンドの数
+            wait_total : 待ち時間の合計 (秒)
+            wait_max : 待ち時間の最大値 (秒)
+        """
+        stats = {
+            "sessions": len(self.__sessions),
+            "waiting": 0,
+            "commands": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+        for session in self.__sessions.values():
+            session_stats = session.get_stats()
+            stats["waiting"] += session_stats["waiting"]
+            stats["commands"] += session_stats["commands"]
+            stats["wait_total"] += session_stats["wait_total"]
+            stats["wait_max"] = max(stats["wait_max"], session_stats["wait_max"])
+        return stats
+
+    # ----------
+    # プレイヤー
+    # ----------
+
+    def bind_member(self, member_id: int, key: SessionKey):
+        """
+        プレイヤーが参加しているセッションを登録する
+
+        Parameters
+        ----------
+        member_id: int
+            discord.Member.id
+        key: SessionKey
+        """
+        self.__members[member_id] = key
+
+    def unbind_member(self, member_id: int):
+        """
+        プレイヤーが参加しているセッションの登録を解除する
+
+        Parameters
+        ----------
+        member_id: int
+            discord.Member.id
+        """
+        self.__members.pop(member_id, None)
+
+    def get_member_session(self, member_id: int) -> Session | None:
+        """
+        プレイヤーが参加しているセッションを取得する
+
+        Parameters
+        ----------
+        member_id: int
+            discord.Member.id
+
+        Returns
+        -------
+        session: Session | None
+        """
+        key = self.__members.get(member_id)
+        if key is None:
+            return None
+        return self.__sessions.get(key)
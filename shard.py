@@ -0,0 +1,364 @@
+# シャードごとのセッション管理
+
+# AutoShardedBotで複数のゲートウェイ接続に分けて動かす場合に、
+# セッションをシャードごとに別のSessionManagerで管理する
+# 同時に実行するコマンドの数もシャードごとに制限し、
+# 1つのシャードにコマンドが集中しても他のシャードが待たされないようにする
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import Callable
+from ito import Ito
+from session import Session, SessionKey, SessionManager
+
+
+# シャードごとに同時に実行するコマンドの上限
+DEFAULT_SHARD_CONCURRENCY = 64
+
+# コマンドの実行頻度を集計する期間 (秒)
+RATE_WINDOW = 60.0
+
+
+def shard_of(guild_id: int | None, shard_count: int) -> int:
+    """
+    サーバーを担当するシャードの番号を取得する
+    discord.Guild.shard_idと同じ計算をする
+
+    Parameters
+    ----------
+    guild_id: int | None
+        サーバーID (DMの場合はNone)
+    shard_count: int
+        シャードの数
+
+    Returns
+    -------
+    shard_id: int
+        DMの場合は0
+    """
+    if guild_id is None or shard_count <= 1:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+class ShardStats:
+    """
+    シャードごとのコマンドの実行状況
+
+    Attributes
+    ----------
+    __commands : int
+        実行したコマンドの数
+    __latency_total : float
+        コマンドの所要時間の合計 (秒)
+    __latency_max : float
+        コマンドの所要時間の最大値 (秒)
+    __recent : deque
+        直近RATE_WINDOW秒間にコマンドを実行した時刻 (time.monotonic)
+    """
+
+    def __init__(self):
+        """
+        コンストラクタ
+        """
+        self.__commands: int = 0
+        self.__latency_total: float = 0.0
+        self.__latency_max: float = 0.0
+        self.__recent: deque[float] = deque()
+
+    def record(self, latency: float):
+        """
+        コマンドの実行を記録する
+
+        Parameters
+        ----------
+        latency: float
+            コマンドの所要時間 (秒)
+        """
+        now = monotonic()
+        self.__commands += 1
+        self.__latency_total += latency
+        self.__latency_max = max(self.__latency_max, latency)
+        self.__recent.append(now)
+        self.__expire(now)
+
+    def __expire(self, now: float):
+        """
+        集計期間を過ぎた記録を削除する
+
+        Parameters
+        ----------
+        now: float
+            現在時刻 (time.monotonic)
+        """
+        while self.__recent and self.__recent[0] < now - RATE_WINDOW:
+            self.__recent.popleft()
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        実行状況を取得する
+
+        Returns
+        -------
+        stats: dict
+            commands : 実行したコマンドの数
+            rate : 1分あたりのコマンドの数
+            latency_avg : 所要時間の平均 (秒)
+            latency_max : 所要時間の最大値 (秒)
+        """
+        self.__expire(monotonic())
+        return {
+            "commands": self.__commands,
+            "rate": len(self.__recent) * 60.0 / RATE_WINDOW,
+            "latency_avg": self.__latency_total / max(1, self.__commands),
+            "latency_max": self.__latency_max,
+        }
+
+
+class ShardedSessions:
+    """
+    シャードごとにSessionManagerを持つセッション管理クラス
+    SessionManagerと同じように使える
+
+    Attributes
+    ----------
+    __shard_count : Callable
+        現在のシャードの数を返す関数 (接続後に決まるため毎回取得する)
+    __concurrency : int
+        シャードごとに同時に実行するコマンドの上限
+    __on_evict : Callable | None
+        アイドル状態・上限超過でセッションを破棄したときに呼び出す関数
+    __managers : dict
+        キー : シャードの番号
+        値 : SessionManager
+    __members : dict
+        キー : discord.Member.id
+        値 : 参加しているセッションのSessionKey
+        (すべてのシャードのSessionManagerで共有し、シャードを探さずに引けるようにする)
+    __limits : dict
+        キー : シャードの番号
+        値 : 同時に実行するコマンドを制限するasyncio.Semaphore
+    __stats : dict
+        キー : シャードの番号
+        値 : ShardStats
+    """
+
+    def __init__(
+        self,
+        shard_count: Callable[[], int],
+        concurrency: int = DEFAULT_SHARD_CONCURRENCY,
+        on_evict: Callable[[Session], None] | None = None,
+    ):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        shard_count: Callable
+            現在のシャードの数を返す関数
+        concurrency: int
+            シャードごとに同時に実行するコマンドの上限
+        on_evict: Callable | None
+            アイドル状態・上限超過でセッションを破棄したときに呼び出す関数
+            (引数は破棄したSession)
+        """
+        self.__shard_count: Callable[[], int] = shard_count
+        self.__concurrency: int = max(1, concurrency)
+        self.__on_evict: Callable[[Session], None] | None = on_evict
+        self.__managers: dict[int, SessionManager] = dict()
+        self.__members: dict[int, SessionKey] = dict()
+        self.__limits: dict[int, asyncio.Semaphore] = dict()
+        self.__stats: dict[int, ShardStats] = dict()
+
+    def __len__(self) -> int:
+        return sum(len(manager) for manager in self.__managers.values())
+
+    # ----------
+    # シャード
+    # ----------
+
+    def get_shard_id(self, key: SessionKey) -> int:
+        """
+        セッションを担当するシャードの番号を取得する
+
+        Parameters
+        ----------
+        key: SessionKey
+
+        Returns
+        -------
+        shard_id: int
+        """
+        return shard_of(key[0], self.__shard_count())
+
+    def get_manager(self, shard_id: int) -> SessionManager:
+        """
+        シャードのSessionManagerを取得する
+        存在しない場合は新しく作成する
+
+        Parameters
+        ----------
+        shard_id: int
+
+        Returns
+        -------
+        manager: SessionManager
+        """
+        manager = self.__managers.get(shard_id)
+        if manager is None:
+            manager = SessionManager(on_evict=self.__on_evict, members=self.__members)
+            self.__managers[shard_id] = manager
+            self.__limits[shard_id] = asyncio.Semaphore(self.__concurrency)
+            self.__stats[shard_id] = ShardStats()
+        return manager
+
+    def __manager_for(self, key: SessionKey) -> SessionManager:
+        return self.get_manager(self.get_shard_id(key))
+
+    @asynccontextmanager
+    async def slot(self, key: SessionKey):
+        """
+        シャードごとの同時実行数の上限を守ってコマンドを実行する
+        実行が終わったら所要時間をシャードの実行状況に記録する
+
+        Parameters
+        ----------
+        key: SessionKey
+            コマンドを実行するセッション
+
+        Examples
+        --------
+        async with sessions.slot(key):
+            ...
+        """
+        shard_id = self.get_shard_id(key)
+        self.get_manager(shard_id)
+        start = monotonic()
+        async with self.__limits[shard_id]:
+            try:
+                yield
+            finally:
+                self.__stats[shard_id].record(monotonic() - start)
+
+    # ----------
+    # セッション
+    # ----------
+
+    def get(self, guild_id: int | None, channel_id: int) -> Session | None:
+        """
+        SessionManager.get()と同じ
+        """
+        return self.__manager_for((guild_id, channel_id)).get(guild_id, channel_id)
+
+    def get_or_create(self, guild_id: int | None, channel_id: int) -> Session:
+        """
+        SessionManager.get_or_create()と同じ
+        """
+        manager = self.__manager_for((guild_id, channel_id))
+        return manager.get_or_create(guild_id, channel_id)
+
+    def adopt(self, key: SessionKey, ito: Ito) -> Session:
+        """
+        SessionManager.adopt()と同じ
+        他のシャードのセッションに参加しているプレイヤーもValueErrorにする
+        """
+        conflicts = [
+            member_id
+            for member_id in ito.get_player_id_list()
+            if self.__members.get(member_id, key) != key
+            and self.get_member_session(member_id) is not None
+        ]
+        if conflicts:
+            raise ValueError(f"Players already in another session: {conflicts}")
+        return self.__manager_for(key).adopt(key, ito)
+
+    def remove(self, key: SessionKey) -> Session | None:
+        """
+        SessionManager.remove()と同じ
+        """
+        return self.__manager_for(key).remove(key)
+
+    def evict(self) -> list[SessionKey]:
+        """
+        すべてのシャードでSessionManager.evict()を実行する
+        """
+        evicted: list[SessionKey] = list()
+        for manager in self.__managers.values():
+            evicted += manager.evict()
+        return evicted
+
+    def get_sessions(self) -> list[Session]:
+        """
+        すべてのシャードのセッションを取得する
+        """
+        sessions: list[Session] = list()
+        for manager in self.__managers.values():
+            sessions += manager.get_sessions()
+        return sessions
+
+    def get_stats(self) -> dict[str, int | float]:
+        """
+        すべてのシャードのSessionManager.get_stats()を集計する
+        """
+        stats = {
+            "sessions": 0,
+            "waiting": 0,
+            "commands": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+        for manager in self.__managers.values():
+            manager_stats = manager.get_stats()
+            for key in ("sessions", "waiting", "commands", "wait_total"):
+                stats[key] += manager_stats[key]
+            stats["wait_max"] = max(stats["wait_max"], manager_stats["wait_max"])
+        return stats
+
+    def get_shard_stats(self) -> dict[int, dict[str, int | float]]:
+        """
+        シャードごとの実行状況を取得する
+
+        Returns
+        -------
+        stats: dict
+            キー : シャードの番号
+            値 : ShardStats.get_stats()にsessions (セッション数) と
+                 waiting (セッションのロックを待っているコマンドの数) を加えたもの
+        """
+        stats: dict[int, dict[str, int | float]] = dict()
+        for shard_id in sorted(self.__managers):
+            manager_stats = self.__managers[shard_id].get_stats()
+            stats[shard_id] = {
+                "sessions": manager_stats["sessions"],
+                "waiting": manager_stats["waiting"],
+                **self.__stats[shard_id].get_stats(),
+            }
+        return stats
+
+    # ----------
+    # プレイヤー
+    # ----------
+
+    def bind_member(self, member_id: int, key: SessionKey):
+        """
+        SessionManager.bind_member()と同じ
+        """
+        self.__manager_for(key).bind_member(member_id, key)
+
+    def unbind_member(self, member_id: int):
+        """
+        SessionManager.unbind_member()と同じ
+        """
+        self.__members.pop(member_id, None)
+
+    def get_member_session(self, member_id: int) -> Session | None:
+        """
+        SessionManager.get_member_session()と同じ
+        登録されたキーからシャードを決めるので、すべてのシャードを探さない
+        """
+        key = self.__members.get(member_id)
+        if key is None:
+            return None
+        return self.__manager_for(key).get_member_session(member_id)
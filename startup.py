@@ -0,0 +1,85 @@
+# 起動時間の計測
+
+# 起動してから最初のコマンドを実行するまでの各段階の所要時間を記録する
+# (モジュールの読込み、Cogの読込み、ログイン、READY、最初のコマンド)
+# 計測の基準はこのモジュールを読み込んだ時刻のため、最初に読み込む
+# 他のモジュールの読込み時間に影響しないように、標準ライブラリだけを使う
+
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# 計測の基準の時刻
+_origin: float = perf_counter()
+
+# 記録した段階 (名前, 基準からの終了時刻, 所要時間)
+# 所要時間がNoneの場合はその時点に到達したことだけを表す
+_records: list[tuple[str, float, float | None]] = list()
+
+# 記録した段階・時点の名前
+_names: set[str] = set()
+
+
+@contextmanager
+def phase(name: str):
+    """
+    段階の所要時間を記録する
+    同じ名前の段階は最初の1回だけ記録する
+
+    Parameters
+    ----------
+    name: str
+        段階の名前
+
+    Examples
+    --------
+    with startup.phase("import discord"):
+        import discord
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        end = perf_counter()
+        if name not in _names:
+            _names.add(name)
+            _records.append((name, end - _origin, end - start))
+
+
+def mark(name: str) -> bool:
+    """
+    ある時点に到達したことを記録する
+    同じ名前の時点は最初の1回だけ記録する
+
+    Parameters
+    ----------
+    name: str
+        時点の名前
+
+    Returns
+    -------
+    boolean
+        True: 初めて到達した False: すでに到達していた
+    """
+    if name in _names:
+        return False
+    _names.add(name)
+    _records.append((name, perf_counter() - _origin, None))
+    return True
+
+
+def report() -> str:
+    """
+    記録した段階の一覧を作成する
+
+    Returns
+    -------
+    report: str
+    """
+    width = max((len(name) for name, _, _ in _records), default=0)
+    lines = ["Startup profile"]
+    for name, at, duration in _records:
+        took = "" if duration is None else f"{duration * 1000:.1f}ms"
+        lines.append(f"  {name:<{width}} {took:>10}  (at {at * 1000:.1f}ms)")
+    return "\n".join(lines)
+
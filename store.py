@@ -0,0 +1,293 @@
+# 保存クラス
+
+# セッションの状態をSQLiteに保存する
+# コマンドの実行中は変更があったことだけを記録し、
+# 一定間隔でまとめて書き込む (write-behind)
+# 書き込みは別スレッドで行うため、コマンドはディスクを待たない
+
+import asyncio
+import json
+import sqlite3
+import zlib
+from time import time
+from loguru import logger
+from session import Session, SessionKey
+
+
+# 書き込む間隔 (秒)
+DEFAULT_INTERVAL = 2.0
+
+
+def encode(session: Session) -> bytes:
+    """
+    セッションを保存用のバイト列に変換する
+
+    Parameters
+    ----------
+    session: Session
+
+    Returns
+    -------
+    data: bytes
+    """
+    snapshot = session.get_ito().to_snapshot()
+    text = json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(text.encode(), 1)
+
+
+def decode(data: bytes) -> dict:
+    """
+    保存用のバイト列をItoのsnapshotに戻す
+
+    Parameters
+    ----------
+    data: bytes
+
+    Returns
+    -------
+    snapshot: dict
+    """
+    return json.loads(zlib.decompress(data))
+
+
+def key_to_text(key: SessionKey) -> str:
+    """
+    セッションのキーを保存用の文字列に変換する
+
+    Parameters
+    ----------
+    key: SessionKey
+
+    Returns
+    -------
+    text: str
+        "guild_id:channel_id" (DMの場合はguild_idが空)
+    """
+    guild_id, channel_id = key
+    return f"{'' if guild_id is None else guild_id}:{channel_id}"
+
+
+def text_to_key(text: str) -> SessionKey:
+    """
+    保存用の文字列をセッションのキーに戻す
+
+    Parameters
+    ----------
+    text: str
+
+    Returns
+    -------
+    key: SessionKey
+    """
+    guild_id, channel_id = text.split(":")
+    return (int(guild_id) if guild_id else None, int(channel_id))
+
+
+class NullStore:
+    """
+    何も保存しないクラス
+    保存を無効にする場合に使う
+    """
+
+    def open(self):
+        pass
+
+    async def load_all(self) -> dict[SessionKey, bytes]:
+        return dict()
+
+    def mark_dirty(self, session: Session):
+        pass
+
+    def delete(self, key: SessionKey):
+        pass
+
+    def start(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SqliteStore(NullStore):
+    """
+    SQLiteに保存するクラス
+
+    Attributes
+    ----------
+    __path : str
+        データベースファイルのパス
+    __interval : float
+        書き込む間隔 (秒)
+    __connection : sqlite3.Connection | None
+    __dirty : dict
+        キー : SessionKey
+        値 : 変更があったSession
+    __deleted : set
+        削除するSessionKey
+    __lock : asyncio.Lock
+        書き込みを1つずつ行うためのロック
+    __stop : asyncio.Event
+        定期的に書き込むタスクを止める合図
+    __task : asyncio.Task | None
+        定期的に書き込むタスク
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_INTERVAL):
+        """
+        コンストラクタ
+
+        Parameters
+        ----------
+        path: str
+            データベースファイルのパス
+        interval: float
+            書き込む間隔 (秒)
+        """
+        self.__path: str = path
+        self.__interval: float = interval
+        self.__connection: sqlite3.Connection | None = None
+        self.__dirty: dict[SessionKey, Session] = dict()
+        self.__deleted: set[SessionKey] = set()
+        self.__lock: asyncio.Lock = asyncio.Lock()
+        self.__stop: asyncio.Event = asyncio.Event()
+        self.__task: asyncio.Task | None = None
+
+    def open(self):
+        """
+        データベースを開く
+        """
+        connection = sqlite3.connect(self.__path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions"
+            " (key TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        connection.commit()
+        self.__connection = connection
+
+    async def load_all(self) -> dict[SessionKey, bytes]:
+        """
+        保存されているセッションをすべて読み込む
+        復元は最初にアクセスされたときに行うため、ここではバイト列のまま返す
+
+        Returns
+        -------
+        sessions: dict
+            キー : SessionKey
+            値 : 保存用のバイト列
+        """
+
+        def load() -> list[tuple[str, bytes]]:
+            cursor = self.__connection.execute("SELECT key, data FROM sessions")
+            return cursor.fetchall()
+
+        rows = await asyncio.to_thread(load)
+        return {text_to_key(text): data for text, data in rows}
+
+    def mark_dirty(self, session: Session):
+        """
+        セッションに変更があったことを記録する
+        実際の書き込みは次のflush()で行う
+
+        Parameters
+        ----------
+        session: Session
+        """
+        key = session.get_key()
+        self.__deleted.discard(key)
+        self.__dirty[key] = session
+
+    def delete(self, key: SessionKey):
+        """
+        セッションを削除する
+        実際の削除は次のflush()で行う
+
+        Parameters
+        ----------
+        key: SessionKey
+        """
+        self.__dirty.pop(key, None)
+        self.__deleted.add(key)
+
+    def start(self):
+        """
+        定期的に書き込むタスクを開始する
+        """
+        if self.__task is None:
+            self.__stop.clear()
+            self.__task = asyncio.create_task(self.__run())
+
+    async def __run(self):
+        """
+        止める合図があるまで、一定間隔で書き込む
+        (書き込みの途中では止めない)
+        """
+        while not self.__stop.is_set():
+            try:
+                await asyncio.wait_for(self.__stop.wait(), self.__interval)
+            except asyncio.TimeoutError:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("Failed to flush sessions")
+
+    async def flush(self):
+        """
+        変更があったセッションをまとめて書き込む
+        書き込めなかった場合は、次のflush()で書き込み直す
+        """
+        async with self.__lock:
+            if not self.__dirty and not self.__deleted:
+                return
+
+            # 状態の変換はイベントループ上で行い、書き込みだけを別スレッドで行う
+            now = time()
+            rows = [
+                (key_to_text(key), encode(session), now)
+                for key, session in self.__dirty.items()
+            ]
+            deleted = [(key_to_text(key),) for key in self.__deleted]
+            dirty, self.__dirty = self.__dirty, dict()
+            removed, self.__deleted = self.__deleted, set()
+
+            def write():
+                with self.__connection:
+                    self.__connection.executemany(
+                        "INSERT OR REPLACE INTO sessions (key, data, updated)"
+                        " VALUES (?, ?, ?)",
+                        rows,
+                    )
+                    self.__connection.executemany(
+                        "DELETE FROM sessions WHERE key = ?", deleted
+                    )
+
+            try:
+                await asyncio.to_thread(write)
+            except BaseException:
+                # 書き込み中に変更・削除されたセッションはそちらを優先する
+                for key, session in dirty.items():
+                    if key not in self.__deleted:
+                        self.__dirty.setdefault(key, session)
+                for key in removed:
+                    if key not in self.__dirty:
+                        self.__deleted.add(key)
+                raise
+            logger.debug(f"Flushed {len(rows)} sessions, deleted {len(deleted)}")
+
+    async def close(self):
+        """
+        定期的な書き込みを止め、残っている変更を書き込んでからデータベースを閉じる
+        (書き込み中の場合は終わるまで待つ)
+        """
+        if self.__task is not None:
+            self.__stop.set()
+            await self.__task
+            self.__task = None
+        if self.__connection is not None:
+            await self.flush()
+            self.__connection.close()
+            self.__connection = None
@@ -0,0 +1,41 @@
+# クラスタのテスト用のワーカー
+
+# Coordinatorから起動され、ClusterClientでコーディネーターに接続する
+# 担当するシャードと受け取ったコマンドをファイルに書き出し、quitを受け取ったら終了する
+
+# 環境変数 (Coordinatorが設定するもの以外)
+# WORKER_OUTPUT : 書き出すファイルのディレクトリ
+# WORKER_DELAY : 接続するまで待つ時間 (秒)
+
+import asyncio
+import sys
+from os import environ
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cluster import ClusterClient
+
+
+async def main():
+    cluster_id = int(environ["CLUSTER_ID"])
+    output = Path(environ["WORKER_OUTPUT"]) / f"worker{cluster_id}.txt"
+    await asyncio.sleep(float(environ.get("WORKER_DELAY", 0)))
+
+    quit = asyncio.Event()
+
+    async def handler(command: str):
+        with output.open("a") as file:
+            file.write(f"{command}\n")
+        if command == "quit":
+            quit.set()
+
+    client = await ClusterClient.connect(environ["CLUSTER_SOCKET"], cluster_id, handler)
+    with output.open("a") as file:
+        file.write(f"shards={environ['SHARD_IDS']} count={environ['SHARDS']}\n")
+    await quit.wait()
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+# テストの共通設定
+
+# リポジトリのルートのモジュール (ito, session など) を読み込めるようにする
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class StubGuild:
+    """
+    discord.Guildのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+
+
+class StubChannel:
+    """
+    discord.TextChannelのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"channel{id}"
+
+
+class StubMember:
+    """
+    discord.Memberのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"player{id}"
@@ -0,0 +1,138 @@
+# ライブボードのテスト
+
+import asyncio
+from discord import Colour, NotFound
+from board import LiveBoard
+from conftest import StubChannel, StubGuild
+from ito import Ito
+from render import Renderer
+
+
+class FakeResponse:
+    """
+    NotFoundに渡すaiohttpのレスポンスのスタブ
+    """
+
+    status = 404
+    reason = "Not Found"
+
+
+class FakeMessage:
+    """
+    discord.Message / PartialMessageのスタブ
+    """
+
+    def __init__(self, channel: "FakeChannel", id: int):
+        self.channel = channel
+        self.id = id
+
+    async def edit(self, embed):
+        await asyncio.sleep(self.channel.latency)
+        if self.id in self.channel.deleted:
+            raise NotFound(FakeResponse(), "Unknown Message")
+        self.channel.log.append(("edit", self.id, embed.title))
+
+
+class FakeChannel:
+    """
+    PartialMessageableのスタブ
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.log: list[tuple[str, int, str]] = list()
+        self.deleted: set[int] = set()
+        # 編集にかかる時間 (秒)
+        self.latency = 0.0
+
+    async def send(self, embed) -> FakeMessage:
+        message = FakeMessage(self, len(self.log) + 1)
+        self.log.append(("send", message.id, embed.title))
+        return message
+
+    def get_partial_message(self, id: int) -> FakeMessage:
+        return FakeMessage(self, id)
+
+
+class FakeClient:
+    """
+    IDからチャンネルを作成するbotのスタブ
+    """
+
+    def __init__(self):
+        self.channels: dict[int, FakeChannel] = dict()
+
+    def get_partial_messageable(self, id: int) -> FakeChannel:
+        return self.channels.setdefault(id, FakeChannel(id))
+
+
+def make_board(delay: float) -> LiveBoard:
+    ito = Ito()
+    ito.set_guild(StubGuild(1))
+    ito.set_channel(StubChannel(10))
+    return LiveBoard(Renderer(ito), delay=delay)
+
+
+def update(board: LiveBoard, client: FakeClient, title: str):
+    board.update(client, 10, title, "説明", Colour.blue(), title)
+
+
+def test_batches_updates_and_edits_by_id():
+    async def scenario() -> list:
+        client = FakeClient()
+        board = make_board(60)
+        update(board, client, "1")
+        update(board, client, "2")
+        await board.flush()
+        update(board, client, "3")
+        await board.flush()
+        await board.close()
+        return client.channels[10].log
+
+    assert asyncio.run(scenario()) == [("send", 1, "2"), ("edit", 1, "3")]
+
+
+def test_close_flushes_pending_update():
+    async def scenario() -> list:
+        client = FakeClient()
+        board = make_board(60)
+        update(board, client, "1")
+        await board.close()
+        # 次の更新は新しいメッセージを送信する
+        update(board, client, "2")
+        await board.close()
+        return client.channels[10].log
+
+    assert asyncio.run(scenario()) == [("send", 1, "1"), ("send", 2, "2")]
+
+
+def test_resends_deleted_board():
+    async def scenario() -> list:
+        client = FakeClient()
+        board = make_board(60)
+        update(board, client, "1")
+        await board.flush()
+        client.channels[10].deleted.add(1)
+        update(board, client, "2")
+        await board.close()
+        return client.channels[10].log
+
+    assert asyncio.run(scenario()) == [("send", 1, "1"), ("send", 2, "2")]
+
+
+def test_close_during_edit_keeps_final_board():
+    async def scenario() -> list:
+        client = FakeClient()
+        board = make_board(0.01)
+        update(board, client, "1")
+        await board.flush()
+        channel = client.channels[10]
+        channel.latency = 0.2
+
+        # 更新をまとめるタスクが編集している途中で終了する
+        update(board, client, "2")
+        await asyncio.sleep(0.1)
+        await board.close()
+        return channel.log
+
+    assert asyncio.run(scenario()) == [("send", 1, "1"), ("edit", 1, "2")]
@@ -0,0 +1,118 @@
+# クラスタのテスト
+
+# 実際のUnixドメインソケットでCoordinatorとClusterClientを通信させる
+# ワーカーはcluster_worker.pyを別のプロセスで起動する
+
+import asyncio
+import sys
+from pathlib import Path
+import pytest
+from cluster import ClusterClient, Coordinator, shard_slice
+
+
+WORKER = str(Path(__file__).resolve().parent / "cluster_worker.py")
+
+# テストの待ち時間の上限 (秒)
+TIMEOUT = 30
+
+
+@pytest.mark.parametrize(
+    "clusters, shard_count",
+    [(1, 1), (1, 4), (2, 4), (3, 4), (3, 10), (4, 4)],
+)
+def test_shard_slice(clusters: int, shard_count: int):
+    slices = [shard_slice(i, clusters, shard_count) for i in range(clusters)]
+    # すべてのシャードをちょうど1つのワーカーが担当する
+    assert sorted(sum(slices, [])) == list(range(shard_count))
+    # シャードの数の差は1以下
+    sizes = [len(shard_ids) for shard_ids in slices]
+    assert max(sizes) - min(sizes) <= 1
+    assert all(sizes)
+
+
+def test_too_many_workers(tmp_path: Path):
+    with pytest.raises(ValueError):
+        Coordinator(str(tmp_path / "cluster.sock"), 3, 2)
+
+
+def read_output(tmp_path: Path, cluster_id: int) -> list[str]:
+    path = tmp_path / f"worker{cluster_id}.txt"
+    return path.read_text().splitlines() if path.exists() else []
+
+
+async def wait_for(condition, interval: float = 0.05):
+    while not condition():
+        await asyncio.sleep(interval)
+
+
+async def connect_admin(path: Path, received: list[str]) -> ClusterClient:
+    """
+    管理者コマンドを依頼するワーカーの代わりに接続する
+    """
+
+    async def handler(command: str):
+        received.append(command)
+
+    await wait_for(path.exists)
+    return await ClusterClient.connect(str(path), 99, handler)
+
+
+def run_cluster(tmp_path: Path, monkeypatch, workers: int, scenario):
+    """
+    ワーカーを起動し、scenarioを実行してからすべてのワーカーの終了を待つ
+
+    Returns
+    -------
+    returncodes: dict
+        キー : ワーカーの番号
+        値 : 終了コード
+    """
+    monkeypatch.setenv("WORKER_OUTPUT", str(tmp_path))
+    path = tmp_path / "cluster.sock"
+    coordinator = Coordinator(str(path), workers, 4, [sys.executable, WORKER])
+
+    async def main():
+        run = asyncio.create_task(coordinator.run())
+        await asyncio.wait_for(scenario(path), TIMEOUT)
+        return await asyncio.wait_for(run, TIMEOUT)
+
+    return asyncio.run(main())
+
+
+def test_broadcast_reaches_all_workers(tmp_path: Path, monkeypatch):
+    received: list[str] = list()
+
+    async def scenario(path: Path):
+        admin = await connect_admin(path, received)
+        # すべてのワーカーが接続するまで待つ
+        await wait_for(lambda: all(read_output(tmp_path, i) for i in range(2)))
+        await admin.broadcast("reload")
+        await admin.broadcast("quit")
+        # 依頼したワーカーにもコマンドが届く
+        await wait_for(lambda: received == ["reload", "quit"])
+        await admin.close()
+
+    returncodes = run_cluster(tmp_path, monkeypatch, 2, scenario)
+
+    assert returncodes == {0: 0, 1: 0}
+    assert read_output(tmp_path, 0) == ["shards=0,2 count=4", "reload", "quit"]
+    assert read_output(tmp_path, 1) == ["shards=1,3 count=4", "reload", "quit"]
+
+
+def test_quit_reaches_late_workers(tmp_path: Path, monkeypatch):
+    # ワーカーは停止の依頼より後に接続する
+    monkeypatch.setenv("WORKER_DELAY", "0.5")
+    received: list[str] = list()
+
+    async def scenario(path: Path):
+        admin = await connect_admin(path, received)
+        assert not any(read_output(tmp_path, i) for i in range(2))
+        await admin.broadcast("quit")
+        await wait_for(lambda: received == ["quit"])
+        await admin.close()
+
+    returncodes = run_cluster(tmp_path, monkeypatch, 2, scenario)
+
+    assert returncodes == {0: 0, 1: 0}
+    for cluster_id in range(2):
+        assert read_output(tmp_path, cluster_id)[-1] == "quit"
@@ -0,0 +1,64 @@
+# 並列送信のテスト
+
+import asyncio
+from fanout import fan_out
+
+
+class FakeDM:
+    """
+    DMの送信処理のスタブ
+    同時に実行されている送信の数を記録する
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.sent: list[int] = list()
+
+    def job(self, member_id: int, fail: bool = False):
+        async def send():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(0.01)
+                if fail:
+                    raise RuntimeError(f"Cannot send to {member_id}")
+                self.sent.append(member_id)
+            finally:
+                self.running -= 1
+
+        return send
+
+
+def test_limits_concurrency():
+    async def scenario():
+        dm = FakeDM()
+        jobs = {member_id: dm.job(member_id) for member_id in range(10)}
+        result = await fan_out(jobs, concurrency=3)
+        return dm, result
+
+    dm, result = asyncio.run(scenario())
+    assert dm.max_running == 3
+    assert sorted(dm.sent) == list(range(10))
+    assert sorted(result.get_succeeded()) == list(range(10))
+    assert result.is_all_succeeded()
+
+
+def test_failure_does_not_cancel_others():
+    async def scenario():
+        dm = FakeDM()
+        jobs = {
+            member_id: dm.job(member_id, fail=member_id == 2)
+            for member_id in range(5)
+        }
+        result = await fan_out(jobs, concurrency=2)
+        return dm, result
+
+    dm, result = asyncio.run(scenario())
+    assert sorted(dm.sent) == [0, 1, 3, 4]
+    assert sorted(result.get_succeeded()) == [0, 1, 3, 4]
+    assert not result.is_all_succeeded()
+
+    failed = result.get_failed()
+    assert list(failed) == [2]
+    assert isinstance(failed[2], RuntimeError)
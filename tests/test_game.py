@@ -0,0 +1,195 @@
+# ゲームエンジンのテスト
+
+# bitsetの手札の処理を、リストで手札を持っていたときの処理と比較する
+
+import random
+import pytest
+from engine.game import CARD_LIMIT, SEED_BITS, Game
+from engine.player import Player
+
+
+def list_has_smaller_card(hand: list[int], card_put: int) -> bool:
+    """
+    リストで手札を持っていたときのPlayer.has_smaller_card
+    """
+    if not hand:
+        return False
+    return not card_put < min(hand)
+
+
+def list_resolve_put(
+    hands: dict[int, list[int]], card_put: int
+) -> tuple[dict[int, list[int]], int]:
+    """
+    リストで手札を持っていたときの/putの処理
+    場に出されたカード以下のカードを1枚ずつ捨て、その数だけライフを減らす
+
+    Returns
+    -------
+    penalties: dict
+        プレイヤーごとの捨てたカード
+    life_lost: int
+    """
+    penalties: dict[int, list[int]] = dict()
+    life_lost = 0
+    for player_id, hand in hands.items():
+        while list_has_smaller_card(hand, card_put):
+            penalty = min(hand)
+            hand.remove(penalty)
+            penalties.setdefault(player_id, list()).append(penalty)
+            life_lost += 1
+    return penalties, life_lost
+
+
+def new_game(players: int, level: int, seed: int, card_max: int = 100) -> Game:
+    game = Game()
+    game.set_card_range(1, card_max)
+    game.set_level(level)
+    game.set_life(1000)
+    game.set_seed(seed)
+    for i in range(players):
+        game.add_player(i * 7 + 1, f"player{i}")
+    game.deal_cards()
+    game.start_game()
+    return game
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_has_smaller_card_matches_list(seed: int):
+    rng = random.Random(seed)
+    hand = rng.sample(range(1, 101), rng.randint(0, 5))
+    player = Player(1, "player")
+    player.receive_cards(hand)
+    for card_put in range(0, 102):
+        expected = list_has_smaller_card(hand, card_put)
+        assert player.has_smaller_card(card_put) == expected
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_has_smaller_card_with_ranks_matches_list(seed: int):
+    rng = random.Random(seed)
+    values = sorted(rng.sample(range(1, 101), 10))
+    hand = rng.sample(values, rng.randint(0, 5))
+    player = Player(1, "player")
+    player.set_values(values)
+    player.receive_cards(hand)
+    assert player.get_cards_in_hand() == sorted(hand)
+    for card_put in range(0, 102):
+        expected = list_has_smaller_card(hand, card_put)
+        assert player.has_smaller_card(card_put) == expected
+
+
+@pytest.mark.parametrize("card_max", [100, CARD_LIMIT])
+@pytest.mark.parametrize("seed", range(200))
+def test_resolve_put_matches_list(seed: int, card_max: int):
+    rng = random.Random(seed)
+    game = new_game(rng.randint(2, 10), rng.randint(1, 5), seed, card_max)
+    hands = {
+        player_id: player.get_cards_in_hand()
+        for player_id, player in game.get_players().items()
+    }
+    life = game.get_life()
+
+    while not game.is_cleared():
+        # ランダムなプレイヤーが手札の最小のカードを出す
+        player_id = rng.choice([id for id, hand in hands.items() if hand])
+        card_put = game.get_player(player_id).put_card()
+        assert card_put == min(hands[player_id])
+        hands[player_id].remove(card_put)
+
+        game.receive_card(card_put)
+        result = game.resolve_put(card_put)
+        penalties, life_lost = list_resolve_put(hands, card_put)
+        life -= life_lost
+
+        assert result.get_card() == card_put
+        assert result.get_penalties() == penalties
+        assert result.get_life_lost() == life_lost
+        assert game.get_life() == life
+        for id, hand in hands.items():
+            assert game.get_player(id).get_cards_in_hand() == sorted(hand)
+        assert game.is_cleared() == (not any(hands.values()))
+
+
+def test_resolve_put_orders_penalties_by_lowest_card():
+    game = Game()
+    game.add_player(1, "a")
+    game.add_player(2, "b")
+    # 配られたカードは3, 5, 8, 9 (順位0~3) で、3と5が場に出ていない
+    game.restore(
+        {
+            **game.to_snapshot(),
+            "cards": [3, 5, 8, 9],
+            "unplayed": f"{0b0011:x}",
+            "players": [[1, "a", f"{0b0110:x}", "2"], [2, "b", f"{0b1001:x}", "1"]],
+        }
+    )
+
+    result = game.resolve_put(7)
+
+    assert list(result.get_penalties()) == [2, 1]
+    assert result.get_penalties() == {1: [5], 2: [3]}
+    assert result.get_life_lost() == 2
+
+
+def test_restores_version_1_snapshot():
+    # 保存形式1はカードの値がビットの位置
+    game = Game()
+    snapshot = {
+        **game.to_snapshot(),
+        "v": 1,
+        "deck": f"{(1 << 3) | (1 << 5) | (1 << 8) | (1 << 9):x}",
+        "unplayed": f"{(1 << 3) | (1 << 5):x}",
+        "players": [
+            [1, "a", f"{(1 << 5) | (1 << 8):x}", f"{1 << 5:x}"],
+            [2, "b", f"{(1 << 3) | (1 << 9):x}", f"{1 << 3:x}"],
+        ],
+    }
+    del snapshot["cards"]
+    game.restore(snapshot)
+
+    assert game.get_deck() == {3: False, 5: False, 8: True, 9: True}
+    assert game.get_player(1).get_hand() == {5: True, 8: False}
+    assert game.is_minimun(3)
+    assert game.resolve_put(7).get_penalties() == {1: [5], 2: [3]}
+    assert game.to_snapshot()["cards"] == [3, 5, 8, 9]
+
+
+def test_large_card_range_keeps_bitsets_small():
+    game = new_game(4, 3, seed=1, card_max=CARD_LIMIT)
+    snapshot = game.to_snapshot()
+    assert int(snapshot["unplayed"], 16) == (1 << 12) - 1
+    assert sorted(game.get_deck()) == snapshot["cards"]
+    assert max(snapshot["cards"]) > 12
+
+
+def test_deal_cards_is_reproducible_with_seed():
+    first = new_game(4, 3, seed=12345)
+    second = new_game(4, 3, seed=first.get_game_seed())
+    assert first.to_snapshot()["players"] == second.to_snapshot()["players"]
+
+
+def test_game_seed_fits_in_discord_integer_option():
+    for _ in range(100):
+        game = new_game(2, 1, seed=None)
+        assert 0 <= game.get_game_seed() < 2**SEED_BITS <= 2**53
+
+
+def test_card_range_limit():
+    game = Game()
+    game.set_card_range(1, CARD_LIMIT)
+    assert game.get_card_range() == (1, CARD_LIMIT)
+    with pytest.raises(ValueError):
+        game.set_card_range(1, CARD_LIMIT + 1)
+    with pytest.raises(ValueError):
+        game.set_card_range(10, 9)
+
+
+def test_deal_cards_without_enough_cards():
+    game = Game()
+    game.set_card_range(1, 3)
+    game.set_level(2)
+    game.add_player(1, "a")
+    game.add_player(2, "b")
+    with pytest.raises(ValueError):
+        game.deal_cards()
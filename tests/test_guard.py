@@ -0,0 +1,93 @@
+# コマンドの実行条件のテスト
+
+import pytest
+import metrics
+from conftest import StubChannel, StubGuild, StubMember
+from guard import ERRORS, Guard, GuardPipeline
+from session import SessionManager
+
+
+@pytest.fixture
+def manager() -> SessionManager:
+    manager = SessionManager()
+    for channel_id in (10, 11):
+        ito = manager.get_or_create(1, channel_id).get_ito()
+        ito.set_guild(StubGuild(1))
+        ito.set_channel(StubChannel(channel_id))
+    return manager
+
+
+def join(manager: SessionManager, channel_id: int, member_id: int):
+    session = manager.get(1, channel_id)
+    session.get_ito().regist_player(StubMember(member_id))
+    manager.bind_member(member_id, session.get_key())
+
+
+def check(
+    pipeline: GuardPipeline,
+    manager: SessionManager,
+    guards: tuple[Guard, ...],
+    channel_id: int,
+    member_id: int,
+):
+    return pipeline.check(
+        "test",
+        guards,
+        manager.get(1, channel_id),
+        manager.get_member_session(member_id),
+        member_id,
+    )
+
+
+def test_passes_all_guards(manager: SessionManager):
+    pipeline = GuardPipeline()
+    join(manager, 10, 100)
+    guards = (Guard.CHANNEL, Guard.OFF_GAME, Guard.PLAYER)
+    assert check(pipeline, manager, guards, 10, 100) is None
+
+
+@pytest.mark.parametrize(
+    "guards, channel_id, ongoing, expected",
+    [
+        ((Guard.CHANNEL,), 11, False, Guard.CHANNEL),
+        ((Guard.IN_GAME,), 10, False, Guard.IN_GAME),
+        ((Guard.OFF_GAME,), 10, True, Guard.OFF_GAME),
+        ((Guard.PLAYER,), 11, False, Guard.PLAYER),
+        # 最初に満たさなかった条件のエラーになる
+        ((Guard.OFF_GAME, Guard.CHANNEL), 11, True, Guard.OFF_GAME),
+        ((Guard.CHANNEL, Guard.OFF_GAME), 11, True, Guard.CHANNEL),
+    ],
+)
+def test_rejects(manager: SessionManager, guards, channel_id, ongoing, expected):
+    pipeline = GuardPipeline()
+    join(manager, 10, 100)
+    if ongoing:
+        manager.get(1, channel_id).get_ito().start_game()
+
+    before = {guard: metrics.GUARD_CHECKS.get(guard.value) for guard in Guard}
+    rejected = metrics.COMMAND_REJECTIONS.get("test", expected.value)
+    embed = check(pipeline, manager, guards, channel_id, 100)
+
+    assert embed is not None
+    assert embed.title == "test command"
+    assert embed.description == ERRORS[expected]
+    assert metrics.COMMAND_REJECTIONS.get("test", expected.value) == rejected + 1
+    # 満たさなかった条件より後の条件は判定しない
+    checked = guards[: guards.index(expected) + 1]
+    for guard in Guard:
+        count = metrics.GUARD_CHECKS.get(guard.value) - before[guard]
+        assert count == (1 if guard in checked else 0)
+
+
+def test_channel_error_shows_joined_channel(manager: SessionManager):
+    pipeline = GuardPipeline()
+    join(manager, 10, 100)
+    embed = check(pipeline, manager, (Guard.CHANNEL,), 11, 100)
+    assert embed.fields[0].value == "channel10"
+
+
+def test_player_error_lists_players(manager: SessionManager):
+    pipeline = GuardPipeline()
+    join(manager, 10, 100)
+    embed = check(pipeline, manager, (Guard.PLAYER,), 10, 200)
+    assert "player100" in embed.fields[0].value
@@ -0,0 +1,229 @@
+# 引き継ぎのテスト
+
+import asyncio
+import pytest
+from discord import Colour
+import cog
+import handoff
+from conftest import StubChannel, StubGuild, StubMember
+from handoff import InFlight
+from store import SqliteStore
+
+
+class FakeMessage:
+    """
+    discord.Messageのスタブ
+    """
+
+    def __init__(self, channel: "FakeChannel", id: int):
+        self.channel = channel
+        self.id = id
+
+    async def edit(self, embed):
+        self.channel.log.append(("edit", self.id, embed.title))
+
+
+class FakeChannel(StubChannel):
+    """
+    送信したメッセージを記録するチャンネルのスタブ
+    """
+
+    def __init__(self, id: int):
+        super().__init__(id)
+        self.log: list[tuple[str, int, str]] = list()
+
+    async def send(self, embed) -> FakeMessage:
+        message = FakeMessage(self, len(self.log) + 1)
+        self.log.append(("send", message.id, embed.title))
+        return message
+
+    def get_partial_message(self, id: int) -> FakeMessage:
+        return FakeMessage(self, id)
+
+
+class FakeGuild(StubGuild):
+    """
+    メンバーとチャンネルを返すサーバーのスタブ
+    """
+
+    def __init__(self, id: int):
+        super().__init__(id)
+        self.channels: dict[int, FakeChannel] = dict()
+
+    def get_member(self, id: int) -> StubMember:
+        return StubMember(id)
+
+    def get_channel(self, id: int) -> FakeChannel:
+        return self.channels.setdefault(id, FakeChannel(id))
+
+
+class FakeBot:
+    """
+    commands.Botのスタブ
+    """
+
+    shard_count = 1
+
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+
+    def get_guild(self, id: int) -> FakeGuild | None:
+        return self.guild if id == self.guild.id else None
+
+    def get_partial_messageable(self, id: int) -> FakeChannel:
+        return self.guild.get_channel(id)
+
+
+class FakeContext:
+    """
+    commands.Contextのスタブ (テキストコマンドとして実行する)
+    """
+
+    def __init__(self, guild: FakeGuild, channel_id: int, author_id: int):
+        self.guild = guild
+        self.channel = guild.get_channel(channel_id)
+        self.author = StubMember(author_id)
+        self.interaction = None
+        self.sent: list[str] = list()
+
+    async def send(self, content=None, *, embed=None, ephemeral=False):
+        self.sent.append(embed.description if embed is not None else content)
+
+
+@pytest.fixture
+def sqlite(monkeypatch, tmp_path):
+    monkeypatch.setattr(cog, "STORE", "sqlite")
+    monkeypatch.setattr(cog, "STORE_PATH", str(tmp_path / "ito.sqlite3"))
+    # 前のテストで書き出されたデータを残さない
+    handoff.take()
+    yield str(tmp_path / "ito.sqlite3")
+    handoff.take()
+
+
+async def start_cog(bot: FakeBot) -> cog.MyCog:
+    my_cog = cog.MyCog(bot)
+    await my_cog.cog_load()
+    await my_cog.loading
+    return my_cog
+
+
+async def entry(my_cog: cog.MyCog, ctx: FakeContext):
+    await cog.MyCog.entry.callback(my_cog, ctx)
+
+
+def test_drain_waits_for_commands_in_flight():
+    async def scenario():
+        in_flight = InFlight()
+        finish = asyncio.Event()
+
+        async def command():
+            with in_flight.track():
+                await finish.wait()
+
+        task = asyncio.create_task(command())
+        await asyncio.sleep(0)
+        assert in_flight.get_count() == 1
+
+        drain = asyncio.create_task(in_flight.drain(5))
+        await asyncio.sleep(0.01)
+        assert in_flight.is_draining()
+        assert not drain.done()
+
+        finish.set()
+        await task
+        assert await drain == 0
+
+        in_flight.resume()
+        assert not in_flight.is_draining()
+
+    asyncio.run(scenario())
+
+
+def test_drain_returns_commands_still_running():
+    async def scenario() -> int:
+        in_flight = InFlight()
+        with in_flight.track():
+            return await in_flight.drain(0.01)
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_rejects_commands_while_draining(sqlite):
+    async def scenario():
+        guild = FakeGuild(1)
+        my_cog = await start_cog(FakeBot(guild))
+        try:
+            with my_cog.in_flight.track():
+                drain = asyncio.create_task(my_cog.in_flight.drain(5))
+                await asyncio.sleep(0)
+
+                ctx = FakeContext(guild, 10, 100)
+                await entry(my_cog, ctx)
+                assert ctx.sent == [cog.RESTARTING]
+                assert my_cog.sessions.get_member_session(100) is None
+            assert await drain == 0
+
+            # リロードを中止した場合は受付を再開する
+            my_cog.in_flight.resume()
+            await entry(my_cog, ctx)
+            assert my_cog.sessions.get_member_session(100) is not None
+        finally:
+            await my_cog.cog_unload()
+
+    asyncio.run(scenario())
+
+
+def test_sessions_survive_reload(sqlite):
+    async def scenario():
+        guild = FakeGuild(1)
+        bot = FakeBot(guild)
+        old = await start_cog(bot)
+
+        # 実行中のゲーム
+        await entry(old, FakeContext(guild, 10, 100))
+        session = old.sessions.get(1, 10)
+        ito = session.get_ito()
+
+        # メモリから破棄されて、まだ復元していないゲーム
+        await entry(old, FakeContext(guild, 20, 200))
+        evicted = old.sessions.remove((1, 20))
+        old.evict_session(evicted)
+
+        # 盤面のメッセージにまだ反映していない更新
+        board = session.get_board(60)
+        board.update(bot, 10, "Put command", "説明", Colour.green(), "1")
+
+        await old.prepare_unload()
+        await old.cog_unload()
+        # 引き継ぐ前に盤面の更新を反映する
+        assert guild.get_channel(10).log[-1] == ("send", 1, "Put command")
+
+        new = await start_cog(bot)
+        try:
+            # 同じItoをディスクから読み直さずに使う
+            adopted = new.sessions.get(1, 10)
+            assert adopted.get_ito() is ito
+            assert new.sessions.get_member_session(100) is adopted
+            # 盤面のメッセージは引き継がない (次の/putで新しく送信する)
+            assert not adopted.has_board()
+
+            assert list(new.pending) == [(1, 20)]
+            assert new.pending_members == {200: (1, 20)}
+
+            # 古いCogが終了するときに保存している
+            store = SqliteStore(sqlite)
+            store.open()
+            saved = await store.load_all()
+            await store.close()
+            assert set(saved) == {(1, 10), (1, 20)}
+
+            # まだ復元していないゲームは最初のコマンドで復元する
+            ctx = FakeContext(guild, 20, 200)
+            await entry(new, ctx)
+            restored = new.sessions.get_member_session(200)
+            assert restored.get_key() == (1, 20)
+            assert new.pending == {}
+        finally:
+            await new.cog_unload()
+
+    asyncio.run(scenario())
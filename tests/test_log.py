@@ -0,0 +1,67 @@
+# ロガーの設定のテスト
+
+import logging
+import sys
+import pytest
+from loguru import logger
+import log
+from engine.game import Game
+
+
+@pytest.fixture
+def setup(monkeypatch, capsys):
+    """
+    log.setup()を呼び出し、テストの後に標準のloggingとloguruの設定を戻す
+    """
+
+    def setup(level: str) -> str:
+        monkeypatch.setenv("LOG_LEVEL", level)
+        monkeypatch.setenv("LOG_FORMAT", "json")
+        monkeypatch.delenv("LOG_FILE", raising=False)
+        monkeypatch.delenv("DISCORD_LOG_LEVEL", raising=False)
+        log.setup()
+
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield setup
+    logger.remove()
+    logger.add(sys.stderr)
+    root.handlers[:] = handlers
+    root.setLevel(level)
+    logging.getLogger("discord").setLevel(logging.NOTSET)
+
+
+def output(capsys) -> str:
+    logger.complete()
+    return capsys.readouterr().out
+
+
+def test_engine_debug_reaches_sink(setup, capsys):
+    setup("DEBUG")
+    game = Game()
+    game.add_player(1, "player1")
+    game.deal_cards()
+
+    assert logging.getLogger("engine.game").isEnabledFor(logging.DEBUG)
+    assert "Cards dealt" in output(capsys)
+    # discord.pyのログはDISCORD_LOG_LEVELのまま
+    assert not logging.getLogger("discord").isEnabledFor(logging.DEBUG)
+
+
+def test_engine_debug_is_dropped_at_info(setup, capsys):
+    setup("INFO")
+    logging.getLogger("engine.game").debug("Cards dealt")
+    logging.getLogger("engine.game").info("Game clear")
+
+    text = output(capsys)
+    assert "Cards dealt" not in text
+    assert "Game clear" in text
+
+
+def test_sampled_debug(setup, capsys):
+    setup("DEBUG")
+    for index in range(10):
+        logger.bind(sample=5).debug(f"command {index}")
+
+    text = output(capsys)
+    assert [f"command {index}" in text for index in range(10)].count(True) == 2
@@ -0,0 +1,50 @@
+# メトリクスのテスト
+
+import asyncio
+import logging
+import pytest
+import metrics
+from metrics import RateLimitHandler
+
+ROUTE = "We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds."
+GLOBAL = "Global rate limit has been hit. Retrying in %.2f seconds."
+
+
+def log(handler: RateLimitHandler, message: str):
+    record = logging.LogRecord(
+        "discord.http", logging.WARNING, __file__, 0, message, None, None
+    )
+    handler.handle(record)
+
+
+def counts() -> tuple[float, float]:
+    return metrics.RATE_LIMITS.get("route"), metrics.RATE_LIMITS.get("global")
+
+
+@pytest.mark.parametrize(
+    "messages, expected",
+    [
+        ([ROUTE], (1, 0)),
+        # グローバルの制限はglobalだけを数える
+        ([ROUTE, GLOBAL], (0, 1)),
+        ([ROUTE, ROUTE, GLOBAL], (1, 1)),
+        ([ROUTE, GLOBAL, ROUTE], (1, 1)),
+    ],
+)
+def test_counts_rate_limits_by_scope(messages, expected):
+    async def scenario():
+        handler = RateLimitHandler(logging.WARNING)
+        for message in messages:
+            log(handler, message)
+        await asyncio.sleep(0)
+
+    route, global_ = counts()
+    asyncio.run(scenario())
+    after = counts()
+    assert (after[0] - route, after[1] - global_) == expected
+
+
+def test_counts_route_outside_event_loop():
+    route, global_ = counts()
+    log(RateLimitHandler(logging.WARNING), ROUTE)
+    assert counts() == (route + 1, global_)
@@ -0,0 +1,162 @@
+# セッション管理のテスト
+
+import asyncio
+import pytest
+import session as session_module
+from conftest import StubMember
+from ito import Ito
+from session import SessionManager
+
+
+class Clock:
+    """
+    time.monotonicの代わりに使う時計
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(session_module, "monotonic", clock)
+    return clock
+
+
+def test_get_or_create_returns_same_session():
+    manager = SessionManager()
+    session = manager.get_or_create(1, 10)
+    assert manager.get_or_create(1, 10) is session
+    assert manager.get(1, 10) is session
+    assert manager.get(1, 11) is None
+    assert len(manager) == 1
+
+
+def test_evicts_least_recently_used(clock: Clock):
+    evicted = list()
+    manager = SessionManager(max_sessions=2, on_evict=evicted.append)
+    first = manager.get_or_create(1, 10)
+    second = manager.get_or_create(1, 11)
+    # (1, 10) を使ったので、次に古いのは (1, 11)
+    manager.get(1, 10)
+    manager.get_or_create(1, 12)
+
+    assert evicted == [second]
+    assert manager.get(1, 11) is None
+    assert manager.get(1, 10) is first
+    assert len(manager) == 2
+
+
+def test_evicts_idle_sessions(clock: Clock):
+    evicted = list()
+    manager = SessionManager(ttl=60, on_evict=evicted.append)
+    manager.get_or_create(1, 10)
+    clock.now += 30
+    manager.get_or_create(1, 11)
+    clock.now += 40
+
+    # (1, 10) は70秒、(1, 11) は40秒使われていない
+    assert manager.evict() == [(1, 10)]
+    assert [session.get_key() for session in evicted] == [(1, 10)]
+    assert [session.get_key() for session in manager.get_sessions()] == [(1, 11)]
+
+
+def test_does_not_evict_busy_sessions(clock: Clock):
+    async def scenario():
+        evicted = list()
+        manager = SessionManager(ttl=60, on_evict=evicted.append)
+        busy = manager.get_or_create(1, 10)
+        idle = manager.get_or_create(1, 11)
+        clock.now += 120
+
+        async with busy.serialize():
+            assert busy.is_busy()
+            assert manager.evict() == [(1, 11)]
+        assert evicted == [idle]
+        assert manager.get_sessions() == [busy]
+
+        # コマンドが終わった後は破棄される
+        assert not busy.is_busy()
+        assert manager.evict() == [(1, 10)]
+
+    asyncio.run(scenario())
+
+
+def test_remove_does_not_call_on_evict():
+    evicted = list()
+    manager = SessionManager(on_evict=evicted.append)
+    session = manager.get_or_create(1, 10)
+
+    assert manager.remove((1, 10)) is session
+    assert manager.remove((1, 10)) is None
+    assert evicted == []
+
+
+def test_member_index():
+    manager = SessionManager()
+    first = manager.get_or_create(1, 10)
+    second = manager.get_or_create(1, 11)
+
+    manager.bind_member(100, first.get_key())
+    assert manager.get_member_session(100) is first
+    manager.bind_member(100, second.get_key())
+    assert manager.get_member_session(100) is second
+    manager.unbind_member(100)
+    assert manager.get_member_session(100) is None
+    # 登録していないプレイヤーの解除は何もしない
+    manager.unbind_member(200)
+
+
+def test_remove_unbinds_only_own_members():
+    manager = SessionManager(max_sessions=2)
+    session = manager.get_or_create(1, 10)
+    other = manager.get_or_create(1, 99)
+    ito = session.get_ito()
+    for member_id in (100, 101):
+        ito.regist_player(StubMember(member_id))
+        manager.bind_member(member_id, session.get_key())
+    # 101は別のセッションに移った
+    manager.bind_member(101, other.get_key())
+
+    # 上限を超えたので、最も古い (1, 10) が破棄される
+    manager.get_or_create(1, 11)
+
+    assert manager.get(1, 10) is None
+    assert manager.get_member_session(100) is None
+    assert manager.get_member_session(101) is other
+    manager.bind_member(102, (1, 11))
+    assert manager.get_member_session(102) is manager.get(1, 11)
+
+
+def test_adopt_binds_players():
+    manager = SessionManager()
+    ito = Ito()
+    for member_id in (100, 101):
+        ito.regist_player(StubMember(member_id))
+    adopted = manager.adopt((1, 11), ito)
+
+    assert adopted.get_ito() is ito
+    assert manager.get_member_session(100) is adopted
+    assert manager.get_member_session(101) is adopted
+
+
+def test_adopt_rejects_players_in_another_session():
+    manager = SessionManager()
+    other = manager.get_or_create(1, 10)
+    other.get_ito().regist_player(StubMember(100))
+    manager.bind_member(100, other.get_key())
+
+    ito = Ito()
+    for member_id in (100, 101):
+        ito.regist_player(StubMember(member_id))
+    with pytest.raises(ValueError):
+        manager.adopt((1, 11), ito)
+
+    # 1人のプレイヤーは1つのゲームにだけ参加している
+    assert manager.get(1, 11) is None
+    assert manager.get_member_session(100) is other
+    assert manager.get_member_session(101) is None
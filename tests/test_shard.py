@@ -0,0 +1,79 @@
+# シャードごとのセッション管理のテスト
+
+import pytest
+from conftest import StubMember
+from ito import Ito
+from session import SessionManager
+from shard import ShardedSessions
+
+
+# シャード0とシャード1が担当するサーバー
+GUILD_0 = 0
+GUILD_1 = 1 << 22
+
+
+def make_sessions() -> ShardedSessions:
+    return ShardedSessions(lambda: 2)
+
+
+def test_member_lookup_uses_bound_shard(monkeypatch):
+    sessions = make_sessions()
+    first = sessions.get_or_create(GUILD_0, 10)
+    second = sessions.get_or_create(GUILD_1, 10)
+    assert sessions.get_shard_id(first.get_key()) == 0
+    assert sessions.get_shard_id(second.get_key()) == 1
+
+    calls = list()
+    lookup = SessionManager.get_member_session
+
+    def spy(manager: SessionManager, member_id: int):
+        calls.append(manager)
+        return lookup(manager, member_id)
+
+    monkeypatch.setattr(SessionManager, "get_member_session", spy)
+
+    sessions.bind_member(100, second.get_key())
+    assert sessions.get_member_session(100) is second
+    # 登録されたキーのシャードだけを探す
+    assert calls == [sessions.get_manager(1)]
+
+    sessions.bind_member(100, first.get_key())
+    assert sessions.get_member_session(100) is first
+    sessions.unbind_member(100)
+    assert sessions.get_member_session(100) is None
+    assert sessions.get_member_session(200) is None
+    assert len(calls) == 2
+
+
+def test_remove_unbinds_members_across_shards():
+    sessions = make_sessions()
+    session = sessions.get_or_create(GUILD_1, 10)
+    session.get_ito().regist_player(StubMember(100))
+    sessions.bind_member(100, session.get_key())
+
+    sessions.remove(session.get_key())
+    assert sessions.get_member_session(100) is None
+
+
+def test_adopt_rejects_players_in_another_shard():
+    sessions = make_sessions()
+    other = sessions.get_or_create(GUILD_0, 10)
+    other.get_ito().regist_player(StubMember(100))
+    sessions.bind_member(100, other.get_key())
+
+    ito = Ito()
+    for member_id in (100, 101):
+        ito.regist_player(StubMember(member_id))
+    with pytest.raises(ValueError):
+        sessions.adopt((GUILD_1, 10), ito)
+
+    # 1人のプレイヤーは1つのゲームにだけ参加している
+    assert sessions.get(GUILD_1, 10) is None
+    assert sessions.get_member_session(100) is other
+    assert sessions.get_member_session(101) is None
+
+    # 元のセッションが終わった後は復元できる
+    sessions.remove(other.get_key())
+    adopted = sessions.adopt((GUILD_1, 10), ito)
+    assert sessions.get_member_session(100) is adopted
+    assert sessions.get_member_session(101) is adopted
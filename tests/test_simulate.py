@@ -0,0 +1,35 @@
+# 勝率シミュレーターのテスト
+
+import numpy as np
+import pytest
+from engine.game import CARD_LIMIT
+from engine.simulate import deal, simulate
+
+
+@pytest.mark.parametrize("k, size", [(1, 1), (3, 3), (12, 100), (12, 10_000_000)])
+def test_deal_without_duplicates(k: int, size: int):
+    cards = deal(np.random.default_rng(0), 1000, k, size)
+    assert cards.shape == (1000, k)
+    assert cards.min() >= 0 and cards.max() < size
+    assert all(len(set(row)) == k for row in cards.tolist())
+
+
+def test_deal_is_uniform():
+    cards = deal(np.random.default_rng(0), 60000, 2, 6)
+    # カードごと・位置ごとの出現回数が均等 (期待値 20000 / 10000)
+    counts = np.bincount(cards.ravel(), minlength=6)
+    assert np.all(np.abs(counts - 20000) < 600)
+    counts = np.bincount(cards[:, 0], minlength=6)
+    assert np.all(np.abs(counts - 10000) < 500)
+
+
+def test_perfect_play_always_wins():
+    results = simulate([3], [2], [1], games=1000, error="perfect", workers=1, seed=0)
+    assert results[0]["win_rate"] == 1.0
+
+
+def test_large_card_range():
+    results = simulate(
+        [4], [3], [3], games=20000, card_range=(1, CARD_LIMIT), workers=1, seed=0
+    )
+    assert 0.99 < results[0]["win_rate"]
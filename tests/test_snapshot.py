@@ -0,0 +1,100 @@
+# 保存・復元のテスト
+
+from conftest import StubChannel, StubGuild, StubMember
+from engine.game import Game
+from ito import Ito
+
+
+def play(game: Game) -> Game:
+    """
+    何枚かカードを出した途中のゲームにする
+    """
+    game.set_level(3)
+    game.set_theme("好きな食べ物")
+    game.set_seed(777)
+    game.deal_cards()
+    game.start_game()
+
+    for player in list(game.get_players().values())[:2]:
+        card = player.put_card()
+        game.receive_card(card)
+        game.resolve_put(card)
+    return game
+
+
+def played_game() -> Ito:
+    ito = Ito()
+    ito.set_guild(StubGuild(10))
+    ito.set_channel(StubChannel(20))
+    for i in range(4):
+        ito.regist_player(StubMember(100 + i))
+    return play(ito)
+
+
+def test_game_round_trip():
+    game = Game()
+    for i in range(4):
+        game.add_player(100 + i, f"player{i}")
+    play(game)
+    snapshot = game.to_snapshot()
+
+    restored = Game()
+    restored.restore(snapshot)
+
+    assert restored.to_snapshot() == snapshot
+    assert restored.get_life() == game.get_life()
+    assert restored.get_deck() == game.get_deck()
+    assert restored.is_ongoing()
+    for player_id, player in game.get_players().items():
+        restored_player = restored.get_player(player_id)
+        assert restored_player.get_name() == player.get_name()
+        assert restored_player.get_hand() == player.get_hand()
+        assert restored_player.get_cards_in_hand() == player.get_cards_in_hand()
+
+
+def test_ito_round_trip():
+    ito = played_game()
+    snapshot = ito.to_snapshot()
+    player_ids = set(ito.get_players())
+
+    restored = Ito()
+    restored.restore(snapshot, StubGuild(10), StubChannel(20), player_ids)
+
+    assert restored.to_snapshot() == snapshot
+    assert restored.get_guild_id() == 10
+    assert restored.get_channel_id() == 20
+    assert restored.get_channel_name() == "channel20"
+    assert restored.get_theme() == "好きな食べ物"
+    assert restored.get_seed() == 777
+    # 復元したゲームの続きを遊べる
+    for card in sorted(
+        card
+        for player in restored.get_players().values()
+        for card in player.get_cards_in_hand()
+    ):
+        assert restored.is_minimun(card)
+        restored.receive_card(card)
+    assert restored.is_cleared()
+
+
+def test_ito_restore_drops_missing_players():
+    ito = played_game()
+    snapshot = ito.to_snapshot()
+    missing = 100
+    kept = set(ito.get_players()) - {missing}
+
+    restored = Ito()
+    restored.restore(snapshot, StubGuild(10), StubChannel(20), kept)
+
+    assert set(restored.get_players()) == kept
+    # 見つからなかったプレイヤーのカードは場に出たことになる
+    missing_cards = ito.get_player(missing).get_cards_in_hand()
+    for card in missing_cards:
+        assert not restored.is_minimun(card)
+    remaining = sorted(
+        card
+        for player in restored.get_players().values()
+        for card in player.get_cards_in_hand()
+    )
+    if remaining:
+        assert restored.is_minimun(remaining[0])
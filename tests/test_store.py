@@ -0,0 +1,126 @@
+# 保存クラスのテスト
+
+import asyncio
+import sqlite3
+import pytest
+from conftest import StubChannel, StubGuild, StubMember
+from ito import Ito
+from session import Session
+from store import SqliteStore, decode
+
+
+def make_session(channel_id: int, level: int = 1) -> Session:
+    ito = Ito()
+    ito.set_guild(StubGuild(1))
+    ito.set_channel(StubChannel(channel_id))
+    ito.regist_player(StubMember(100 + channel_id))
+    ito.set_level(level)
+    return Session((1, channel_id), ito)
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / "ito.sqlite3")
+
+
+def load(path: str) -> dict:
+    async def scenario() -> dict:
+        store = SqliteStore(path)
+        store.open()
+        try:
+            return await store.load_all()
+        finally:
+            await store.close()
+
+    return {key: decode(data)["level"] for key, data in asyncio.run(scenario()).items()}
+
+
+def test_flush_and_reload(path: str):
+    async def scenario():
+        store = SqliteStore(path)
+        store.open()
+        store.mark_dirty(make_session(10, level=2))
+        store.mark_dirty(make_session(11, level=3))
+        await store.flush()
+        await store.close()
+
+    asyncio.run(scenario())
+    assert load(path) == {(1, 10): 2, (1, 11): 3}
+
+
+def test_delete(path: str):
+    async def scenario():
+        store = SqliteStore(path)
+        store.open()
+        store.mark_dirty(make_session(10))
+        store.mark_dirty(make_session(11))
+        await store.flush()
+        store.delete((1, 10))
+        # 削除の前に変更を記録しても削除される
+        store.mark_dirty(make_session(11))
+        store.delete((1, 11))
+        await store.close()
+
+    asyncio.run(scenario())
+    assert load(path) == {}
+
+
+def test_failed_write_is_retried(path: str):
+    async def scenario():
+        store = SqliteStore(path)
+        store.open()
+        store.mark_dirty(make_session(10))
+        await store.flush()
+        store.mark_dirty(make_session(11, level=4))
+        store.delete((1, 10))
+
+        # 別の接続でテーブルを削除して書き込みを失敗させる
+        other = sqlite3.connect(path)
+        other.execute("DROP TABLE sessions")
+        other.commit()
+        with pytest.raises(sqlite3.OperationalError):
+            await store.flush()
+
+        # テーブルを戻すと、失敗した変更が書き込まれる
+        other.execute(
+            "CREATE TABLE sessions"
+            " (key TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        other.commit()
+        other.close()
+        await store.close()
+
+    asyncio.run(scenario())
+    assert load(path) == {(1, 11): 4}
+
+
+def test_close_waits_for_running_write(path: str):
+    async def scenario():
+        store = SqliteStore(path, interval=0.01)
+        store.open()
+        store.start()
+
+        # 別の接続でロックを取り、定期的な書き込みを待たせる
+        other = sqlite3.connect(path)
+        other.execute("BEGIN EXCLUSIVE")
+        store.mark_dirty(make_session(10, level=5))
+        await asyncio.sleep(0.1)
+
+        asyncio.get_running_loop().call_later(0.1, other.commit)
+        await store.close()
+        other.close()
+
+    asyncio.run(scenario())
+    assert load(path) == {(1, 10): 5}
+
+
+def test_close_flushes_before_interval(path: str):
+    async def scenario():
+        store = SqliteStore(path, interval=60)
+        store.open()
+        store.start()
+        store.mark_dirty(make_session(10, level=2))
+        await store.close()
+
+    asyncio.run(scenario())
+    assert load(path) == {(1, 10): 2}